@@ -15,15 +15,38 @@ Created on Wed Aug 28 17:30:30 2024
 #fonte de dados (compilados e padronizados) com a localização das estações de monitoramento no BR:
 #https://onedrive.live.com/?id=5BFEEDBF4F33F40C%21194731&cid=5BFEEDBF4F33F40C
 
+#todas as camadas no mesmo CRS de área igual (geodesy.WORK_CRS), transformadas
+#uma vez na leitura com geodesy.to_work_crs; contrato de CRS em geodesy.py
+
 #importanto bibliotecas
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import geopandas as gpd
+import shapely
 import matplotlib.pyplot as plt
 import seaborn as sns
 from shapely.ops import unary_union
+import geocache
+import geodesy
+import instrument
+import inventoryDelta
 
 
-def aqs_sm_plot(gdf_BR, gdf_var, column, cmap='coolwarm_r'):
+def _show_or_save(fig, output, dpi):
+    """
+    Mostra a figura (modo interativo) ou grava em arquivo e a fecha (modo em lote).
+    """
+    
+    if output is None:
+        plt.show()
+    else:
+        fig.savefig(output, dpi=dpi, bbox_inches='tight')
+        plt.close(fig)
+
+
+def aqs_sm_plot(gdf_BR, gdf_var, column, cmap='coolwarm_r', output=None, dpi=200):
     """
     Função para plotar um mapa com as estações de monitoramento do Brasil.
     
@@ -32,6 +55,8 @@ def aqs_sm_plot(gdf_BR, gdf_var, column, cmap='coolwarm_r'):
     - gdf_var: GeoDataFrame contendo as estações de monitoramento geolocalizadas.
     - column: Nome da coluna do gdf_var a ser usada para a coloração do mapa.
     - cmap: Colormap para personalizar a visualização (padrão: 'coolwarm_r').
+    - output: Arquivo da figura (padrão None: mostra a figura com plt.show()).
+    - dpi: Resolução da figura gravada em output (padrão 200).
     """    
     
     plt.figure(figsize=(8,6))
@@ -41,10 +66,10 @@ def aqs_sm_plot(gdf_BR, gdf_var, column, cmap='coolwarm_r'):
                  legend_kwds={'fontsize': 6, 'frameon': False,
                               'loc': 'lower left', 'bbox_to_anchor': (.13, .35)})
     plt.axis('off')
-    plt.show()
+    _show_or_save(plt.gcf(), output, dpi)
     
 
-def aqs_mm_plot(gdf_BR, gdf_vars, columns_cmap):
+def aqs_mm_plot(gdf_BR, gdf_vars, columns_cmap, output=None, dpi=200):
     """
     Função para plotar subplots com múltiplas colunas.
         *pode ser adotada para plotar mapas com o tipo ou status da estação*
@@ -54,6 +79,8 @@ def aqs_mm_plot(gdf_BR, gdf_vars, columns_cmap):
     - gdf_vars: GeoDataFrame com as estações de monitoramento geolocalizadas.
     - columns_cmap: Dicionário onde as chaves são as colunas a serem plotadas 
     e os valores são os colormaps correspondentes.
+    - output: Arquivo da figura (padrão None: mostra a figura com plt.show()).
+    - dpi: Resolução da figura gravada em output (padrão 200).
     """
 
     num_cols = len(columns_cmap)
@@ -81,7 +108,145 @@ def aqs_mm_plot(gdf_BR, gdf_vars, columns_cmap):
         fig.delaxes(axs[j])
 
     plt.tight_layout()
-    plt.show()
+    _show_or_save(fig, output, dpi)
+
+
+def _zoom_tolerance(bounds, pixels):
+    """
+    Tolerância de simplificação para um nível de zoom: o tamanho de um pixel da
+    figura (extensão do mapa / número de pixels), arredondado para 2 algarismos.
+    """
+    
+    size = max(bounds[2] - bounds[0], bounds[3] - bounds[1]) / pixels
+    if size <= 0:
+        return 0
+    return float('%.2g' % size)
+
+
+def simplified_base(gdf_base, tolerance, cache_dir=None):
+    """
+    Função para obter a camada base dos mapas simplificada para um nível de zoom.
+
+    Cada polígono é simplificado mantendo a topologia (preserve_topology=True) e
+    o resultado é guardado no cache de geometrias (geocache, memória e GeoParquet)
+    com uma chave calculada a partir do conteúdo da camada e da tolerância, então
+    cada nível de zoom é simplificado uma única vez.
+
+    Parâmetros:
+    - gdf_base: GeoDataFrame com a camada base (ex: Brasil ou estados).
+    - tolerance: Tolerância da simplificação, nas unidades do CRS (0 ou None: sem simplificar).
+    - cache_dir: Pasta do cache em GeoParquet (padrão None: geocache.CACHE_DIR).
+
+    Retorna:
+    - GeoDataFrame só com a geometria simplificada.
+    """
+    
+    if not tolerance:
+        return gdf_base
+    
+    def build():
+        geoms = shapely.simplify(gdf_base.geometry.to_numpy(), tolerance, preserve_topology=True)
+        return gpd.GeoDataFrame(geometry=geoms, crs=gdf_base.crs)
+    
+    return geocache.cached('base_simplificada', [geocache.gdf_hash(gdf_base), tolerance],
+                           build, cache_dir)
+
+
+def _agg_backend():
+    # Backend sem interface gráfica nos processos de renderização
+    plt.switch_backend('Agg')
+
+
+def _render_map(task):
+    """
+    Renderiza uma figura do aqs_batch_plot (aqs_sm_plot ou aqs_mm_plot) em arquivo.
+    """
+    
+    kind, base, data, spec, output, dpi = task
+    if kind == 'sm':
+        aqs_sm_plot(base, data, spec[0], spec[1], output=output, dpi=dpi)
+    else:
+        aqs_mm_plot(base, data, spec, output=output, dpi=dpi)
+    return output
+
+
+@instrument.timed()
+def aqs_batch_plot(gdf_BR, gdf_var, columns_cmap, output_dir, gdf_states=None,
+                   column='HASC_1', workers=None, dpi=200, fmt='png', cache_dir=None):
+    """
+    Função para gerar em lote (sem sessão interativa) os mapas do relatório.
+
+    As figuras são gravadas em arquivo em vez de plt.show(). A camada base é
+    simplificada uma vez por nível de zoom (simplified_base, com tolerância de
+    um pixel da figura) e reaproveitada por todas as figuras desse nível. As
+    figuras são renderizadas com o backend Agg (sem janelas), no processo atual
+    ou, com workers, em paralelo em processos separados. No processo atual o
+    backend anterior é restaurado no final (a troca de backend fecha as figuras
+    abertas).
+
+    Figuras geradas em output_dir:
+    - mapa_<coluna>.<fmt>: um mapa do Brasil por coluna (aqs_sm_plot).
+    - mapa_colunas.<fmt>: as colunas em subplots (aqs_mm_plot), se forem até 2.
+    - mapa_<estado>_<coluna>.<fmt>: com gdf_states, um mapa por estado e coluna,
+      com as estações dentro do estado.
+
+    Parâmetros:
+    - gdf_BR: GeoDataFrame com a geometria do Brasil (camada base).
+    - gdf_var: GeoDataFrame com as estações de monitoramento geolocalizadas.
+    - columns_cmap: Dicionário coluna -> colormap, como no aqs_mm_plot.
+    - output_dir: Pasta das figuras.
+    - gdf_states: GeoDataFrame com os estados (padrão None: só mapas do Brasil).
+    - column: Coluna com o nome do estado (padrão 'HASC_1').
+    - workers: Número de processos (padrão None: renderiza no processo atual).
+    - dpi: Resolução das figuras (padrão 200).
+    - fmt: Formato das figuras (padrão 'png').
+    - cache_dir: Pasta do cache em GeoParquet (padrão None: geocache.CACHE_DIR).
+
+    Retorna:
+    - Lista com os caminhos das figuras gravadas.
+    """
+    
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # Camada base do Brasil simplificada para o zoom nacional (~8 polegadas)
+    base = simplified_base(gdf_BR, _zoom_tolerance(gdf_BR.total_bounds, 8 * dpi), cache_dir)
+    
+    tasks = [('sm', base, gdf_var, (col, cmap),
+              os.path.join(output_dir, 'mapa_%s.%s' % (col, fmt)), dpi)
+             for col, cmap in columns_cmap.items()]
+    if len(columns_cmap) <= 2:
+        tasks.append(('mm', base, gdf_var, columns_cmap,
+                      os.path.join(output_dir, 'mapa_colunas.%s' % fmt), dpi))
+    
+    if gdf_states is not None:
+        # Estações de cada estado em uma única consulta ao índice espacial
+        state_idx, var_idx = gdf_var.sindex.query(gdf_states.geometry.to_numpy(),
+                                                  predicate='contains')
+        for i, state_name in enumerate(gdf_states[column]):
+            data = gdf_var.iloc[var_idx[state_idx == i]]
+            if data.empty:
+                continue
+            state = gdf_states.iloc[[i]]
+            base_state = simplified_base(state, _zoom_tolerance(state.total_bounds, 8 * dpi),
+                                         cache_dir)
+            for col, cmap in columns_cmap.items():
+                tasks.append(('sm', base_state, data, (col, cmap),
+                              os.path.join(output_dir, 'mapa_%s_%s.%s' % (state_name, col, fmt)),
+                              dpi))
+    
+    if workers is not None and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_agg_backend) as executor:
+            outputs = list(executor.map(_render_map, tasks))
+    else:
+        backend = plt.get_backend()
+        _agg_backend()
+        try:
+            outputs = [_render_map(task) for task in tasks]
+        finally:
+            plt.switch_backend(backend)
+    instrument.count('figuras_geradas', len(outputs))
+    
+    return outputs
 
 
 def aqs_number_plot(data, column, title_left, title_right, color_left='Blue', color_right='Red'):
@@ -144,6 +309,7 @@ def aqs_number_plot(data, column, title_left, title_right, color_left='Blue', co
     plt.show()
 
 
+@instrument.timed()
 def aqs_cover_br(gdf_aqs, gdf_BR, buffer_dist=5000):
     """
     Função para criar buffers de 5km ao redor das estações, 
@@ -160,9 +326,6 @@ def aqs_cover_br(gdf_aqs, gdf_BR, buffer_dist=5000):
     - DataFrame com as áreas totais (em km²) e percentuais de cobertura.
     """
     
-    # Criação dos buffers de 5 km ao redor de cada ponto
-    gdf_aqs['buffer'] = gdf_aqs.geometry.buffer(buffer_dist)
-    
     # Criação do buffer ao redor da geometria se não for polígono
     if gdf_BR.geometry.type.isin(['Point', 'MultiPoint']).any():
         gdf_BR['geometry'] = gdf_BR.geometry.buffer(5)
@@ -170,13 +333,11 @@ def aqs_cover_br(gdf_aqs, gdf_BR, buffer_dist=5000):
     # Unificação das geometrias    
     gdf_BR_unified = unary_union(gdf_BR.geometry)
     
-    # Separação dos buffers por tipo de estação
-    ref_buffers = gdf_aqs[gdf_aqs['Tipo'] == 'Referência']['buffer']
-    ind_buffers = gdf_aqs[gdf_aqs['Tipo'] == 'Indicativa']['buffer']
-    
-    # Dissolver os buffers para remover as áreas sobrepostas
-    ref_dissolved = ref_buffers.unary_union
-    ind_dissolved = ind_buffers.unary_union
+    # Dissolver os buffers para remover as áreas sobrepostas (reaproveitado do
+    # cache se as estações e o raio não mudaram)
+    dissolved = geocache.dissolved_buffers(gdf_aqs, buffer_dist, 'Tipo')
+    ref_dissolved = geocache.group_geometry(dissolved, 'Tipo', 'Referência')
+    ind_dissolved = geocache.group_geometry(dissolved, 'Tipo', 'Indicativa')
     
     # Calculo da área total dos buffers (em km²)
     ref_area = ref_dissolved.area / 1e6
@@ -199,49 +360,103 @@ def aqs_cover_br(gdf_aqs, gdf_BR, buffer_dist=5000):
     })
 
 
-def urban_area_by_state(gdf_urban, gdf_states):
+def _urban_in_state(task):
+    """
+    Interseção e união das áreas urbanas candidatas com o polígono de um estado.
+    Executada em paralelo pelo urban_area_by_state.
+    """
+    
+    state_name, state_geom, urban_geoms = task
+    urban_in_state = shapely.intersection(urban_geoms, state_geom)
+    return state_name, shapely.union_all(urban_in_state)
+
+
+@instrument.timed()
+def urban_area_by_state(gdf_urban, gdf_states, workers=None, cache_dir=None):
     """
     Função para calcular a área urbana dentro de cada estado no Brasil.
 
+    As áreas urbanas candidatas de cada estado são obtidas com uma única consulta
+    ao índice espacial (em vez de um intersects sobre toda a camada por estado) e
+    os estados podem ser processados em paralelo. O resultado é guardado no cache
+    de geometrias (geocache, GeoParquet) com uma chave calculada a partir do
+    conteúdo das duas camadas de entrada, e as execuções seguintes apenas leem o
+    arquivo.
+
     Parâmetros:
     - gdf_urban: GeoDataFrame representando as áreas urbanas do Brasil.
     - gdf_states: GeoDataFrame representando os estados do Brasil.
+    - workers: Número de processos (padrão None: executa no processo atual).
+    - cache_dir: Pasta do cache em GeoParquet (padrão None: geocache.CACHE_DIR).
 
     Retorna:
     - GeoDataFrame com o polígono unificado da área urbana para cada estado.
     """
     
-    # Criação de uma lista para armazenar os resultados
-    results = []
-    
-    for _, state in gdf_states.iterrows():
-        state_geom = state['geometry']
-        state_name = state['HASC_1']
-        
-        # Filtragem de áreas urbanas que intersectam o estado
-        urban_in_state = gdf_urban[gdf_urban.intersects(state_geom)]
+    def build():
+        # Pares (estado, área urbana) que se intersectam, em uma única consulta
+        state_geoms = gdf_states.geometry.to_numpy()
+        urban_geoms = gdf_urban.geometry.to_numpy()
+        state_idx, urban_idx = gdf_urban.sindex.query(state_geoms, predicate='intersects')
         
-        # Interseção das áreas urbanas com o polígono do estado
-        urban_in_state = urban_in_state.copy()
-        urban_in_state['geometry'] = urban_in_state['geometry'].intersection(state_geom)
+        tasks = [(state_name, state_geoms[i], urban_geoms[urban_idx[state_idx == i]])
+                 for i, state_name in enumerate(gdf_states['HASC_1'])]
         
-        # Unificação das áreas urbanas dentro do estado
-        urban_union = urban_in_state.unary_union
-        
-        # Add o resultado
-        results.append({
-            'Estado': state_name,
-            'geometry': urban_union
-        })
+        # Criação de uma lista para armazenar os resultados
+        results = []
+        if workers is not None and workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for state_name, urban_union in executor.map(_urban_in_state, tasks):
+                    results.append({'Estado': state_name, 'geometry': urban_union})
+                    instrument.count('estados_processados')
+        else:
+            for task in tasks:
+                state_name, urban_union = _urban_in_state(task)
+                results.append({'Estado': state_name, 'geometry': urban_union})
+                instrument.count('estados_processados')
         
-        print(state)
+        # Criação de GeoDataFrame com os resultados
+        return gpd.GeoDataFrame(results, geometry='geometry', crs=gdf_states.crs)
+    
+    return geocache.cached('urban_area_by_state',
+                           [geocache.gdf_hash(gdf_urban, gdf_states)], build, cache_dir)
+
+
+def _area_by_zone(dissolved, zone_geoms):
+    """
+    Função para calcular a área de uma geometria dissolvida (ex: buffers unidos)
+    dentro de cada zona (ex: estados).
+
+    A geometria é separada em partes indexadas por uma STRtree, então cada zona só
+    é intersectada com as partes cujo envelope a toca. Partes inteiramente contidas
+    na zona entram com a sua área, sem calcular a interseção.
+
+    Parâmetros:
+    - dissolved: Geometria (shapely) com a cobertura dissolvida.
+    - zone_geoms: Array de geometrias das zonas (de preferência preparadas).
+
+    Retorna:
+    - Array com a área da cobertura dentro de cada zona (unidades do CRS).
+    """
     
-    # Criação de GeoDataFrame com os resultados
-    gdf_result = gpd.GeoDataFrame(results, geometry='geometry', crs=gdf_states.crs)
+    parts = shapely.get_parts(dissolved)
+    if len(parts) == 0:
+        return np.zeros(len(zone_geoms))
     
-    return gdf_result
+    with instrument.stage('predicados_espaciais'):
+        zone_idx, part_idx = shapely.STRtree(parts).query(zone_geoms, predicate='intersects')
+        
+        # Atalho para as partes inteiramente contidas na zona
+        inside = shapely.contains(zone_geoms[zone_idx], parts[part_idx])
+        areas = shapely.area(parts[part_idx])
+        areas[~inside] = shapely.area(shapely.intersection(parts[part_idx[~inside]],
+                                                           zone_geoms[zone_idx[~inside]]))
+    instrument.count('pares_intersectados', len(zone_idx))
+    
+    return np.bincount(zone_idx, weights=areas, minlength=len(zone_geoms))
 
 
+@instrument.timed()
 def aqs_cover_state(gdf_aqs, gdf_states, column, buffer_dist=5000):
     """
     Função para calcular a área de cobertura dos buffers ao redor das estações em relação à área
@@ -257,53 +472,594 @@ def aqs_cover_state(gdf_aqs, gdf_states, column, buffer_dist=5000):
     - DataFrame com áreas de cobertura dos buffers para cada estado e percentuais de cobertura.
     """
     
-    # Criação dos buffers ao redor de cada ponto
-    gdf_aqs['buffer'] = gdf_aqs.geometry.buffer(buffer_dist)
+    return aqs_cover_zones(gdf_aqs, gdf_states, column, buffer_dist)
+
+
+def _area_by_zone_task(task):
+    """
+    Áreas de cobertura (Referência e Indicativa) em um bloco de zonas.
+    Executada em paralelo pelo aqs_cover_zones.
+    """
     
-    # Dissolvendo os buffers para remover as áreas sobrepostas
-    ref_buffers = gdf_aqs[gdf_aqs['Tipo'] == 'Referência']['buffer']
-    ind_buffers = gdf_aqs[gdf_aqs['Tipo'] == 'Indicativa']['buffer']
+    ref_dissolved, ind_dissolved, zone_geoms = task
+    shapely.prepare(zone_geoms)
+    return _area_by_zone(ref_dissolved, zone_geoms), _area_by_zone(ind_dissolved, zone_geoms)
+
+
+@instrument.timed()
+def aqs_cover_zones(gdf_aqs, gdf_zones, column, buffer_dist=5000, gdf_pop=None,
+                    pop_col='PopResid', pop_rule='inside', chunk_size=None, workers=None):
+    """
+    Função para calcular a cobertura dos buffers das estações (área e, se informada,
+    população) em cada zona de uma camada qualquer: estados, municípios, áreas
+    urbanas, polígonos de classes do Mapbiomas...
+
+    Todas as zonas são avaliadas de uma vez: os buffers dissolvidos por tipo são
+    separados em partes indexadas por uma STRtree (_area_by_zone) e a população é
+    atribuída às zonas e aos buffers com consultas no índice dos pontos. Com
+    chunk_size as zonas são processadas em blocos (menos memória nos pares
+    intersectados) e com workers os blocos rodam em paralelo. A cobertura de área é
+    espacial: todo buffer que toca a zona conta, como no aqs_cover_state. A
+    cobertura de população segue pop_rule:
+    - 'inside' (padrão): como no aqs_pop_cover_state (cover_pop), só as estações
+      dentro da zona cobrem a sua população e os pontos de população são
+      atribuídos à zona pela geometria completa (within).
+    - 'any': todo buffer que toca a zona cobre a sua população, como na área, e
+      polígonos de população são reduzidos aos centroides. Em estados vizinhos
+      com estações perto da divisa o resultado difere do aqs_pop_cover_state.
+
+    Parâmetros:
+    - gdf_aqs: GeoDataFrame contendo as estações de monitoramento.
+    - gdf_zones: GeoDataFrame com as zonas (ex: 27 estados ou 5.570 municípios).
+    - column: Coluna com o identificador da zona.
+    - buffer_dist: Distância do buffer em metros (padrão é 5000 metros).
+    - gdf_pop: GeoDataFrame com a população geolocalizada (padrão None: só áreas).
+    - pop_col: Coluna da população (padrão 'PopResid').
+    - pop_rule: Estações que cobrem a população da zona, 'inside' ou 'any' (padrão 'inside').
+    - chunk_size: Número de zonas por bloco (padrão None: todas de uma vez).
+    - workers: Número de processos para os blocos (padrão None: processo atual).
+    
+    Retorna:
+    - DataFrame com o esquema do cover_state_tot.csv (Estado, Ref_Area, Ind_Area,
+      Estado_Area, Ref_%, Ind_%), uma linha por zona na ordem do gdf_zones. Com
+      gdf_pop, também Ref_Pop, Ind_Pop, Estado_Pop, Ref_Pop_% e Ind_Pop_%.
+    """
+    
+    # Dissolvendo os buffers para remover as áreas sobrepostas (reaproveitado do
+    # cache se as estações e o raio não mudaram)
+    dissolved = geocache.dissolved_buffers(gdf_aqs, buffer_dist, 'Tipo')
+    ref_dissolved = geocache.group_geometry(dissolved, 'Tipo', 'Referência')
+    ind_dissolved = geocache.group_geometry(dissolved, 'Tipo', 'Indicativa')
+    
+    # Geometrias das zonas preparadas para os testes de interseção/contenção
+    zone_geoms = gdf_zones.geometry.to_numpy()
+    shapely.prepare(zone_geoms)
+    
+    # Áreas de cobertura dentro de cada zona (em km²), em blocos de zonas
+    step = chunk_size or max(len(zone_geoms), 1)
+    tasks = [(ref_dissolved, ind_dissolved, zone_geoms[start:start + step])
+             for start in range(0, len(zone_geoms), step)]
+    if workers is not None and workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            areas = list(instrument.pool_map(executor, _area_by_zone_task, tasks))
+    else:
+        areas = [_area_by_zone_task(task) for task in tasks]
+    instrument.count('zonas_processadas', len(zone_geoms))
+    ref_area = np.concatenate([a[0] for a in areas] + [np.empty(0)]) / 1e6
+    ind_area = np.concatenate([a[1] for a in areas] + [np.empty(0)]) / 1e6
     
-    ref_dissolved = ref_buffers.unary_union
-    ind_dissolved = ind_buffers.unary_union
+    # Calculo da área total de cada zona (em km²)
+    zone_area = shapely.area(zone_geoms) / 1e6
+    
+    result = pd.DataFrame({
+        'Estado': gdf_zones[column].to_numpy(),
+        'Ref_Area': ref_area,
+        'Ind_Area': ind_area,
+        'Estado_Area': zone_area,
+        'Ref_%': (ref_area / zone_area) * 100,
+        'Ind_%': (ind_area / zone_area) * 100
+    })
+    
+    if gdf_pop is not None:
+        if pop_rule not in ('inside', 'any'):
+            raise ValueError("pop_rule deve ser 'inside' ou 'any'")
+        
+        # População indexada uma vez (geometria completa em 'inside', centroides
+        # dos polígonos em 'any'): pares (zona, ponto) e pontos dentro dos buffers
+        pop_geom = gdf_pop.geometry
+        if pop_rule == 'any' and not (pop_geom.geom_type == 'Point').all():
+            pop_geom = pop_geom.centroid
+        pop_tree = shapely.STRtree(pop_geom.to_numpy())
+        weights = gdf_pop[pop_col].to_numpy(dtype=float)
+        
+        with instrument.stage('predicados_espaciais'):
+            zone_idx, pop_idx = pop_tree.query(zone_geoms, predicate='contains')
+        zone_pop = np.bincount(zone_idx, weights=weights[pop_idx], minlength=len(zone_geoms))
+        result['Estado_Pop'] = zone_pop
+        
+        if pop_rule == 'inside':
+            # Buffers dissolvidos por zona e tipo só com as estações dentro da
+            # zona, como no aqs_pop_cover_state
+            aqs_geom = gdf_aqs.geometry.to_numpy()
+            with instrument.stage('predicados_espaciais'):
+                aqs_zone, aqs_idx = shapely.STRtree(aqs_geom).query(zone_geoms, predicate='contains')
+            gdf_aqs_in_zone = gdf_aqs.iloc[aqs_idx][['Tipo', gdf_aqs.geometry.name]]
+            gdf_aqs_in_zone['zone_pos'] = aqs_zone
+            by_zone = geocache.dissolved_buffers(gdf_aqs_in_zone, buffer_dist, ['zone_pos', 'Tipo'])
+            # Pares (zona, ponto) codificados em um inteiro
+            zone_pairs = zone_idx.astype(np.int64) * len(weights) + pop_idx
+        
+        for tipo, geom in [('Ref', ref_dissolved), ('Ind', ind_dissolved)]:
+            if pop_rule == 'inside':
+                sel = by_zone[by_zone['Tipo'] == {'Ref': 'Referência', 'Ind': 'Indicativa'}[tipo]]
+                parts, owner = shapely.get_parts(sel.geometry.to_numpy(), return_index=True)
+                with instrument.stage('predicados_espaciais'):
+                    part_idx, point_idx = pop_tree.query(parts, predicate='contains')
+                # Só os pontos da própria zona da estação
+                pairs = np.unique(sel['zone_pos'].to_numpy()[owner][part_idx].astype(np.int64)
+                                  * len(weights) + point_idx)
+                pairs = pairs[np.isin(pairs, zone_pairs)]
+                pop_cover = np.bincount(pairs // len(weights), weights=weights[pairs % len(weights)],
+                                        minlength=len(zone_geoms))
+            else:
+                covered = np.zeros(len(weights), dtype=bool)
+                parts = shapely.get_parts(geom)
+                with instrument.stage('predicados_espaciais'):
+                    covered[pop_tree.query(parts, predicate='contains')[1]] = True
+                pop_cover = np.bincount(zone_idx, weights=weights[pop_idx] * covered[pop_idx],
+                                        minlength=len(zone_geoms))
+            result[tipo + '_Pop'] = pop_cover
+            result[tipo + '_Pop_%'] = np.divide(pop_cover * 100, zone_pop,
+                                                out=np.zeros(len(zone_pop)),
+                                                where=zone_pop > 0)
+        
+        result = result[['Estado', 'Ref_Area', 'Ind_Area', 'Estado_Area', 'Ref_%', 'Ind_%',
+                         'Ref_Pop', 'Ind_Pop', 'Estado_Pop', 'Ref_Pop_%', 'Ind_Pop_%']]
+    
+    return result
+
+
+@instrument.timed()
+def aqs_cover_state_delta(gdf_aqs, gdf_states, column, buffer_dist=5000, state_dir=None):
+    """
+    Função para recalcular o aqs_cover_state só para os estados afetados pelas
+    mudanças no inventário de estações desde a execução anterior.
+
+    O inventário é comparado com o da execução anterior (inventoryDelta) pela
+    chave ESTAÇÃO + coordenadas + Tipo. Os estados tocados pelos buffers das
+    estações alteradas (posições novas e antigas) são recalculados com as
+    estações cujos buffers os tocam; os demais estados vêm do resultado anterior.
+    Se os estados, a coluna, o raio ou o CRS mudaram, recalcula tudo.
+
+    Parâmetros:
+    - gdf_aqs: GeoDataFrame contendo as estações de monitoramento (com a coluna 'ESTAÇÃO').
+    - gdf_states: GeoDataFrame representando os estados do Brasil.
+    - column: Coluna com o nome do estado.
+    - buffer_dist: Distância do buffer em metros (padrão é 5000 metros).
+    - state_dir: Pasta do estado da execução anterior (padrão: inventoryDelta.STATE_DIR).
+    
+    Retorna:
+    - DataFrame igual ao do aqs_cover_state (as áreas dos estados recalculados
+      podem diferir do cálculo completo apenas no arredondamento da união).
+    """
+    
+    name = 'aqs_cover_state'
+    params = [name, geocache.gdf_hash(gdf_states), column, buffer_dist, str(gdf_aqs.crs)]
+    inventory = gdf_aqs[[inventoryDelta.KEY, 'Tipo', gdf_aqs.geometry.name]]
+    prev_inventory, prev_result = inventoryDelta.load_state(name, params, state_dir)
+    
+    if prev_result is None:
+        result = aqs_cover_state(gdf_aqs, gdf_states, column, buffer_dist)
+    else:
+        changed_new, changed_old = inventoryDelta.diff_inventory(inventory, prev_inventory, ['Tipo'])
+        
+        # Estados tocados pelos buffers das estações alteradas
+        state_geoms = gdf_states.geometry.to_numpy()
+        touched = np.concatenate([
+            geodesy.buffers(gdf_aqs.geometry.to_numpy()[changed_new], buffer_dist, gdf_aqs.crs),
+            geodesy.buffers(prev_inventory.geometry.to_numpy()[changed_old], buffer_dist,
+                            gdf_aqs.crs)])
+        zones = inventoryDelta.affected_zones(state_geoms, touched)
+        print('Cobertura incremental: ' + str(len(zones)) + '/' + str(len(gdf_states)) +
+              ' estados recalculados')
+        
+        result = prev_result.copy()
+        if len(zones):
+            # Estações cujos buffers tocam os estados afetados
+            aqs_buffers = geodesy.buffers(gdf_aqs.geometry.to_numpy(), buffer_dist, gdf_aqs.crs)
+            near = inventoryDelta.affected_zones(aqs_buffers, state_geoms[zones])
+            part = aqs_cover_state(gdf_aqs.iloc[near].copy(), gdf_states.iloc[zones],
+                                   column, buffer_dist)
+            result = pd.concat([result.drop(index=zones), part.set_axis(zones)]).sort_index()
+    
+    inventoryDelta.save_state(name, params, inventory, result, state_dir)
+    return result
+
+
+@instrument.timed()
+def aqs_cover_sweep(gdf_aqs, gdf_states, column, buffer_dists, gdf_BR=None):
+    """
+    Função para calcular a cobertura dos buffers das estações em cada estado para
+    uma lista de raios, substituindo chamadas repetidas ao aqs_cover_state e ao
+    aqs_cover_br (uma por raio).
+
+    Os pares estação-estado a até max(buffer_dists) são obtidos uma única vez com o
+    índice espacial (STRtree) e as distâncias são guardadas; para cada raio só são
+    dissolvidos os buffers geodésicos (geodesy) das estações que podem alcançar o
+    estado (distância no CRS até buffer_dist x geodesy.MAX_SCALE). As geometrias dos
+    estados são preparadas uma vez e reutilizadas para todos os raios.
+
+    Parâmetros:
+    - gdf_aqs: GeoDataFrame contendo as estações de monitoramento.
+    - gdf_states: GeoDataFrame representando os estados do Brasil.
+        *pode ser usado outro gdf (ex: área urbana ou tipo de uso do solo)*
+    - column: Nome da coluna do gdf_states com o nome do estado.
+    - buffer_dists: Lista de distâncias do buffer em metros (ex: [1000, 2000, 5000]).
+    - gdf_BR: GeoDataFrame com a área total do Brasil (opcional). Se informado,
+        inclui as linhas com Estado='BR' calculadas como no aqs_cover_br.
+    
+    Retorna:
+    - DataFrame em formato longo (raio x estado x tipo de estação) com as colunas
+      buffer_dist, Estado, Tipo, Area, Estado_Area (em km²) e %.
+    """
+    
+    buffer_dists = sorted(buffer_dists)
+    
+    # Geometrias dos estados preparadas uma única vez
+    state_geoms = gdf_states.geometry.to_numpy()
+    shapely.prepare(state_geoms)
+    state_names = gdf_states[column].to_numpy()
+    state_areas = shapely.area(state_geoms) / 1e6
+    
+    if gdf_BR is not None:
+        br_geoms = gdf_BR.geometry
+        if br_geoms.type.isin(['Point', 'MultiPoint']).any():
+            br_geoms = br_geoms.buffer(5)
+        br_area = unary_union(br_geoms).area / 1e6
     
-    # Inicialização do DataFrame para armazenar os resultados
     results = []
+    for tipo in ['Referência', 'Indicativa']:
+        points = gdf_aqs[gdf_aqs['Tipo'] == tipo].geometry.to_numpy()
+        
+        # Pares (estado, estação) até o maior raio e suas distâncias no CRS
+        # (com a folga da escala da projeção)
+        state_idx, aqs_idx = shapely.STRtree(points).query(
+            state_geoms, predicate='dwithin', distance=buffer_dists[-1] * geodesy.MAX_SCALE)
+        dist = shapely.distance(points[aqs_idx], state_geoms[state_idx])
+        
+        for buffer_dist in buffer_dists:
+            buffers = geodesy.buffers(points, buffer_dist, gdf_aqs.crs)
+            reach = dist < buffer_dist * geodesy.MAX_SCALE
+            
+            for i in range(len(state_geoms)):
+                members = aqs_idx[reach & (state_idx == i)]
+                if len(members) == 0:
+                    area = 0.0
+                else:
+                    dissolved = shapely.union_all(buffers[members])
+                    area = shapely.intersection(dissolved, state_geoms[i]).area / 1e6
+                results.append({
+                    'buffer_dist': buffer_dist,
+                    'Estado': state_names[i],
+                    'Tipo': tipo,
+                    'Area': area,
+                    'Estado_Area': state_areas[i],
+                    '%': (area / state_areas[i]) * 100
+                })
+            
+            if gdf_BR is not None:
+                area = shapely.union_all(buffers).area / 1e6
+                results.append({
+                    'buffer_dist': buffer_dist,
+                    'Estado': 'BR',
+                    'Tipo': tipo,
+                    'Area': area,
+                    'Estado_Area': br_area,
+                    '%': (area / br_area) * 100
+                })
+    
+    return pd.DataFrame(results).sort_values(['buffer_dist', 'Tipo'], kind='stable',
+                                             ignore_index=True)
+
+
+# Raio autálico da Terra (m), usado na área dos pixels de rasters em graus
+_EARTH_RADIUS = 6371007.2
 
-    for _, state in gdf_states.iterrows():
-        state_geom = state['geometry']
-        state_name = state[column]
+
+def _raster_tiles(height, width, tile):
+    """
+    Gera as janelas (linha, coluna, altura, largura) de tile x tile pixels que
+    cobrem uma grade de height x width pixels.
+    """
+    for row in range(0, height, tile):
+        for col in range(0, width, tile):
+            yield row, col, min(tile, height - row), min(tile, width - col)
+
+
+def _coverage_counts(tipo_buffers, zone_geoms, transform, height, width, tile):
+    """
+    Rasteriza as zonas e os buffers de cada tipo de estação em blocos de uma
+    grade e conta os pixels cobertos de cada zona. Blocos sem nenhum buffer não
+    são rasterizados.
+
+    Parâmetros:
+    - tipo_buffers: Dicionário {tipo: array de buffers (shapely)}.
+    - zone_geoms: Array de geometrias das zonas.
+    - transform: Affine da grade.
+    - height, width: Tamanho da grade em pixels.
+    - tile: Tamanho do bloco em pixels.
+
+    Retorna:
+    - Dicionário {tipo: array com o número de pixels cobertos de cada zona}.
+    """
+    
+    from rasterio.features import rasterize
+    
+    nzones = len(zone_geoms)
+    zone_tree = shapely.STRtree(zone_geoms)
+    buffer_trees = {tipo: shapely.STRtree(buffers) for tipo, buffers in tipo_buffers.items()}
+    cover_count = {tipo: np.zeros(nzones + 1, dtype=np.int64) for tipo in tipo_buffers}
+    
+    for row, col, h, w in _raster_tiles(height, width, tile):
+        tile_transform = transform * transform.translation(col, row)
+        x0, y1 = tile_transform * (0, 0)
+        x1, y0 = tile_transform * (w, h)
+        tile_box = shapely.box(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
         
-        # Interseção dos buffers com o estado
-        ref_intersection = ref_dissolved.intersection(state_geom)
-        ind_intersection = ind_dissolved.intersection(state_geom)
+        hits = {tipo: tree.query(tile_box, predicate='intersects')
+                for tipo, tree in buffer_trees.items()}
+        if not any(len(buffers_in_tile) for buffers_in_tile in hits.values()):
+            continue
+        zones_in_tile = zone_tree.query(tile_box, predicate='intersects')
+        if len(zones_in_tile) == 0:
+            continue
+        zone = rasterize(zip(zone_geoms[zones_in_tile], zones_in_tile + 1),
+                         out_shape=(h, w), transform=tile_transform, fill=0,
+                         dtype='int32')
+        instrument.count('pixels_rasterizados', h * w)
         
-        # Calculo das áreas de cobertura dentro do estado
-        if isinstance(ref_intersection, gpd.geoseries.GeoSeries):
-            ref_area = ref_intersection.area.sum() / 1e6
+        for tipo, buffers_in_tile in hits.items():
+            if len(buffers_in_tile) == 0:
+                continue
+            covered = rasterize(tipo_buffers[tipo][buffers_in_tile], out_shape=(h, w),
+                                transform=tile_transform, fill=0, default_value=1,
+                                dtype='uint8')
+            cover_count[tipo] += np.bincount(zone[covered == 1], minlength=nzones + 1)
+    
+    return {tipo: count[1:] for tipo, count in cover_count.items()}
+
+
+def _grid(bounds, res):
+    """
+    Grade de pixels de tamanho res alinhada a múltiplos de res que cobre bounds.
+    Retorna (transform, height, width).
+    """
+    
+    from affine import Affine
+    
+    minx, miny, maxx, maxy = bounds
+    x0 = np.floor(minx / res) * res
+    y1 = np.ceil(maxy / res) * res
+    width = int(np.ceil((maxx - x0) / res))
+    height = int(np.ceil((y1 - miny) / res))
+    return Affine(res, 0, x0, 0, -res, y1), height, width
+
+
+@instrument.timed()
+def aqs_cover_state_raster(gdf_aqs, gdf_states, column, buffer_dist=5000, res=100,
+                           tile=1024):
+    """
+    Versão raster do aqs_cover_state: em vez de dissolver os buffers (unary_union),
+    rasteriza os buffers de cada tipo de estação e os estados em uma grade de
+    pixels de tamanho res, processada em blocos de tile x tile pixels, e calcula as
+    áreas por contagem de pixels. Escala para rodadas nacionais em que a união
+    vetorial de milhares de círculos é inviável. Só os blocos tocados por algum
+    buffer são rasterizados.
+
+    Um pixel é contado quando o seu centro está dentro da geometria. O erro da
+    área rasterizada de uma região é limitado por ~√2 x perímetro x res (pixels
+    cortados pela borda); para um círculo isolado de raio r isso é no máximo
+    2√2 x res / r da área (5,7% para res=100 m e r=5 km), mas os erros de borda se
+    compensam e o erro típico é muito menor (<0,5% nesse caso). Use res menor
+    para buffers pequenos. A área de cada pixel é res x res, que só é a área no
+    terreno no CRS de área igual geodesy.WORK_CRS.
+
+    Parâmetros:
+    - gdf_aqs: GeoDataFrame contendo as estações de monitoramento (geodesy.WORK_CRS).
+    - gdf_states: GeoDataFrame representando os estados do Brasil.
+        *pode ser usado outro gdf (ex: área urbana ou tipo de uso do solo)*
+    - column: Nome da coluna do gdf_states com o nome do estado.
+    - buffer_dist: Distância do buffer em metros (padrão é 5000 metros).
+    - res: Tamanho do pixel da grade em metros (padrão é 100 metros).
+    - tile: Tamanho do bloco de processamento em pixels (padrão é 1024).
+    
+    Retorna:
+    - DataFrame com as mesmas colunas do aqs_cover_state (Estado, Ref_Area,
+      Ind_Area, Estado_Area, Ref_%, Ind_%). As áreas cobertas (km²) são calculadas
+      na grade; Estado_Area é a área vetorial exata.
+    """
+    
+    state_geoms = gdf_states.geometry.to_numpy()
+    tipo_buffers = {tipo: geodesy.buffers(gdf_aqs[gdf_aqs['Tipo'] == tipo].geometry.to_numpy(),
+                                          buffer_dist, gdf_aqs.crs)
+                    for tipo in ['Referência', 'Indicativa']}
+    
+    transform, height, width = _grid(gdf_states.total_bounds, res)
+    cover_count = _coverage_counts(tipo_buffers, state_geoms, transform, height,
+                                   width, tile)
+    
+    pixel_area = res * res / 1e6
+    state_area = shapely.area(state_geoms) / 1e6
+    ref_area = cover_count['Referência'] * pixel_area
+    ind_area = cover_count['Indicativa'] * pixel_area
+    
+    return pd.DataFrame({
+        'Estado': gdf_states[column].to_numpy(),
+        'Ref_Area': ref_area,
+        'Ind_Area': ind_area,
+        'Estado_Area': state_area,
+        'Ref_%': (ref_area / state_area) * 100,
+        'Ind_%': (ind_area / state_area) * 100
+    })
+
+
+@instrument.timed()
+def aqs_cover_br_raster(gdf_aqs, gdf_BR, buffer_dist=5000, res=100, tile=1024):
+    """
+    Versão raster do aqs_cover_br (ver aqs_cover_state_raster para a precisão).
+    A área dos buffers é a área coberta dentro do gdf_BR.
+
+    Parâmetros:
+    - gdf_aqs: GeoDataFrame contendo as estações de monitoramento (geodesy.WORK_CRS).
+    - gdf_BR: GeoDataFrame representando a área total do Brasil.
+    - buffer_dist: Distância do buffer em metros (padrão é 5000 metros).
+    - res: Tamanho do pixel da grade em metros (padrão é 100 metros).
+    - tile: Tamanho do bloco de processamento em pixels (padrão é 1024).
+    
+    Retorna:
+    - DataFrame com as mesmas colunas do aqs_cover_br.
+    """
+    
+    gdf_BR_unified = gpd.GeoDataFrame({'Estado': ['BR']},
+                                      geometry=[unary_union(gdf_BR.geometry)],
+                                      crs=gdf_BR.crs)
+    cover = aqs_cover_state_raster(gdf_aqs, gdf_BR_unified, 'Estado', buffer_dist,
+                                   res, tile)
+    
+    return pd.DataFrame({
+        'area_tot': cover['Estado_Area'].to_numpy(),
+        'area_ref': cover['Ref_Area'].to_numpy(),
+        'area_ind': cover['Ind_Area'].to_numpy(),
+        '%_ref': cover['Ref_%'].to_numpy(),
+        '%_ind': cover['Ind_%'].to_numpy()
+    })
+
+
+@instrument.timed()
+def aqs_landuse_cover_raster(gdf_aqs, landuse_path, buffer_dist=5000, gdf_states=None,
+                             column=None, tile=1024):
+    """
+    Função para calcular a área de cada classe de uso do solo (ex: Mapbiomas)
+    dentro da cobertura das estações, por tipo de estação (e por estado, se
+    gdf_states for informado), na grade do próprio raster de uso do solo.
+
+    As estações são reprojetadas para o CRS do raster e os buffers geodésicos
+    (geodesy) são criados nesse CRS; só os blocos do raster tocados por algum
+    buffer são lidos. Para rasters em
+    graus, a área de cada pixel é calculada pela sua latitude (esfera autálica).
+
+    Parâmetros:
+    - gdf_aqs: GeoDataFrame contendo as estações de monitoramento (qualquer CRS).
+    - landuse_path: Caminho do raster de uso do solo (ex: brasil_coverage_2022.tif).
+    - buffer_dist: Distância do buffer em metros (padrão é 5000 metros).
+    - gdf_states: GeoDataFrame com os estados (opcional).
+    - column: Nome da coluna do gdf_states com o nome do estado.
+    - tile: Tamanho do bloco de processamento em pixels (padrão é 1024).
+    
+    Retorna:
+    - DataFrame com as colunas (Estado,) Tipo, Classe, Area (km²) e % (da área
+      coberta do tipo de estação (no estado)). Pixels com o nodata do raster
+      não são contados (sem nodata, todos os valores são classes). O raster
+      deve ser inteiro sem sinal (ValueError caso contrário).
+    """
+    
+    import rasterio
+    from rasterio.features import rasterize
+    from rasterio.windows import Window, from_bounds
+    
+    results = []
+    with rasterio.open(landuse_path) as src:
+        tipo_buffers = {}
+        for tipo in ['Referência', 'Indicativa']:
+            points = gdf_aqs[gdf_aqs['Tipo'] == tipo].geometry.to_crs(src.crs).to_numpy()
+            tipo_buffers[tipo] = geodesy.buffers(points, buffer_dist, src.crs)
+        if gdf_states is not None:
+            zone_geoms = gdf_states.geometry.to_crs(src.crs).to_numpy()
+            zone_names = gdf_states[column].to_numpy()
         else:
-            ref_area = ref_intersection.area / 1e6
+            zone_geoms = None
+            zone_names = np.array(['BR'])
+        nzones = len(zone_names)
         
-        if isinstance(ind_intersection, gpd.geoseries.GeoSeries):
-            ind_area = ind_intersection.area.sum() / 1e6
-        else:
-            ind_area = ind_intersection.area / 1e6
+        # Janela do raster que contém todos os buffers
+        all_buffers = np.concatenate(list(tipo_buffers.values()))
+        if len(all_buffers) == 0:
+            return pd.DataFrame(results)
+        window = from_bounds(*shapely.total_bounds(all_buffers), transform=src.transform)
+        col0, row0 = int(np.floor(window.col_off)), int(np.floor(window.row_off))
+        col1 = int(np.ceil(window.col_off + window.width))
+        row1 = int(np.ceil(window.row_off + window.height))
+        window = Window(col0, row0, col1 - col0, row1 - row0).intersection(
+            Window(0, 0, src.width, src.height))
         
-        # Calculo da área total do estado (em km²)
-        state_area = state_geom.area / 1e6
+        # As classes são os próprios valores do raster (índices do bincount):
+        # só inteiros sem sinal, e o número de classes cresce com o maior valor lido
+        if not np.issubdtype(np.dtype(src.dtypes[0]), np.unsignedinteger):
+            raise ValueError('o raster de uso do solo deve ser inteiro sem sinal, não ' +
+                             src.dtypes[0])
+        nodata = src.nodata
         
-        # Calculo do percentual de cobertura
-        ref_perc = (ref_area / state_area) * 100
-        ind_perc = (ind_area / state_area) * 100
+        buffer_trees = {tipo: shapely.STRtree(buffers) for tipo, buffers in tipo_buffers.items()}
+        area = {tipo: np.zeros((nzones, 0)) for tipo in tipo_buffers}
         
-        #Armazenando resultados
-        results.append({
-            'Estado': state_name,
-            'Ref_Area': ref_area,
-            'Ind_Area': ind_area,
-            'Estado_Area': state_area,
-            'Ref_%': ref_perc,
-            'Ind_%': ind_perc
-        })
-    
-    return pd.DataFrame(results)
\ No newline at end of file
+        for row, col, h, w in _raster_tiles(int(window.height), int(window.width), tile):
+            tile_window = Window(window.col_off + col, window.row_off + row, w, h)
+            tile_transform = src.window_transform(tile_window)
+            tile_box = shapely.box(*rasterio.windows.bounds(tile_window, src.transform))
+            
+            hits = {tipo: tree.query(tile_box, predicate='intersects')
+                    for tipo, tree in buffer_trees.items()}
+            if not any(len(h_) for h_ in hits.values()):
+                continue
+            landuse = src.read(1, window=tile_window)
+            
+            # Área de cada pixel do bloco (m²)
+            if src.crs.is_geographic:
+                top = tile_transform.f + tile_transform.e * np.arange(h)
+                bottom = top + tile_transform.e
+                row_area = (np.radians(abs(tile_transform.a)) * _EARTH_RADIUS ** 2 *
+                            np.abs(np.sin(np.radians(top)) - np.sin(np.radians(bottom))))
+                pixel_area = np.broadcast_to(row_area[:, None], (h, w))
+            else:
+                pixel_area = np.full((h, w), abs(tile_transform.a * tile_transform.e))
+            
+            if zone_geoms is not None:
+                zone = rasterize(zip(zone_geoms, np.arange(nzones) + 1), out_shape=(h, w),
+                                 transform=tile_transform, fill=0, dtype='int32') - 1
+            else:
+                zone = np.zeros((h, w), dtype=np.int32)
+            # Pixels fora dos estados ou sem dado (nodata do raster) não entram na tabela
+            valid = zone >= 0
+            if nodata is not None:
+                valid &= landuse != nodata
+            
+            for tipo, buffers_in_tile in hits.items():
+                if len(buffers_in_tile) == 0:
+                    continue
+                covered = rasterize(tipo_buffers[tipo][buffers_in_tile], out_shape=(h, w),
+                                    transform=tile_transform, fill=0, default_value=1,
+                                    dtype='uint8') == 1
+                covered &= valid
+                classes = landuse[covered].astype(np.intp)
+                if len(classes) == 0:
+                    continue
+                nbins = max(area[tipo].shape[1], int(classes.max()) + 1)
+                idx = zone[covered].astype(np.intp) * nbins + classes
+                tipo_area = np.bincount(idx, weights=pixel_area[covered],
+                                        minlength=nzones * nbins).reshape(nzones, nbins)
+                tipo_area[:, :area[tipo].shape[1]] += area[tipo]
+                area[tipo] = tipo_area
+    
+    for tipo, tipo_area in area.items():
+        for i in range(nzones):
+            total = tipo_area[i].sum()
+            for classe in np.nonzero(tipo_area[i])[0]:
+                result = {'Tipo': tipo,
+                          'Classe': int(classe),
+                          'Area': tipo_area[i, classe] / 1e6,
+                          '%': tipo_area[i, classe] / total * 100}
+                if gdf_states is not None:
+                    result = {'Estado': zone_names[i], **result}
+                results.append(result)
+    
+    return pd.DataFrame(results)
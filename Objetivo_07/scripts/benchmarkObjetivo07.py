@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:05:48 2026
+
+Benchmark das funções do analisesObjetivo07, do cover_pop e do stationsLandUse
+com dados sintéticos na escala do Brasil.
+
+Os dados (27 estados, estações com o esquema do inventário, população em pontos
+e em polígonos, áreas urbanas e um GeoTIFF categórico com os códigos da legenda
+do Mapbiomas) são gerados de forma determinística (semente fixa) em
+outputs/benchmark/<escala>/ e reaproveitados nas execuções seguintes. Cada caso
+roda em um processo novo, sem o cache de geometrias, e o tempo, o pico de memória
+e um checksum da saída de cada repetição são acrescentados ao
+outputs/benchmark/benchmark_results.csv, junto com o commit do git, para
+comparar execuções. Não usa rede.
+
+Uso (a partir da pasta scripts, como os demais scripts):
+    python benchmarkObjetivo07.py --escalas pequeno medio --repeticoes 3
+    python benchmarkObjetivo07.py --casos cover_state landUse
+"""
+
+import os
+os.environ.setdefault('MPLBACKEND', 'Agg')
+import sys
+import time
+import hashlib
+import argparse
+import resource
+import subprocess
+import tracemalloc
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+import rasterio as rs
+import rasterio.features
+import rasterio.windows
+from affine import Affine
+import geodesy
+
+
+# Escalas dos dados sintéticos: número de estações, de pontos de população,
+# lado das células de população em polígonos (km) e resolução do raster (graus).
+# A resolução tem que ser menor que ~0,012° para que todo buffer de 1 km
+# contenha o centro de algum pixel
+ESCALAS = {
+    'pequeno': {'estacoes': 200, 'pop': 20000, 'celula_km': 50, 'res': 0.01},
+    'medio': {'estacoes': 1000, 'pop': 200000, 'celula_km': 20, 'res': 0.005},
+    'grande': {'estacoes': 3000, 'pop': 1000000, 'celula_km': 10, 'res': 0.0025},
+}
+
+UFS = ['AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MG', 'MS',
+       'MT', 'PA', 'PB', 'PE', 'PI', 'PR', 'RJ', 'RN', 'RO', 'RR', 'RS', 'SC',
+       'SE', 'SP', 'TO']
+
+POLUENTES = ['MP10', 'MP25', 'O3', 'NO2', 'SO2', 'CO']
+
+# Domínio (lon/lat) dos dados sintéticos, aproximadamente o do Brasil
+DOMINIO = (-74.0, -34.0, -34.0, 5.0)
+
+YEAR = 2022
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _root_dir():
+    return os.path.dirname(os.getcwd())
+
+
+def fixture_dir(escala):
+    """
+    Pasta dos dados sintéticos de uma escala. Tem a mesma estrutura da raiz do
+    projeto (inputs/, outputs/ e scripts/), para que as funções do
+    stationsLandUse, que leem de ../inputs, rodem a partir de <pasta>/scripts.
+    """
+    return _root_dir()+'/outputs/benchmark/'+escala
+
+
+###dados sintéticos###
+
+def make_fixtures(escala, seed=0):
+    """
+    Função para gerar os dados sintéticos de uma escala, se ainda não existem.
+
+    Parâmetros:
+    - escala: Nome da escala (chave de ESCALAS).
+    - seed: Semente do gerador de números aleatórios.
+
+    Retorna:
+    - Caminho da pasta com os dados.
+    """
+    folder = fixture_dir(escala)
+    # Marcador da versão dos dados (camadas vetoriais no geodesy.WORK_CRS)
+    done = folder+'/.completo_work_crs'
+    if os.path.exists(done):
+        return folder
+    cfg = ESCALAS[escala]
+    rng = np.random.default_rng(seed)
+    inputs = folder+'/inputs'
+    os.makedirs(inputs, exist_ok=True)
+    os.makedirs(folder+'/scripts', exist_ok=True)
+
+    # Estados: polígonos de Voronoi no domínio (lon/lat)
+    x0, y0, x1, y1 = DOMINIO
+    domain = shapely.box(x0, y0, x1, y1)
+    seeds = shapely.multipoints(np.column_stack([rng.uniform(x0, x1, 27),
+                                                 rng.uniform(y0, y1, 27)]))
+    cells = shapely.get_parts(shapely.voronoi_polygons(seeds, extend_to=domain))
+    cells = shapely.intersection(cells, domain)
+    cells = shapely.segmentize(cells, 0.2)
+    states = gpd.GeoDataFrame({'HASC_1': ['BR.%02d' % i for i in range(27)],
+                               'UF': UFS}, geometry=cells, crs='EPSG:4326')
+
+    # Estações e população concentradas em "cidades"
+    centers = np.column_stack([rng.uniform(x0+1, x1-1, 400),
+                               rng.uniform(y0+1, y1-1, 400)])
+    nst = cfg['estacoes']
+    city = rng.integers(0, len(centers), nst)
+    st_xy = centers[city]+rng.normal(0, 0.15, (nst, 2))
+    st_xy = np.clip(st_xy, [x0, y0], [x1, y1])
+    st_pts = gpd.GeoSeries(gpd.points_from_xy(st_xy[:, 0], st_xy[:, 1]), crs='EPSG:4326')
+    st_uf = states['UF'].to_numpy()[states.sindex.nearest(st_pts)[1]]
+    tipo = rng.choice(['Referência', 'Indicativa'], nst)
+    nomes = ['EST_%05d' % i for i in range(nst)]
+
+    rows = []
+    for i in range(nst):
+        for pol in rng.choice(POLUENTES, rng.integers(1, 4), replace=False):
+            rows.append({'ESTADO': st_uf[i], 'CIDADE': 'Cidade %d' % city[i],
+                         'ESTAÇÃO': nomes[i],
+                         'TIPO': 'Automática' if tipo[i] == 'Referência' else 'Manual',
+                         'Certificação': 'Certificada', 'STATUS': 'Ativa',
+                         'POLUENTES MONITORADOS': pol,
+                         'LATITUDE': round(st_xy[i, 1], 5),
+                         'LONGITUDE': round(st_xy[i, 0], 5),
+                         'FONTE': 'Sintético'})
+    pd.DataFrame(rows).to_csv(inputs+'/stations.csv', index=False)
+
+    aqs = gpd.GeoDataFrame({'ESTAÇÃO': nomes, 'ESTADO': st_uf, 'Tipo': tipo},
+                           geometry=st_pts.values, crs='EPSG:4326').to_crs(geodesy.WORK_CRS)
+    aqs.to_parquet(folder+'/aqs.parquet')
+    states_work = states.to_crs(geodesy.WORK_CRS)
+    states_work.to_parquet(folder+'/states.parquet')
+    gpd.GeoDataFrame({'Pais': ['BR']}, geometry=[states_work.union_all()],
+                     crs=geodesy.WORK_CRS).to_parquet(folder+'/br.parquet')
+
+    npop = cfg['pop']
+    pcity = rng.integers(0, len(centers), npop)
+    p_xy = centers[pcity]+rng.normal(0, 0.25, (npop, 2))
+    p_xy = np.clip(p_xy, [x0, y0], [x1, y1])
+    pop = gpd.GeoDataFrame({'PopResid': rng.integers(0, 500, npop)},
+                           geometry=gpd.points_from_xy(p_xy[:, 0], p_xy[:, 1]),
+                           crs='EPSG:4326').to_crs(geodesy.WORK_CRS)
+    pop.to_parquet(folder+'/pop_points.parquet')
+
+    # População em polígonos: grade regular sobre o país, com a população dos
+    # pontos somada em cada célula
+    side = cfg['celula_km']*1000
+    bx0, by0, bx1, by1 = states_work.total_bounds
+    gx, gy = np.meshgrid(np.arange(bx0, bx1, side), np.arange(by0, by1, side))
+    grid = shapely.box(gx.ravel(), gy.ravel(), gx.ravel()+side, gy.ravel()+side)
+    col = np.clip((pop.geometry.x.to_numpy()-bx0)//side, 0, gx.shape[1]-1).astype(int)
+    row = np.clip((pop.geometry.y.to_numpy()-by0)//side, 0, gx.shape[0]-1).astype(int)
+    pop_cell = np.bincount(row*gx.shape[1]+col, weights=pop['PopResid'].to_numpy(),
+                           minlength=len(grid))
+    keep = pop_cell > 0
+    gpd.GeoDataFrame({'PopResid': pop_cell[keep]}, geometry=grid[keep],
+                     crs=geodesy.WORK_CRS).to_parquet(folder+'/pop_polygons.parquet')
+
+    urban_xy = gpd.GeoSeries(gpd.points_from_xy(centers[:, 0], centers[:, 1]),
+                             crs='EPSG:4326').to_crs(geodesy.WORK_CRS)
+    gpd.GeoDataFrame(geometry=urban_xy.buffer(rng.uniform(3000, 30000, len(centers))),
+                     crs=geodesy.WORK_CRS).to_parquet(folder+'/urban.parquet')
+
+    # Mapbiomas sintético: classes da legenda em manchas, nodata (0) fora dos
+    # estados, gravado por faixas para limitar a memória
+    legend = pd.read_csv(_root_dir()+'/inputs/mapbiomasLegend.csv')
+    legend.to_csv(inputs+'/mapbiomasLegend.csv', index=False)
+    codes = legend['Code ID'].to_numpy()
+    res = cfg['res']
+    width = int(round((x1-x0)/res))
+    height = int(round((y1-y0)/res))
+    transform = Affine(res, 0, x0, 0, -res, y1)
+    patch = 25
+    coarse = rng.choice(codes, (height//patch+1, width//patch+1)).astype('uint8')
+    profile = {'driver': 'GTiff', 'dtype': 'uint8', 'count': 1, 'nodata': 0,
+               'width': width, 'height': height, 'crs': 'EPSG:4326',
+               'transform': transform, 'compress': 'deflate'}
+    land = states.union_all()
+    strip = 512
+    with rs.open(inputs+'/brasil_coverage_'+str(YEAR)+'.tif', 'w', **profile) as dst:
+        for r0 in range(0, height, strip):
+            h = min(strip, height-r0)
+            rows_ = np.arange(r0, r0+h)//patch
+            arr = coarse[rows_][:, np.arange(width)//patch]
+            noise = rng.random(arr.shape) < 0.1
+            arr[noise] = rng.choice(codes, noise.sum())
+            win = rs.windows.Window(0, r0, width, h)
+            out = rasterio.features.geometry_mask(
+                [land], out_shape=(h, width),
+                transform=rs.windows.transform(win, transform))
+            arr[out] = 0
+            dst.write(arr, 1, window=win)
+
+    # Estatísticas do Mapbiomas por UF (em ha), no formato do
+    # mapbiomasStatisticsByUF.csv
+    stats = pd.DataFrame([(uf, c, float(rng.integers(1, 10**6)))
+                          for uf in UFS for c in codes],
+                         columns=['UF', 'class', str(YEAR)])
+    stats.to_csv(inputs+'/mapbiomasStatisticsByUF.csv', index=False)
+
+    open(done, 'w').close()
+    return folder
+
+
+###casos###
+
+#cada caso recebe a pasta dos dados, prepara as entradas (fora da medição) e
+#retorna uma função sem argumentos que executa a função avaliada
+
+def _read(folder, name):
+    return gpd.read_parquet(folder+'/'+name+'.parquet')
+
+
+def _an_cover_br(folder):
+    import analisesObjetivo07 as an
+    aqs, br = _read(folder, 'aqs'), _read(folder, 'br')
+    return lambda: an.aqs_cover_br(aqs, br)
+
+
+def _an_cover_state(folder):
+    import analisesObjetivo07 as an
+    aqs, states = _read(folder, 'aqs'), _read(folder, 'states')
+    return lambda: an.aqs_cover_state(aqs, states, 'HASC_1')
+
+
+def _an_cover_zones(folder):
+    import analisesObjetivo07 as an
+    aqs, states, pop = _read(folder, 'aqs'), _read(folder, 'states'), _read(folder, 'pop_points')
+    return lambda: an.aqs_cover_zones(aqs, states, 'HASC_1', gdf_pop=pop)
+
+
+def _an_cover_sweep(folder):
+    import analisesObjetivo07 as an
+    aqs, states, br = _read(folder, 'aqs'), _read(folder, 'states'), _read(folder, 'br')
+    return lambda: an.aqs_cover_sweep(aqs, states, 'HASC_1', [1000, 2000, 5000, 10000], br)
+
+
+def _an_cover_state_raster(folder):
+    import analisesObjetivo07 as an
+    aqs, states = _read(folder, 'aqs'), _read(folder, 'states')
+    return lambda: an.aqs_cover_state_raster(aqs, states, 'HASC_1', res=250)
+
+
+def _an_urban_area_by_state(folder):
+    import analisesObjetivo07 as an
+    urban, states = _read(folder, 'urban'), _read(folder, 'states')
+    return lambda: an.urban_area_by_state(urban, states)
+
+
+def _cp_pop_cover(folder):
+    import cover_pop as cp
+    aqs, pop = _read(folder, 'aqs'), _read(folder, 'pop_points')
+    return lambda: cp.aqs_pop_cover(aqs, pop)
+
+
+def _cp_pop_cover_state(folder):
+    import cover_pop as cp
+    aqs, pop, states = _read(folder, 'aqs'), _read(folder, 'pop_points'), _read(folder, 'states')
+    return lambda: cp.aqs_pop_cover_state(aqs, pop, states)
+
+
+def _cp_pop_cover_dist(folder):
+    import cover_pop as cp
+    aqs, pop = _read(folder, 'aqs'), _read(folder, 'pop_points')
+    return lambda: cp.aqs_pop_cover_dist(aqs, pop, [1000, 5000, 10000])
+
+
+def _cp_pop_cover_state_dist(folder):
+    import cover_pop as cp
+    aqs, pop, states = _read(folder, 'aqs'), _read(folder, 'pop_points'), _read(folder, 'states')
+    return lambda: cp.aqs_pop_cover_state_dist(aqs, pop, states, [1000, 5000, 10000])
+
+
+def _cp_pop_cover_stream(folder):
+    import cover_pop as cp
+    aqs, states = _read(folder, 'aqs'), _read(folder, 'states')
+    return lambda: cp.aqs_pop_cover_stream(aqs, folder+'/pop_points.parquet', states)
+
+
+def _cp_pop_cover_areal(folder):
+    import cover_pop as cp
+    aqs, states = _read(folder, 'aqs'), _read(folder, 'states')
+    return lambda: cp.aqs_pop_cover_areal(aqs, folder+'/pop_polygons.parquet', states)
+
+
+def _pp_greedy_placement(folder):
+    import placement_pop as pp
+    aqs, pop, states = _read(folder, 'aqs'), _read(folder, 'pop_points'), _read(folder, 'states')
+    cand = pp.candidate_sites(pop, cell_size=5000)
+    return lambda: pp.aqs_greedy_placement(aqs, pop, cand, 5, gdf_states=states, per_state=True)
+
+
+def _slu_station_buffers(folder):
+    import stationsLandUse as slu
+    return lambda: slu.stationBuffers('stations.csv', 1000)
+
+
+def _slu_cut_mapbiomas(folder):
+    import stationsLandUse as slu
+    gdf = slu.stationBuffers('stations.csv', 1000)
+    return lambda: slu.cutMapbiomas(gdf.copy(), YEAR, 'benchmark', 900, clips=None)
+
+
+def _slu_land_use_histogram(folder):
+    import stationsLandUse as slu
+    gdf = slu.stationBuffers('stations.csv', 1000)
+    return lambda: slu.landUseHistogram(gdf.copy(), YEAR, 'benchmarkH', 900)
+
+
+def _slu_cut_mapbiomas_uf(folder):
+    import stationsLandUse as slu
+    gdf = slu.stationBuffers('stations.csv', 1000)
+    return lambda: slu.cutMapbiomas(slu.stationUnionByUF(gdf), YEAR, 'benchmarkUF', 900,
+                                    clips=None)
+
+
+def _slu_stats_by_uf(folder):
+    import stationsLandUse as slu
+    gdf = slu.stationBuffers('stations.csv', 1000)
+    gdfUF = slu.landUseHistogram(slu.stationUnionByUF(gdf), YEAR, 'benchmarkUF', 900)
+    return lambda: slu.statsByUF(gdfUF.copy(), YEAR, 900)
+
+
+CASOS = [
+    ('analisesObjetivo07', 'aqs_cover_br', _an_cover_br),
+    ('analisesObjetivo07', 'aqs_cover_state', _an_cover_state),
+    ('analisesObjetivo07', 'aqs_cover_zones', _an_cover_zones),
+    ('analisesObjetivo07', 'aqs_cover_sweep', _an_cover_sweep),
+    ('analisesObjetivo07', 'aqs_cover_state_raster', _an_cover_state_raster),
+    ('analisesObjetivo07', 'urban_area_by_state', _an_urban_area_by_state),
+    ('cover_pop', 'aqs_pop_cover', _cp_pop_cover),
+    ('cover_pop', 'aqs_pop_cover_state', _cp_pop_cover_state),
+    ('cover_pop', 'aqs_pop_cover_dist', _cp_pop_cover_dist),
+    ('cover_pop', 'aqs_pop_cover_state_dist', _cp_pop_cover_state_dist),
+    ('cover_pop', 'aqs_pop_cover_stream', _cp_pop_cover_stream),
+    ('cover_pop', 'aqs_pop_cover_areal', _cp_pop_cover_areal),
+    ('placement_pop', 'aqs_greedy_placement', _pp_greedy_placement),
+    ('stationsLandUse', 'stationBuffers', _slu_station_buffers),
+    ('stationsLandUse', 'cutMapbiomas', _slu_cut_mapbiomas),
+    ('stationsLandUse', 'landUseHistogram', _slu_land_use_histogram),
+    ('stationsLandUse', 'cutMapbiomas_UF', _slu_cut_mapbiomas_uf),
+    ('stationsLandUse', 'statsByUF', _slu_stats_by_uf),
+]
+
+
+###medição###
+
+def checksum(result):
+    """
+    Função para calcular um checksum da saída de um caso, estável entre
+    execuções: números arredondados a 4 casas decimais, categorias como texto
+    e geometrias em WKB.
+
+    Parâmetros:
+    - result: DataFrame, GeoDataFrame, GeoSeries, Series ou tupla deles.
+
+    Retorna:
+    - Os 16 primeiros caracteres do sha256 da saída.
+    """
+    h = hashlib.sha256()
+    parts = result if isinstance(result, tuple) else (result,)
+    for part in parts:
+        if isinstance(part, pd.Series):
+            part = part.to_frame()
+        if not isinstance(part, pd.DataFrame):
+            h.update(repr(part).encode())
+            continue
+        h.update(','.join(map(str, part.columns)).encode())
+        h.update(','.join(map(str, part.index)).encode())
+        for col in part.columns:
+            values = part[col]
+            if isinstance(values.dtype, gpd.array.GeometryDtype):
+                h.update(b''.join(shapely.to_wkb(values.to_numpy())))
+            elif pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+                h.update(np.round(values.to_numpy(dtype=float), 4).tobytes())
+            else:
+                h.update('\x1f'.join(values.astype(str)).encode())
+    return h.hexdigest()[:16]
+
+
+def _reset_rss_peak():
+    # Zera o pico de memória residente do processo (VmHWM), no Linux
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _rss_peak_mb():
+    # Pico de memória residente do processo (VmHWM do /proc no Linux; nos demais
+    # sistemas, ru_maxrss, que não pode ser zerado)
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])/1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+
+def _run_case(task):
+    """
+    Executa um caso em um processo novo: prepara as entradas e mede cada
+    repetição (tempo, pico de memória do Python com o tracemalloc e pico de
+    memória residente do processo).
+    """
+    folder, index, repeticoes = task
+    modulo, funcao, caso = CASOS[index]
+    os.chdir(folder+'/scripts')
+    sys.path.insert(0, SCRIPTS_DIR)
+    import geocache
+    geocache.ENABLED = False
+
+    run = caso(folder)
+    rows = []
+    for rep in range(repeticoes):
+        _reset_rss_peak()
+        rss_before = _rss_peak_mb()
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter()-start
+        _, py_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss_peak = _rss_peak_mb()
+        rows.append({'repeticao': rep+1,
+                     'tempo_s': round(elapsed, 4),
+                     'pico_py_mb': round(py_peak/2**20, 1),
+                     'pico_rss_mb': round(rss_peak, 1),
+                     'acrescimo_rss_mb': round(rss_peak-rss_before, 1),
+                     'checksum': checksum(result)})
+    return rows
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPTS_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+
+def run_benchmark(escalas=('pequeno',), casos=None, repeticoes=1, output=None):
+    """
+    Função para rodar o benchmark e acrescentar os resultados ao arquivo de
+    resultados.
+
+    Parâmetros:
+    - escalas: Lista de escalas (chaves de ESCALAS).
+    - casos: Lista de trechos do nome dos casos a rodar (ex: ['cover_state']).
+        Se None, roda todos.
+    - repeticoes: Número de repetições de cada caso.
+    - output: Arquivo CSV de resultados. Se None, usa
+        outputs/benchmark/benchmark_results.csv.
+
+    Retorna:
+    - DataFrame com os resultados desta execução.
+    """
+    output = output or _root_dir()+'/outputs/benchmark/benchmark_results.csv'
+    stamp = datetime.now().isoformat(timespec='seconds')
+    commit = _git_commit()
+    selected = [i for i, (modulo, funcao, _) in enumerate(CASOS)
+                if casos is None or any(c in modulo+'.'+funcao for c in casos)]
+    ctx = multiprocessing.get_context('spawn')
+
+    results = []
+    for escala in escalas:
+        folder = make_fixtures(escala)
+        for i in selected:
+            modulo, funcao, _ = CASOS[i]
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+                rows = executor.submit(_run_case, (folder, i, repeticoes)).result()
+            for row in rows:
+                row.update({'data': stamp, 'commit': commit, 'escala': escala,
+                            'modulo': modulo, 'funcao': funcao})
+                results.append(row)
+            best = min(r['tempo_s'] for r in rows)
+            print('%-8s %-20s %-26s %9.3f s %8.1f MB  %s' % (
+                escala, modulo, funcao, best, max(r['pico_rss_mb'] for r in rows),
+                rows[-1]['checksum']))
+
+    df = pd.DataFrame(results, columns=['data', 'commit', 'escala', 'modulo', 'funcao',
+                                        'repeticao', 'tempo_s', 'pico_py_mb',
+                                        'pico_rss_mb', 'acrescimo_rss_mb', 'checksum'])
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    df.to_csv(output, mode='a', header=not os.path.exists(output), index=False)
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark do Objetivo 07 com dados sintéticos.')
+    parser.add_argument('--escalas', nargs='+', default=['pequeno'], choices=list(ESCALAS))
+    parser.add_argument('--casos', nargs='+', default=None,
+                        help='Trechos do nome dos casos (modulo.funcao) a rodar')
+    parser.add_argument('--repeticoes', type=int, default=1)
+    parser.add_argument('--output', default=None, help='Arquivo CSV de resultados')
+    args = parser.parse_args()
+    run_benchmark(args.escalas, args.casos, args.repeticoes, args.output)
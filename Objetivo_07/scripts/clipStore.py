@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:40:05 2026
+
+Armazenamento dos recortes do Mapbiomas por estação em um único contêiner, em
+vez de um GeoTIFF por estação.
+
+O contêiner tem dois arquivos:
+    <caminho>.bin  : os recortes em sequência, cada um comprimido com zlib;
+    <caminho>.json : o índice, com o CRS e o nodata do raster e, para cada
+                     recorte, o nome da estação, a posição no .bin, o tipo, a
+                     forma (bandas, linhas, colunas) e o transform.
+
+Os recortes são comprimidos e gravados por uma thread em segundo plano, então
+quem chama o put não espera pela escrita em disco.
+"""
+
+import os
+import json
+import zlib
+import queue
+import threading
+import numpy as np
+from affine import Affine
+
+
+class ClipStore:
+    """
+    Contêiner de recortes gravado em segundo plano.
+
+    Parameters
+    ----------
+    path : path
+        Caminho do contêiner, sem extensão.
+    crs : str
+        CRS do raster recortado.
+    nodata : float
+        Valor nodata do raster recortado.
+    maxQueue : int
+        Número máximo de recortes esperando para serem gravados. O put
+        bloqueia quando a fila está cheia, limitando a memória.
+    level : int
+        Nível de compressão do zlib.
+
+    """
+
+    def __init__(self,path,crs=None,nodata=None,maxQueue=64,level=6):
+        self.path = path
+        self.crs = None if crs is None else str(crs)
+        self.nodata = nodata
+        self.level = level
+        self.clips = []
+        self._error = None
+        self._file = open(path+'.bin','wb')
+        self._queue = queue.Queue(maxsize=maxQueue)
+        self._thread = threading.Thread(target=self._writer,daemon=True)
+        self._thread.start()
+
+    def put(self,name,image,transform):
+        """
+        Coloca um recorte (array bandas x linhas x colunas e transform) na
+        fila de gravação.
+        """
+        if self._error is not None:
+            raise self._error
+        self._queue.put((name,np.ascontiguousarray(image),transform))
+
+    def _writer(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._error is not None:
+                continue
+            name, image, transform = item
+            try:
+                data = zlib.compress(image.tobytes(),self.level)
+                offset = self._file.tell()
+                self._file.write(data)
+                self.clips.append({'name':name,'offset':offset,
+                                   'nbytes':len(data),
+                                   'dtype':image.dtype.str,
+                                   'shape':list(image.shape),
+                                   'transform':list(transform)[:6]})
+            except Exception as e:
+                self._error = e
+
+    def close(self):
+        """
+        Espera a gravação dos recortes da fila e grava o índice.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+        if self._error is not None:
+            raise self._error
+        with open(self.path+'.json','w') as f:
+            json.dump({'crs':self.crs,'nodata':self.nodata,
+                       'clips':self.clips},f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+
+def readIndex(path):
+    """
+    Lê o índice de um contêiner de recortes.
+    """
+    with open(path+'.json') as f:
+        return json.load(f)
+
+def readClip(path,key,index=None):
+    """
+    Lê um recorte do contêiner.
+
+    Parameters
+    ----------
+    path : path
+        Caminho do contêiner, sem extensão.
+    key : str or int
+        Nome da estação (primeiro recorte com esse nome) ou posição do
+        recorte no índice.
+    index : dict
+        Índice já lido com o readIndex, para não relê-lo a cada recorte.
+
+    Returns
+    -------
+    image : numpy array
+        Recorte (bandas x linhas x colunas).
+    transform : Affine
+        Transform do recorte.
+
+    """
+    index = readIndex(path) if index is None else index
+    if isinstance(key,str):
+        matches = [clip for clip in index['clips'] if clip['name']==key]
+        if not matches:
+            raise KeyError(key)
+        clip = matches[0]
+    else:
+        clip = index['clips'][key]
+    with open(path+'.bin','rb') as f:
+        f.seek(clip['offset'])
+        data = zlib.decompress(f.read(clip['nbytes']))
+    image = np.frombuffer(data,dtype=np.dtype(clip['dtype'])).reshape(clip['shape'])
+    return image, Affine(*clip['transform'])
+
+def removeClips(path,names):
+    """
+    Remove do contêiner os recortes das estações em names, regravando o .bin
+    só com os recortes restantes (compactado) e o índice.
+
+    Returns
+    -------
+    removed : int
+        Número de recortes removidos.
+
+    """
+    names = set(names)
+    index = readIndex(path)
+    keep = [clip for clip in index['clips'] if clip['name'] not in names]
+    removed = len(index['clips'])-len(keep)
+    if removed==0:
+        return 0
+    with open(path+'.bin','rb') as src, open(path+'.bin.tmp','wb') as dest:
+        for clip in keep:
+            src.seek(clip['offset'])
+            data = src.read(clip['nbytes'])
+            clip['offset'] = dest.tell()
+            dest.write(data)
+    os.replace(path+'.bin.tmp',path+'.bin')
+    index['clips'] = keep
+    with open(path+'.json','w') as f:
+        json.dump(index,f)
+    return removed
@@ -5,18 +5,27 @@ Created on Fri Oct  4 11:45:51 2024
 @author: Camilo Bastos Ribeiro
 """
 
+import json
 import geopandas as gpd
 import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
+import pyogrio
+import pyarrow.parquet as pq
+import shapely
 from shapely.ops import unary_union
+import geocache
+import geodesy
+import instrument
+import inventoryDelta
 
 
 ###dados de entrada###
 
-#gdf_pop = gpd com população geolocalizada (epsg=5880)
-#gdf_aqs = gdf com estações geolocalizadas (epsg=5880)
-#gdf_states = gdf com estados do Brasil (epsg=5880)
-#buffer defalt = 5000m
+#gdf_pop = gpd com população geolocalizada (geodesy.WORK_CRS)
+#gdf_aqs = gdf com estações geolocalizadas (geodesy.WORK_CRS)
+#gdf_states = gdf com estados do Brasil (geodesy.WORK_CRS)
+#buffer defalt = 5000m (raio no terreno, contrato de CRS em geodesy.py)
 
 #%%
 
@@ -25,15 +34,18 @@ from shapely.ops import unary_union
 #função calcula o percentual da população coberta pelas estações (por tipo)
 #em relação ao total da população no Brasil
 
+@instrument.timed()
 def aqs_pop_cover(gdf_aqs, gdf_pop, buffer_dist=5000):
     results = []
     pop_total = gdf_pop['PopResid'].sum()
     
+    #buffers dissolvidos por tipo, reaproveitados do cache (geocache)
+    dissolved = geocache.dissolved_buffers(gdf_aqs, buffer_dist, 'Tipo')
+    
     for tipo in gdf_aqs['Tipo'].unique():
-        gdf_aqs_tipo = gdf_aqs[gdf_aqs['Tipo'] == tipo]
-        gdf_aqs_tipo['buffer'] = gdf_aqs_tipo.geometry.buffer(buffer_dist)
-        buffers_dissolved = gdf_aqs_tipo['buffer'].unary_union
-        gdf_pop_within = gdf_pop[gdf_pop.geometry.within(buffers_dissolved)]
+        buffers_dissolved = geocache.group_geometry(dissolved, 'Tipo', tipo)
+        with instrument.stage('predicados_espaciais'):
+            gdf_pop_within = gdf_pop[gdf_pop.geometry.within(buffers_dissolved)]
         pop_within = gdf_pop_within['PopResid'].sum()
         pop_perc_within = (pop_within / pop_total) * 100
         
@@ -51,27 +63,41 @@ def aqs_pop_cover(gdf_aqs, gdf_pop, buffer_dist=5000):
 #função calcula o percentual da população coberta pelas estações (por tipo)
 #em relação ao total da população em cada estado no Brasil
 
+@instrument.timed()
 def aqs_pop_cover_state(gdf_aqs, gdf_pop, gdf_states, buffer_dist=5000):
     
     results = []
-    gdf_aqs['buffer'] = gdf_aqs.geometry.buffer(buffer_dist)
     
-    for idx, state in gdf_states.iterrows():
+    #atribuição de cada ponto de população e de cada estação ao seu estado
+    #com uma única consulta no índice espacial (STRtree) dos estados
+    states_geom = gdf_states.geometry.reset_index(drop=True)
+    with instrument.stage('predicados_espaciais'):
+        pop_idx, pop_state = states_geom.sindex.query(gdf_pop.geometry, predicate='within')
+        aqs_idx, aqs_state = states_geom.sindex.query(gdf_aqs.geometry, predicate='within')
+    instrument.count('estacoes_processadas', len(gdf_aqs))
+    
+    #buffers dissolvidos por estado e tipo, reaproveitados do cache (geocache)
+    gdf_aqs_in_state = gdf_aqs.iloc[aqs_idx][['Tipo', gdf_aqs.geometry.name]]
+    gdf_aqs_in_state['state_pos'] = aqs_state
+    dissolved = geocache.dissolved_buffers(gdf_aqs_in_state, buffer_dist, ['state_pos', 'Tipo'])
+    
+    for i, (idx, state) in enumerate(gdf_states.iterrows()):
         state_name = state['HASC_1']
-        state_geom = state['geometry']
-        gdf_pop_state = gdf_pop[gdf_pop.geometry.within(state_geom)]
-        gdf_aqs_state = gdf_aqs[gdf_aqs.geometry.within(state_geom)]
+        pop_members = pop_idx[pop_state == i]
+        gdf_pop_state = gdf_pop.iloc[pop_members]
+        gdf_aqs_state = gdf_aqs.iloc[aqs_idx[aqs_state == i]]
         pop_total_state = gdf_pop_state['PopResid'].sum() if not gdf_pop_state.empty else 0
-        
-        print(state)
 
         if not gdf_aqs_state.empty:
             tipos_presentes = gdf_aqs_state['Tipo'].unique().tolist()
             for tipo in ['Indicativa', 'Referência']:
                 if tipo in tipos_presentes:
-                    gdf_aqs_tipo = gdf_aqs_state[gdf_aqs_state['Tipo'] == tipo]
-                    buffers_dissolved = gdf_aqs_tipo['buffer'].unary_union
-                    gdf_pop_within = gdf_pop_state[gdf_pop_state.geometry.within(buffers_dissolved)]
+                    buffers_dissolved = geocache.group_geometry(dissolved, ['state_pos', 'Tipo'], (i, tipo))
+                    #pontos dentro dos buffers via índice espacial da população,
+                    #mantendo apenas os que estão no estado
+                    with instrument.stage('predicados_espaciais'):
+                        within_idx = gdf_pop.sindex.query(buffers_dissolved, predicate='contains')
+                    gdf_pop_within = gdf_pop.iloc[np.intersect1d(pop_members, within_idx)]
                     pop_within_buffers = gdf_pop_within['PopResid'].sum() if not gdf_pop_within.empty else 0
                     
                     pop_perc_within_buffers = (pop_within_buffers / pop_total_state * 100) if pop_total_state > 0 else 0
@@ -96,4 +122,404 @@ def aqs_pop_cover_state(gdf_aqs, gdf_pop, gdf_states, buffer_dist=5000):
                     '%_pop_cover': 0
                 })
     
-    return pd.DataFrame(results)
\ No newline at end of file
+    return pd.DataFrame(results)
+
+###recálculo incremental da cobertura por estado (delta)###
+
+#compara o inventário de estações com o da execução anterior (inventoryDelta,
+#chave ESTAÇÃO + coordenadas + Tipo) e recalcula o aqs_pop_cover_state só para
+#os estados que contêm estações alteradas (posições novas e antigas). como a
+#cobertura de um estado só depende das estações dentro dele, os estados
+#recalculados usam as mesmas estações e os mesmos pontos de população do
+#cálculo completo e o resultado é igual. se a população, os estados ou o raio
+#mudaram, recalcula tudo.
+
+@instrument.timed()
+def aqs_pop_cover_state_delta(gdf_aqs, gdf_pop, gdf_states, buffer_dist=5000, state_dir=None):
+    
+    name = 'aqs_pop_cover_state'
+    params = [name, geocache.gdf_hash(gdf_pop), geocache.gdf_hash(gdf_states),
+              buffer_dist, str(gdf_aqs.crs)]
+    inventory = gdf_aqs[[inventoryDelta.KEY, 'Tipo', gdf_aqs.geometry.name]]
+    prev_inventory, prev_result = inventoryDelta.load_state(name, params, state_dir)
+    
+    if prev_result is None:
+        result = aqs_pop_cover_state(gdf_aqs, gdf_pop, gdf_states, buffer_dist)
+    else:
+        changed_new, changed_old = inventoryDelta.diff_inventory(inventory, prev_inventory, ['Tipo'])
+        
+        #estados que contêm as estações alteradas
+        state_geoms = gdf_states.geometry.to_numpy()
+        touched = np.concatenate([gdf_aqs.geometry.to_numpy()[changed_new],
+                                  prev_inventory.geometry.to_numpy()[changed_old]])
+        zones = inventoryDelta.affected_zones(state_geoms, touched)
+        print('Cobertura incremental: ' + str(len(zones)) + '/' + str(len(gdf_states)) +
+              ' estados recalculados')
+        
+        result = prev_result.copy()
+        if len(zones):
+            #estações e pontos de população dentro dos estados afetados
+            with instrument.stage('predicados_espaciais'):
+                aqs_near = inventoryDelta.affected_zones(gdf_aqs.geometry.to_numpy(), state_geoms[zones])
+                _, pop_near = gdf_pop.sindex.query(state_geoms[zones], predicate='contains')
+            part = aqs_pop_cover_state(gdf_aqs.iloc[aqs_near].copy(),
+                                       gdf_pop.iloc[np.unique(pop_near)],
+                                       gdf_states.iloc[zones], buffer_dist)
+            
+            #duas linhas por estado (Indicativa, Referência), na ordem dos estados
+            rows = (2 * zones[:, None] + np.arange(2)).ravel()
+            result = pd.concat([result.drop(index=rows), part.set_axis(rows)]).sort_index()
+    
+    inventoryDelta.save_state(name, params, inventory, result, state_dir)
+    return result
+
+###distância mínima de cada ponto de população às estações (por tipo)###
+
+#em vez de dissolver os buffers e testar within, calcula uma única vez a
+#distância de cada ponto até a estação mais próxima de cada tipo (índice
+#espacial + distância geodésica). a cobertura para qualquer buffer_dist é
+#dist <= buffer_dist, então varrer vários raios (1, 2, 5, 10 km) custa uma única
+#construção de índice. o círculo é exato (o buffer poligonal é um polígono
+#inscrito no círculo), então pontos a poucos metros da borda podem diferir do
+#modo com unary_union. geometrias de população que não são pontos são
+#representadas pelo centroide.
+
+#a distância é a geodésica (geodesy): sem max_dist, a estação mais próxima no
+#CRS dá um limite para a distância geodésica e as estações até esse limite
+#(com a folga geodesy.MAX_SCALE) são comparadas.
+
+def _min_dist(aqs_geom, pop_geom, max_dist=None):
+    dist = np.full(len(pop_geom), np.inf)
+    if len(aqs_geom) == 0 or len(pop_geom) == 0:
+        return dist
+    crs = aqs_geom.crs
+    aqs_tree = shapely.STRtree(aqs_geom.to_numpy())
+    pop_points = pop_geom.to_numpy()
+    pop_lon, pop_lat = geodesy.lonlat(pop_points, crs)
+    aqs_lon, aqs_lat = geodesy.lonlat(aqs_tree.geometries, crs)
+    if max_dist is None:
+        pop_i, aqs_i = aqs_tree.query_nearest(pop_points, all_matches=False)
+        max_dist = np.empty(len(pop_points))
+        max_dist[pop_i] = geodesy.distance(pop_lon[pop_i], pop_lat[pop_i],
+                                           aqs_lon[aqs_i], aqs_lat[aqs_i])
+    pop_i, _, pop_d = geodesy.dwithin(aqs_tree, pop_points, max_dist, crs,
+                                      tree_lonlat=(aqs_lon, aqs_lat))
+    np.minimum.at(dist, pop_i, pop_d)
+    return dist
+
+
+def _pop_points(gdf_pop):
+    if (gdf_pop.geometry.geom_type == 'Point').all():
+        return gdf_pop.geometry
+    return gdf_pop.geometry.centroid
+
+
+#função retorna um DataFrame (mesmo índice do gdf_pop) com a distância mínima
+#de cada ponto até a estação mais próxima de cada tipo. distâncias maiores que
+#max_dist (se informado) ficam como inf.
+
+@instrument.timed()
+def aqs_pop_dist(gdf_aqs, gdf_pop, max_dist=None):
+    pop_geom = _pop_points(gdf_pop)
+    dist = pd.DataFrame(index=gdf_pop.index)
+    for tipo in gdf_aqs['Tipo'].unique():
+        aqs_geom = gdf_aqs.geometry[gdf_aqs['Tipo'] == tipo]
+        dist[tipo] = _min_dist(aqs_geom, pop_geom, max_dist)
+    return dist
+
+
+#equivalente ao aqs_pop_cover para uma lista de raios, em formato longo
+#(buffer_dist x Tipo)
+
+@instrument.timed()
+def aqs_pop_cover_dist(gdf_aqs, gdf_pop, buffer_dists=(5000,)):
+    results = []
+    pop_total = gdf_pop['PopResid'].sum()
+    dist = aqs_pop_dist(gdf_aqs, gdf_pop, max_dist=max(buffer_dists))
+    
+    for buffer_dist in buffer_dists:
+        for tipo in gdf_aqs['Tipo'].unique():
+            pop_within = gdf_pop['PopResid'][dist[tipo].to_numpy() <= buffer_dist].sum()
+            pop_perc_within = (pop_within / pop_total) * 100
+            
+            results.append({
+                'buffer_dist': buffer_dist,
+                'Tipo': tipo,
+                'pop_total': pop_total,
+                'pop_cover': pop_within,
+                '%_pop_cover': pop_perc_within
+            })
+
+    return pd.DataFrame(results)
+
+
+#equivalente ao aqs_pop_cover_state para uma lista de raios, em formato longo
+#(buffer_dist x state x tipo). como no aqs_pop_cover_state, só as estações
+#dentro do estado contam para a cobertura da população do estado.
+
+@instrument.timed()
+def aqs_pop_cover_state_dist(gdf_aqs, gdf_pop, gdf_states, buffer_dists=(5000,)):
+    
+    results = []
+    max_dist = max(buffer_dists)
+    pop_geom = _pop_points(gdf_pop)
+    
+    states_geom = gdf_states.geometry.reset_index(drop=True)
+    pop_idx, pop_state = states_geom.sindex.query(gdf_pop.geometry, predicate='within')
+    aqs_idx, aqs_state = states_geom.sindex.query(gdf_aqs.geometry, predicate='within')
+    
+    #distância mínima por estado e tipo: uma consulta nearest por estado/tipo
+    state_rows = []
+    for i, (idx, state) in enumerate(gdf_states.iterrows()):
+        pop_members = pop_idx[pop_state == i]
+        gdf_aqs_state = gdf_aqs.iloc[aqs_idx[aqs_state == i]]
+        pop_state_values = gdf_pop['PopResid'].iloc[pop_members]
+        dist = {}
+        for tipo in ['Indicativa', 'Referência']:
+            aqs_geom = gdf_aqs_state.geometry[gdf_aqs_state['Tipo'] == tipo]
+            dist[tipo] = _min_dist(aqs_geom, pop_geom.iloc[pop_members], max_dist)
+        state_rows.append((state['HASC_1'], pop_state_values, dist))
+    
+    for buffer_dist in buffer_dists:
+        for state_name, pop_state_values, dist in state_rows:
+            pop_total_state = pop_state_values.sum() if not pop_state_values.empty else 0
+            for tipo in ['Indicativa', 'Referência']:
+                pop_within = pop_state_values[dist[tipo] <= buffer_dist]
+                pop_within_buffers = pop_within.sum() if not pop_within.empty else 0
+                pop_perc_within_buffers = (pop_within_buffers / pop_total_state * 100) if pop_total_state > 0 else 0
+                
+                results.append({
+                    'buffer_dist': buffer_dist,
+                    'state': state_name,
+                    'tipo': tipo,
+                    'pop_total': pop_total_state,
+                    'pop_cover': pop_within_buffers,
+                    '%_pop_cover': pop_perc_within_buffers
+                })
+    
+    return pd.DataFrame(results)
+
+
+###leitura da população em blocos###
+
+#lê a camada de população em blocos de chunk_size feições, sem carregar a
+#camada inteira. arquivos parquet/geoparquet são lidos por lote (iter_batches,
+#row group a row group); os demais formatos (gpkg, shp...) com o pyogrio
+#(skip_features/max_features). um GeoDataFrame já carregado também é aceito e
+#é devolvido em fatias.
+
+def read_pop_chunks(pop_source, chunk_size=500000, pop_col='PopResid'):
+    if isinstance(pop_source, gpd.GeoDataFrame):
+        for start in range(0, len(pop_source), chunk_size):
+            yield pop_source.iloc[start:start + chunk_size][[pop_col, pop_source.geometry.name]]
+        return
+
+    if str(pop_source).lower().endswith(('.parquet', '.geoparquet')):
+        pf = pq.ParquetFile(pop_source)
+        geo = json.loads(pf.schema_arrow.metadata[b'geo'])
+        geom_col = geo['primary_column']
+        crs = geo['columns'][geom_col].get('crs', 'OGC:CRS84')
+        for batch in pf.iter_batches(batch_size=chunk_size, columns=[pop_col, geom_col]):
+            yield gpd.GeoDataFrame(
+                {pop_col: batch.column(pop_col).to_numpy(zero_copy_only=False)},
+                geometry=shapely.from_wkb(batch.column(geom_col).to_numpy(zero_copy_only=False)),
+                crs=crs)
+        return
+
+    n_features = pyogrio.read_info(pop_source)['features']
+    for start in range(0, n_features, chunk_size):
+        yield pyogrio.read_dataframe(pop_source, columns=[pop_col],
+                                     skip_features=start, max_features=chunk_size)
+
+
+###cobertura da população lendo a camada em blocos###
+
+#equivalente ao aqs_pop_cover (gdf_states=None) ou ao aqs_pop_cover_state
+#(gdf_states informado), mas lendo a população em blocos (read_pop_chunks) e
+#acumulando a população total e coberta por estado/tipo a cada bloco. em
+#memória ficam só um bloco da população (com o seu índice espacial) e os
+#buffers dissolvidos das estações.
+
+@instrument.timed()
+def aqs_pop_cover_stream(gdf_aqs, pop_source, gdf_states=None, buffer_dist=5000,
+                         chunk_size=500000, pop_col='PopResid'):
+    
+    tipos = ['Indicativa', 'Referência']
+    if gdf_states is None:
+        tipos = gdf_aqs['Tipo'].unique().tolist()
+        dissolved = geocache.dissolved_buffers(gdf_aqs, buffer_dist, 'Tipo')
+        n_zones = 1
+    else:
+        states_geom = gdf_states.geometry.reset_index(drop=True)
+        aqs_idx, aqs_state = states_geom.sindex.query(gdf_aqs.geometry, predicate='within')
+        gdf_aqs_in_state = gdf_aqs.iloc[aqs_idx][['Tipo', gdf_aqs.geometry.name]]
+        gdf_aqs_in_state['state_pos'] = aqs_state
+        dissolved = geocache.dissolved_buffers(gdf_aqs_in_state, buffer_dist, ['state_pos', 'Tipo'])
+        n_zones = len(gdf_states)
+    
+    #cada buffer dissolvido vira uma posição (zona, tipo) dos acumuladores
+    buffers = dissolved.geometry.values
+    buf_zone = dissolved['state_pos'].to_numpy() if gdf_states is not None else np.zeros(len(dissolved), dtype=int)
+    buf_tipo = np.array([tipos.index(t) if t in tipos else -1 for t in dissolved['Tipo']])
+    pop_total = np.zeros(n_zones)
+    pop_cover = np.zeros((n_zones, len(tipos)))
+    
+    for chunk in read_pop_chunks(pop_source, chunk_size, pop_col):
+        if chunk.crs != gdf_aqs.crs:
+            chunk = chunk.to_crs(gdf_aqs.crs)
+        pop = np.nan_to_num(chunk[pop_col].to_numpy(dtype=float))
+        geoms = chunk.geometry.values
+        #índice espacial do bloco, consultado com os buffers e os estados
+        #(contains com a geometria de consulta preparada)
+        instrument.count('feicoes_lidas', len(geoms))
+        with instrument.stage('predicados_espaciais'):
+            chunk_tree = shapely.STRtree(geoms)
+            buf_j, pt_i = chunk_tree.query(buffers, predicate='contains')
+        
+        if gdf_states is None:
+            pop_total[0] += pop.sum()
+        else:
+            #só conta a cobertura do buffer do estado em que o ponto está
+            with instrument.stage('predicados_espaciais'):
+                st_j, st_i = chunk_tree.query(states_geom.values, predicate='contains')
+            pop_total += np.bincount(st_j, weights=pop[st_i], minlength=n_zones)
+            pt_state = np.full(len(geoms), -1)
+            pt_state[st_i] = st_j
+            keep = pt_state[pt_i] == buf_zone[buf_j]
+            pt_i, buf_j = pt_i[keep], buf_j[keep]
+        
+        keep = buf_tipo[buf_j] >= 0
+        np.add.at(pop_cover, (buf_zone[buf_j[keep]], buf_tipo[buf_j[keep]]), pop[pt_i[keep]])
+    
+    results = []
+    if gdf_states is None:
+        for k, tipo in enumerate(tipos):
+            results.append({
+                'Tipo': tipo,
+                'pop_total': pop_total[0],
+                'pop_cover': pop_cover[0, k],
+                '%_pop_cover': (pop_cover[0, k] / pop_total[0]) * 100
+            })
+        return pd.DataFrame(results)
+    
+    for i, state_name in enumerate(gdf_states['HASC_1']):
+        for k, tipo in enumerate(tipos):
+            results.append({
+                'state': state_name,
+                'tipo': tipo,
+                'pop_total': pop_total[i],
+                'pop_cover': pop_cover[i, k],
+                '%_pop_cover': (pop_cover[i, k] / pop_total[i] * 100) if pop_total[i] > 0 else 0
+            })
+    
+    return pd.DataFrame(results)
+
+
+###cobertura da população ponderada pela área###
+
+#para camadas de população em polígonos (setores censitários, grade 200 m), em
+#vez de contar o polígono só quando está inteiro dentro dos buffers, atribui a
+#população proporcionalmente à fração da área do polígono coberta. os polígonos
+#candidatos vêm do índice espacial do bloco (consultado com as partes da
+#cobertura, preparadas); polígonos inteiramente dentro de uma parte entram com
+#fração 1 sem calcular a interseção. pontos e linhas (área zero) contam como
+#cobertos (fração 1) se estão no interior da cobertura.
+
+def _covered_fraction(pop_geoms, pop_tree, coverage):
+    frac = np.zeros(len(pop_geoms))
+    parts = shapely.get_parts(coverage)
+    parts = parts[~shapely.is_empty(parts)]
+    if len(parts) == 0 or len(pop_geoms) == 0:
+        return frac
+    shapely.prepare(parts)
+    with instrument.stage('predicados_espaciais'):
+        part_i, pop_i = pop_tree.query(parts, predicate='intersects')
+    instrument.count('pares_intersectados', len(pop_i))
+    
+    area = shapely.area(pop_geoms)
+    inside = shapely.contains_properly(parts[part_i], pop_geoms[pop_i])
+    inter = np.where(inside, area[pop_i], 0.0)
+    cut = ~inside & (area[pop_i] > 0)
+    inter[cut] = shapely.area(shapely.intersection(parts[part_i[cut]], pop_geoms[pop_i[cut]]))
+    covered = np.bincount(pop_i, weights=inter, minlength=len(pop_geoms))
+    
+    areal = area > 0
+    frac[areal] = np.minimum(covered[areal] / area[areal], 1)
+    hit = np.bincount(pop_i[inside], minlength=len(pop_geoms)) > 0
+    frac[~areal] = hit[~areal]
+    return frac
+
+
+#equivalente ao aqs_pop_cover (gdf_states=None) ou ao aqs_pop_cover_state
+#(gdf_states informado) com pop_cover fracionário. por estado, tanto a
+#população total quanto a coberta são ponderadas pela área: um setor dividido
+#entre dois estados conta para cada um na proporção da sua área, e a cobertura
+#de cada estado usa só os buffers das suas estações, recortados pelo estado.
+#a população é lida em blocos (read_pop_chunks), então pop_source pode ser o
+#gdf_pop ou o caminho de um arquivo.
+
+@instrument.timed()
+def aqs_pop_cover_areal(gdf_aqs, pop_source, gdf_states=None, buffer_dist=5000,
+                        chunk_size=200000, pop_col='PopResid'):
+    
+    tipos = ['Indicativa', 'Referência']
+    if gdf_states is None:
+        tipos = gdf_aqs['Tipo'].unique().tolist()
+        dissolved = geocache.dissolved_buffers(gdf_aqs, buffer_dist, 'Tipo')
+        zones = []
+        covers = [(0, k, geocache.group_geometry(dissolved, 'Tipo', tipo))
+                  for k, tipo in enumerate(tipos)]
+        n_zones = 1
+    else:
+        states_geom = gdf_states.geometry.reset_index(drop=True)
+        aqs_idx, aqs_state = states_geom.sindex.query(gdf_aqs.geometry, predicate='within')
+        gdf_aqs_in_state = gdf_aqs.iloc[aqs_idx][['Tipo', gdf_aqs.geometry.name]]
+        gdf_aqs_in_state['state_pos'] = aqs_state
+        dissolved = geocache.dissolved_buffers(gdf_aqs_in_state, buffer_dist, ['state_pos', 'Tipo'])
+        zones = list(states_geom.values)
+        #buffers de cada estado/tipo recortados pelo estado
+        covers = [(i, tipos.index(tipo), shapely.intersection(geom, zones[i]))
+                  for i, tipo, geom in zip(dissolved['state_pos'], dissolved['Tipo'], dissolved.geometry)
+                  if tipo in tipos]
+        n_zones = len(zones)
+    
+    pop_total = np.zeros(n_zones)
+    pop_cover = np.zeros((n_zones, len(tipos)))
+    
+    for chunk in read_pop_chunks(pop_source, chunk_size, pop_col):
+        if chunk.crs != gdf_aqs.crs:
+            chunk = chunk.to_crs(gdf_aqs.crs)
+        pop = np.nan_to_num(chunk[pop_col].to_numpy(dtype=float))
+        geoms = chunk.geometry.values
+        pop_tree = shapely.STRtree(geoms)
+        instrument.count('feicoes_lidas', len(geoms))
+        
+        if gdf_states is None:
+            pop_total[0] += pop.sum()
+        for i, zone in enumerate(zones):
+            pop_total[i] += (pop * _covered_fraction(geoms, pop_tree, zone)).sum()
+        for i, k, cover in covers:
+            pop_cover[i, k] += (pop * _covered_fraction(geoms, pop_tree, cover)).sum()
+    
+    results = []
+    if gdf_states is None:
+        for k, tipo in enumerate(tipos):
+            results.append({
+                'Tipo': tipo,
+                'pop_total': pop_total[0],
+                'pop_cover': pop_cover[0, k],
+                '%_pop_cover': (pop_cover[0, k] / pop_total[0]) * 100
+            })
+        return pd.DataFrame(results)
+    
+    for i, state_name in enumerate(gdf_states['HASC_1']):
+        for k, tipo in enumerate(tipos):
+            results.append({
+                'state': state_name,
+                'tipo': tipo,
+                'pop_total': pop_total[i],
+                'pop_cover': pop_cover[i, k],
+                '%_pop_cover': (pop_cover[i, k] / pop_total[i] * 100) if pop_total[i] > 0 else 0
+            })
+    
+    return pd.DataFrame(results)
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:12:40 2026
+
+Cache de geometrias compartilhado pelos scripts do Objetivo 07.
+
+Os buffers das estações e as uniões (dissolve) por tipo de estação ou por UF são
+guardados em memória (LRU) e em disco (GeoParquet), com uma chave calculada a
+partir do conteúdo das entradas (hash do arquivo ou do GeoDataFrame), do CRS, da
+distância do buffer e da chave de agrupamento. Assim as geometrias são calculadas
+uma vez por revisão do inventário de estações e reutilizadas entre o
+stationsLandUse, o analisesObjetivo07 e o cover_pop e entre execuções.
+"""
+
+import os
+import hashlib
+from collections import OrderedDict
+import pandas as pd
+import geopandas as gpd
+import shapely
+import geodesy
+import instrument
+
+
+# Liga/desliga o cache (memória e disco)
+ENABLED = True
+
+# Pasta do cache em disco. Se None, usa <raiz>/outputs/cache, como os outputs
+# dos scripts (raiz = pasta acima da pasta de execução)
+CACHE_DIR = None
+
+# Número máximo de itens mantidos em memória
+MAX_ITEMS = 32
+
+_memory = OrderedDict()
+_events = []
+
+
+def file_hash(path):
+    """
+    Hash (sha256) do conteúdo de um arquivo.
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def gdf_hash(*gdfs):
+    """
+    Hash (sha256) do conteúdo de GeoDataFrames: CRS, geometrias (WKB) e
+    atributos.
+    """
+    h = hashlib.sha256()
+    for gdf in gdfs:
+        h.update(str(gdf.crs).encode())
+        h.update(b''.join(shapely.to_wkb(gdf.geometry.to_numpy())))
+        attrs = [c for c in gdf.columns
+                 if not isinstance(gdf[c].dtype, gpd.array.GeometryDtype)]
+        h.update(','.join(map(str, attrs)).encode())
+        if attrs:
+            h.update(pd.util.hash_pandas_object(gdf[attrs], index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def cache_key(*parts):
+    """
+    Chave curta a partir de uma lista de partes (hashes, CRS, parâmetros).
+    """
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:16]
+
+
+def _cache_dir(cache_dir=None):
+    if cache_dir is not None:
+        return cache_dir
+    if CACHE_DIR is not None:
+        return CACHE_DIR
+    return os.path.dirname(os.getcwd())+'/outputs/cache'
+
+
+def cached(name, key_parts, builder, cache_dir=None):
+    """
+    Retorna o GeoDataFrame do cache ou o calcula com builder() e o guarda.
+
+    Parameters
+    ----------
+    name : str
+        Nome do artefato (prefixo do arquivo e linha do relatório).
+    key_parts : list
+        Partes da chave (hashes das entradas, CRS, parâmetros).
+    builder : function
+        Função sem argumentos que calcula o GeoDataFrame.
+    cache_dir : path
+        Pasta do cache em disco. Se None, usa CACHE_DIR.
+
+    Returns
+    -------
+    gdf : geodataframe
+        Cópia do GeoDataFrame guardado.
+
+    """
+    if not ENABLED:
+        _events.append((name, 'desligado'))
+        return builder()
+
+    key = name+'_'+cache_key(*key_parts)
+    if key in _memory:
+        _memory.move_to_end(key)
+        _events.append((name, 'memória'))
+        return _memory[key].copy()
+
+    path = os.path.join(_cache_dir(cache_dir), key+'.parquet')
+    if os.path.exists(path):
+        gdf = gpd.read_parquet(path)
+        _events.append((name, 'disco'))
+    else:
+        gdf = builder()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        gdf.to_parquet(path)
+        _events.append((name, 'calculado'))
+
+    _memory[key] = gdf
+    while len(_memory) > MAX_ITEMS:
+        _memory.popitem(last=False)
+    return gdf.copy()
+
+
+def dissolved_buffers(gdf, buffer_dist, by, cache_dir=None):
+    """
+    União (dissolve) dos buffers geodésicos de raio buffer_dist (m no terreno,
+    ver geodesy) das estações do gdf, por grupo.
+
+    Parameters
+    ----------
+    gdf : geodataframe
+        Geodataframe com as estações (pontos), no CRS de trabalho
+        (geodesy.WORK_CRS).
+    buffer_dist : float
+        Raio do buffer em metros.
+    by : str or list
+        Coluna(s) de agrupamento (ex. 'Tipo', 'ESTADO').
+    cache_dir : path
+        Pasta do cache em disco. Se None, usa CACHE_DIR.
+
+    Returns
+    -------
+    dissolved : geodataframe
+        Uma linha por grupo, com as colunas de agrupamento e a geometria
+        dissolvida.
+
+    """
+    by = [by] if isinstance(by, str) else list(by)
+
+    def build():
+        with instrument.stage('buffer'):
+            buffers = geodesy.buffers(gdf.geometry.to_numpy(), buffer_dist, gdf.crs)
+        rows = []
+        with instrument.stage('dissolve'):
+            for group, idx in gdf.groupby(by, sort=False).indices.items():
+                group = group if isinstance(group, tuple) else (group,)
+                rows.append(list(group)+[shapely.union_all(buffers[idx])])
+        instrument.count('geometrias_unidas', len(buffers))
+        return gpd.GeoDataFrame(pd.DataFrame(rows, columns=by+['geometry']),
+                                geometry='geometry', crs=gdf.crs)
+
+    key_parts = [gdf_hash(gdf[by+[gdf.geometry.name]]), str(gdf.crs),
+                 buffer_dist, by, 'geodesico']
+    return cached('dissolved_'+'_'.join(by), key_parts, build, cache_dir)
+
+
+def group_geometry(dissolved, by, value):
+    """
+    Geometria dissolvida de um grupo. Retorna uma geometria vazia se o grupo
+    não existe, como a unary_union de uma seleção vazia.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    value = value if isinstance(value, tuple) else (value,)
+    sel = pd.Series(True, index=dissolved.index)
+    for col, val in zip(by, value):
+        sel &= dissolved[col] == val
+    if not sel.any():
+        return shapely.GeometryCollection()
+    return dissolved.geometry[sel].iloc[0]
+
+
+def report():
+    """
+    Imprime e retorna o número de acessos ao cache por artefato e origem
+    (memória, disco ou calculado).
+    """
+    if not _events:
+        print('Cache de geometrias: nenhum acesso')
+        return pd.DataFrame()
+    events = pd.DataFrame(_events, columns=['artefato', 'origem'])
+    table = events.groupby(['artefato', 'origem']).size().unstack(fill_value=0)
+    print('Cache de geometrias:')
+    print(table.to_string())
+    return table
+
+
+def clear_memory():
+    """
+    Esvazia o cache em memória e o registro de acessos.
+    """
+    _memory.clear()
+    del _events[:]
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 22:31:05 2026
+
+CRS e buffers geodésicos compartilhados pelos scripts do Objetivo 07.
+
+Contrato de CRS:
+- O inventário de estações e o Mapbiomas ficam em graus (EPSG:4326); o
+  stationsLandUse recorta o Mapbiomas nesse CRS.
+- As análises vetoriais (analisesObjetivo07, cover_pop e placement_pop)
+  recebem todas as camadas (estações, estados, população, áreas urbanas...) no
+  mesmo CRS, WORK_CRS: a cônica equivalente de Albers do IBGE sobre o SIRGAS
+  2000. Por ser de área igual, shapely.area nesse CRS é a área no terreno em
+  todo o país (no EPSG:5880, policônica, a mesma área varia até ~6% entre o
+  meridiano central e as bordas). As camadas são transformadas uma única vez,
+  na leitura (to_work_crs), e não entre um script e outro.
+- Os raios (buffer_dist) são distâncias no terreno: os buffers são círculos
+  geodésicos no elipsoide GRS80 (buffers) e os testes de distância usam a
+  distância geodésica (dwithin, distance). Nenhuma projeção preserva as
+  distâncias em todo o país (no WORK_CRS a escala varia ~7%), então um buffer
+  planar teria raios diferentes em cada região.
+"""
+
+import functools
+import numpy as np
+import pyproj
+from pyproj import Geod, Transformer
+from pyproj.crs import ProjectedCRS
+from pyproj.crs.coordinate_operation import AlbersEqualAreaConversion
+import shapely
+
+
+# CRS de trabalho das análises vetoriais: Albers equivalente do IBGE (SIRGAS 2000)
+WORK_CRS = ProjectedCRS(
+    name='SIRGAS 2000 / Brazil Albers Equal Area',
+    conversion=AlbersEqualAreaConversion(latitude_first_parallel=-2,
+                                         latitude_second_parallel=-22,
+                                         latitude_false_origin=-12,
+                                         longitude_false_origin=-54,
+                                         easting_false_origin=5000000,
+                                         northing_false_origin=10000000),
+    geodetic_crs=pyproj.CRS('EPSG:4674'))
+
+# Razão máxima entre a distância no CRS e a distância no terreno usada como
+# folga na pré-seleção pelo índice espacial (no Brasil fica abaixo de 1,07 no
+# WORK_CRS e no EPSG:5880)
+MAX_SCALE = 1.1
+
+# Elipsoide do SIRGAS 2000
+GEOD = Geod(ellps='GRS80')
+
+# Número de vértices dos círculos geodésicos
+NSEG = 64
+
+
+def to_work_crs(gdf):
+    """
+    Transforma uma camada para o WORK_CRS (só se estiver em outro CRS).
+    """
+    if gdf.crs is not None and pyproj.CRS(gdf.crs) == WORK_CRS:
+        return gdf
+    return gdf.to_crs(WORK_CRS)
+
+
+# Transformadores reaproveitados entre chamadas (criar um custa ~10 ms)
+@functools.lru_cache(maxsize=16)
+def _transformer(crs_from, crs_to):
+    return Transformer.from_crs(crs_from, crs_to, always_xy=True)
+
+
+def lonlat(geoms, crs):
+    """
+    Longitude e latitude (graus, SIRGAS 2000) de pontos em um CRS qualquer.
+    Geometrias que não são pontos são representadas pelo centroide.
+
+    Returns
+    -------
+    lon, lat : numpy array
+        Coordenadas geográficas de cada geometria.
+
+    """
+    geoms = np.asarray(geoms)
+    points = geoms if (shapely.get_type_id(geoms) == 0).all() else shapely.centroid(geoms)
+    xy = shapely.get_coordinates(points)
+    if len(xy) == 0:
+        return np.empty(0), np.empty(0)
+    return _transformer(crs, 'EPSG:4674').transform(xy[:, 0], xy[:, 1])
+
+
+def circles(lon, lat, buffer_dist, nseg=NSEG):
+    """
+    Círculos geodésicos (elipsoide GRS80) de raio buffer_dist (m) ao redor de
+    pontos, com todos os vértices calculados de uma vez no pyproj.Geod.
+
+    Returns
+    -------
+    circles : numpy array
+        Polígonos (shapely) em graus.
+
+    """
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    az = np.linspace(0, 360, nseg, endpoint=False)
+    x, y, _ = GEOD.fwd(np.repeat(lon, nseg), np.repeat(lat, nseg),
+                       np.tile(az, len(lon)), np.full(len(lon) * nseg, float(buffer_dist)))
+    ring = np.stack([x, y], axis=-1).reshape(len(lon), nseg, 2)
+    ring = np.concatenate([ring, ring[:, :1, :]], axis=1)
+    return shapely.polygons(ring)
+
+
+def buffers(geoms, buffer_dist, crs, nseg=NSEG):
+    """
+    Buffers geodésicos de raio buffer_dist (m no terreno) ao redor de pontos
+    em um CRS métrico qualquer (ex. WORK_CRS). Os círculos são calculados no
+    elipsoide e os vértices transformados de volta para o CRS em uma única
+    chamada.
+
+    Parameters
+    ----------
+    geoms : array
+        Pontos (shapely) no CRS crs.
+    buffer_dist : float
+        Raio em metros.
+    crs : CRS
+        CRS das geometrias de entrada e dos buffers.
+    nseg : int
+        Número de vértices de cada círculo.
+
+    Returns
+    -------
+    buffers : numpy array
+        Polígonos (shapely) no CRS crs.
+
+    """
+    lon, lat = lonlat(geoms, crs)
+    if len(lon) == 0:
+        return np.empty(0, dtype=object)
+    to_crs = _transformer('EPSG:4674', crs)
+    return shapely.transform(circles(lon, lat, buffer_dist, nseg),
+                             lambda xy: np.column_stack(to_crs.transform(xy[:, 0], xy[:, 1])))
+
+
+def distance(lon1, lat1, lon2, lat2):
+    """
+    Distância geodésica (m) entre pares de pontos em graus.
+    """
+    if len(lon1) == 0:
+        return np.empty(0)
+    return GEOD.inv(lon1, lat1, lon2, lat2)[2]
+
+
+def dwithin(tree, geoms, buffer_dist, crs, tree_lonlat=None):
+    """
+    Pares (geometria, item do índice) a no máximo buffer_dist metros no terreno.
+    O índice espacial pré-seleciona os pares com a folga MAX_SCALE e a
+    distância geodésica decide.
+
+    Parameters
+    ----------
+    tree : shapely STRtree
+        Índice dos pontos (ex. população), no CRS crs.
+    geoms : array
+        Pontos (ex. estações ou candidatos) no CRS crs.
+    buffer_dist : float or array
+        Distância em metros (uma para todas as geometrias ou uma por geometria).
+    crs : CRS
+        CRS das geometrias.
+    tree_lonlat : tuple
+        (lon, lat) dos pontos do índice, se já calculados (ver lonlat).
+
+    Returns
+    -------
+    geom_idx, tree_idx : numpy array
+        Posições dos pares nas geometrias e no índice.
+    dist : numpy array
+        Distância geodésica de cada par.
+
+    """
+    geoms = np.asarray(geoms)
+    limit = np.broadcast_to(np.asarray(buffer_dist, dtype=float), (len(geoms),))
+    geom_idx, tree_idx = tree.query(geoms, predicate='dwithin', distance=limit * MAX_SCALE)
+    if tree_lonlat is None:
+        tree_lonlat = lonlat(tree.geometries, crs)
+    lon, lat = lonlat(geoms, crs)
+    dist = distance(lon[geom_idx], lat[geom_idx],
+                    tree_lonlat[0][tree_idx], tree_lonlat[1][tree_idx])
+    keep = dist <= limit[geom_idx]
+    return geom_idx[keep], tree_idx[keep], dist[keep]
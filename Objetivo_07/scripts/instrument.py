@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:10:26 2026
+
+Instrumentação dos scripts do Objetivo 07: tempo por etapa, contadores
+(estações processadas, pixels lidos, geometrias unidas...) e pico de memória
+residente (RSS), com um relatório em tabela e em JSON por execução.
+
+Desligada por padrão (ENABLED = False ou variável de ambiente GARBR_INSTRUMENT
+vazia); nesse caso stage() devolve sempre o mesmo objeto sem efeito e count()
+retorna na primeira linha, então o custo nas funções instrumentadas é
+desprezível.
+
+Nos pools de processos, as tarefas são executadas com run_task (ou pool_map),
+que devolvem as medições de cada processo filho para serem somadas às do
+processo principal (merge); o tempo das etapas nos filhos é somado, então pode
+passar do tempo de relógio.
+
+Uso:
+    import instrument
+    instrument.enable()
+    ... (roda as análises)
+    instrument.report('../outputs/instrument.json')
+"""
+
+import os
+import json
+import time
+import threading
+import functools
+import itertools
+from datetime import datetime
+import pandas as pd
+
+
+# Liga/desliga a instrumentação
+ENABLED = os.environ.get('GARBR_INSTRUMENT', '') not in ('', '0')
+
+# Intervalo de amostragem do RSS pela thread de amostragem (segundos)
+SAMPLE_INTERVAL = 0.05
+
+_stages = {}
+_counters = {}
+_active = []
+_lock = threading.Lock()
+_sampler = None
+_start = None
+
+
+def _after_fork():
+    # O processo filho herda a trava (talvez presa pela thread de amostragem,
+    # que não existe no filho) e o objeto da thread: recria os dois
+    global _lock, _sampler
+    _lock = threading.Lock()
+    _sampler = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _rss_mb():
+    # Memória residente atual do processo (Linux: /proc/self/statm)
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')/2**20
+    except (OSError, ValueError):
+        return float('nan')
+
+
+def _sample():
+    # Atualiza o pico de RSS das etapas abertas
+    rss = _rss_mb()
+    with _lock:
+        for name in _active:
+            entry = _stages[name]
+            if not rss <= entry['rss_pico_mb']:
+                entry['rss_pico_mb'] = rss
+    return rss
+
+
+class _Sampler(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.wait(SAMPLE_INTERVAL):
+            _sample()
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullStage()
+
+
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        with _lock:
+            entry = _stages.setdefault(self.name, {'chamadas': 0, 'tempo_s': 0.0,
+                                                   'rss_pico_mb': float('nan')})
+            entry['chamadas'] += 1
+            _active.append(self.name)
+        _sample()
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter()-self.t0
+        _sample()
+        with _lock:
+            _stages[self.name]['tempo_s'] += elapsed
+            _active.remove(self.name)
+        return False
+
+
+def stage(name):
+    """
+    Marca uma etapa para medir o tempo e o pico de RSS:
+
+        with instrument.stage('dissolve'):
+            ...
+
+    Chamadas repetidas da mesma etapa são acumuladas.
+    """
+    if not ENABLED:
+        return _NULL
+    return _Stage(name)
+
+
+def timed(name=None):
+    """
+    Decorador que mede cada chamada da função como uma etapa (com o nome da
+    função, se name for None).
+    """
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with _Stage(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, n=1):
+    """
+    Soma n ao contador name (ex. 'pixels_lidos').
+    """
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0)+int(n)
+
+
+def enable(sample_interval=None):
+    """
+    Liga a instrumentação, zera as medições e inicia a thread de amostragem
+    do RSS.
+    """
+    global ENABLED, SAMPLE_INTERVAL, _sampler, _start
+    if sample_interval is not None:
+        SAMPLE_INTERVAL = sample_interval
+    reset()
+    ENABLED = True
+    _start = datetime.now()
+    if _sampler is None:
+        _sampler = _Sampler()
+        _sampler.start()
+
+
+def disable():
+    """
+    Desliga a instrumentação e para a thread de amostragem. As medições são
+    mantidas até o próximo enable() ou reset().
+    """
+    global ENABLED, _sampler
+    ENABLED = False
+    if _sampler is not None:
+        _sampler.stop.set()
+        _sampler.join()
+        _sampler = None
+
+
+def reset():
+    """
+    Zera as etapas e os contadores.
+    """
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        del _active[:]
+
+
+def merge(data):
+    """
+    Soma ao processo atual as medições de outro processo (o dicionário do
+    summary() retornado por run_task): chamadas, tempos e contadores são
+    somados e o pico de RSS de cada etapa é o maior entre os processos.
+    """
+    if not data:
+        return
+    with _lock:
+        for name, entry in data['etapas'].items():
+            own = _stages.setdefault(name, {'chamadas': 0, 'tempo_s': 0.0,
+                                            'rss_pico_mb': float('nan')})
+            own['chamadas'] += entry['chamadas']
+            own['tempo_s'] += entry['tempo_s']
+            if not entry['rss_pico_mb'] <= own['rss_pico_mb']:
+                own['rss_pico_mb'] = entry['rss_pico_mb']
+        for name, value in data['contadores'].items():
+            _counters[name] = _counters.get(name, 0)+int(value)
+
+
+def run_task(func, task, enabled):
+    """
+    Executa func(task) em um processo filho de um pool, com as medições
+    zeradas (o fork copia as do processo principal), e retorna o resultado e as
+    medições da tarefa para o merge() no processo principal:
+
+        future = executor.submit(instrument.run_task, func, task, instrument.ENABLED)
+        result, data = future.result()
+        instrument.merge(data)
+    """
+    global ENABLED
+    if not enabled:
+        ENABLED = False
+        return func(task), None
+    enable()
+    result = func(task)
+    return result, summary()
+
+
+def pool_map(executor, func, tasks):
+    """
+    Equivalente a executor.map(func, tasks) que soma as medições dos processos
+    filhos às do processo atual (ver run_task).
+    """
+    for result, data in executor.map(run_task, itertools.repeat(func), tasks,
+                                     itertools.repeat(ENABLED)):
+        merge(data)
+        yield result
+
+
+def _peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])/1024
+    except OSError:
+        pass
+    return float('nan')
+
+
+def summary():
+    """
+    Retorna as medições como dicionário (o mesmo conteúdo do JSON).
+    """
+    with _lock:
+        stages = {k: dict(v) for k, v in _stages.items()}
+        counters = dict(_counters)
+    return {'inicio': _start.isoformat(timespec='seconds') if _start else None,
+            'fim': datetime.now().isoformat(timespec='seconds'),
+            'pid': os.getpid(),
+            'rss_pico_processo_mb': _peak_rss_mb(),
+            'etapas': stages,
+            'contadores': counters}
+
+
+def report(path=None):
+    """
+    Imprime a tabela de etapas e os contadores e, se path for informado, grava
+    as medições em JSON.
+
+    Parameters
+    ----------
+    path : path
+        Arquivo JSON de saída. Se None, só imprime.
+
+    Returns
+    -------
+    table : dataframe
+        Uma linha por etapa, com o número de chamadas, o tempo total e o pico
+        de RSS.
+
+    """
+    data = summary()
+    table = pd.DataFrame.from_dict(data['etapas'], orient='index',
+                                   columns=['chamadas', 'tempo_s', 'rss_pico_mb'])
+    table = table.sort_values('tempo_s', ascending=False)
+    print('Instrumentação:')
+    print(table.to_string(float_format='{:.2f}'.format) if len(table) else '  nenhuma etapa')
+    for name, value in sorted(data['contadores'].items()):
+        print('  '+name+': '+str(value))
+    if path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=1, default=float)
+    return table
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 20:14:09 2026
+
+Recálculo incremental (delta) quando o inventário de estações muda.
+
+A cada revisão do inventário poucas estações mudam (novas, desativadas ou
+realocadas). O estado de cada execução (parâmetros, inventário e resultado) é
+guardado em disco e, na execução seguinte, o inventário novo é comparado com o
+anterior pela chave ESTAÇÃO + coordenadas (a geometria da estação ou do seu
+buffer). Só as estações alteradas, e as UFs que elas tocam, são recalculadas;
+o restante vem do resultado anterior. Se os parâmetros mudaram (ano, raio,
+camada de estados...), o estado anterior é descartado e tudo é recalculado.
+
+Usado pelo stationsLandUse (cutMapbiomasDelta), pelo analisesObjetivo07
+(aqs_cover_state_delta) e pelo cover_pop (aqs_pop_cover_state_delta).
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+import geocache
+
+
+# Pasta do estado em disco. Se None, usa <raiz>/outputs/delta, como os outputs
+# dos scripts (raiz = pasta acima da pasta de execução)
+STATE_DIR = None
+
+# Coluna com o nome da estação
+KEY = 'ESTAÇÃO'
+
+
+def _state_dir(state_dir=None):
+    if state_dir is not None:
+        return state_dir
+    if STATE_DIR is not None:
+        return STATE_DIR
+    return os.path.dirname(os.getcwd())+'/outputs/delta'
+
+
+def station_keys(inventory, values=()):
+    """
+    Chave de cada estação: ESTAÇÃO + geometria (WKB, ou seja, as coordenadas
+    exatas) + colunas values (ex. 'Tipo', quando o tipo entra no cálculo).
+
+    Parameters
+    ----------
+    inventory : geodataframe
+        Estações (uma por linha).
+    values : list
+        Colunas adicionais cuja mudança também conta como estação alterada.
+
+    Returns
+    -------
+    keys : pandas Index
+        Uma chave por linha do inventário.
+
+    """
+    parts = [inventory[KEY].astype(str).to_numpy()]
+    parts += [inventory[c].astype(str).to_numpy() for c in values]
+    parts.append(shapely.to_wkb(inventory.geometry.to_numpy(), hex=True))
+    return pd.MultiIndex.from_arrays(parts).to_flat_index()
+
+
+def diff_inventory(new, old, values=()):
+    """
+    Compara o inventário novo com o anterior.
+
+    Parameters
+    ----------
+    new : geodataframe
+        Inventário atual.
+    old : geodataframe
+        Inventário da execução anterior.
+    values : list
+        Colunas adicionais da chave (ver station_keys).
+
+    Returns
+    -------
+    changed_new : numpy array
+        True para as estações do inventário novo sem correspondente no
+        anterior (novas, realocadas ou com values alterados).
+    changed_old : numpy array
+        True para as estações do inventário anterior que não existem mais no
+        novo (desativadas ou posições antigas das realocadas).
+
+    """
+    new_keys = station_keys(new, values)
+    old_keys = station_keys(old, values)
+    return ~new_keys.isin(old_keys), ~old_keys.isin(new_keys)
+
+
+def affected_zones(zone_geoms, geoms):
+    """
+    Posições (ordenadas) das zonas (ex. estados) que intersectam alguma das
+    geometrias (ex. buffers das estações alteradas).
+    """
+    geoms = np.asarray(geoms)
+    if len(geoms) == 0:
+        return np.empty(0, dtype=np.intp)
+    _, zone_idx = shapely.STRtree(np.asarray(zone_geoms)).query(geoms, predicate='intersects')
+    return np.unique(zone_idx)
+
+
+def _paths(name, state_dir=None):
+    base = os.path.join(_state_dir(state_dir), name)
+    return base+'.json', base+'_inventory.parquet', base+'_result.parquet'
+
+
+def load_state(name, params, state_dir=None):
+    """
+    Lê o estado da execução anterior.
+
+    Parameters
+    ----------
+    name : str
+        Nome do cálculo (prefixo dos arquivos).
+    params : list
+        Parâmetros da execução atual (hashes das camadas, raio, ano...). Se
+        forem diferentes dos da execução anterior, o estado é descartado.
+    state_dir : path
+        Pasta do estado. Se None, usa STATE_DIR.
+
+    Returns
+    -------
+    inventory : geodataframe
+        Inventário da execução anterior, ou None se não há estado válido.
+    result : dataframe
+        Resultado da execução anterior (None se não foi guardado).
+
+    """
+    meta_path, inventory_path, result_path = _paths(name, state_dir)
+    if not (os.path.exists(meta_path) and os.path.exists(inventory_path)):
+        return None, None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta['params'] != geocache.cache_key(*params):
+        return None, None
+    inventory = gpd.read_parquet(inventory_path)
+    result = pd.read_parquet(result_path) if os.path.exists(result_path) else None
+    return inventory, result
+
+
+def save_state(name, params, inventory, result=None, state_dir=None):
+    """
+    Guarda o estado da execução (parâmetros, inventário e, se informado, o
+    resultado) para a próxima execução incremental.
+    """
+    meta_path, inventory_path, result_path = _paths(name, state_dir)
+    os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+    inventory.to_parquet(inventory_path)
+    if result is not None:
+        pd.DataFrame(result).to_parquet(result_path)
+    elif os.path.exists(result_path):
+        os.remove(result_path)
+    with open(meta_path, 'w') as f:
+        json.dump({'params': geocache.cache_key(*params), 'estacoes': len(inventory)}, f)
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:02:44 2026
+
+Execução incremental do stationsLandUse.
+
+A cadeia stationBuffers -> cutMapbiomas (estações) -> stationUnionByUF ->
+cutMapbiomas (UF) -> statsByUF é dividida em etapas com entradas explícitas. A
+impressão digital (fingerprint) de cada etapa é calculada a partir dos
+parâmetros que ela usa (ano, bufferSize, pixelSize...), dos arquivos de entrada
+(inventário, legenda, Mapbiomas, estatísticas por UF), do código dos scripts e
+das impressões digitais das etapas de que ela depende. Só as etapas cuja
+impressão digital mudou (ou cujas saídas sumiram) são recalculadas; as demais
+reaproveitam as saídas da execução anterior. Etapas independentes (o recorte
+por estação e o ramo por UF) rodam em processos separados, ao mesmo tempo.
+
+Os parâmetros ficam em um arquivo JSON (landUsePipeline.json):
+    {"file": "Monitoramento_QAr_BR_latlon_2024.csv", "year": 2022,
+     "bufferSize": 1000, "pixelSize": 900, "workers": null, "csv": true,
+     "clips": "tif", "delta": false}
+
+Como no stationsLandUse original, o padrão grava o recorte de cada estação e de
+cada UF em outputs/mapbiomas/mapbiomas_<ESTAÇÃO>.tif; "clips": "store" grava os
+recortes em um único contêiner e null não grava recortes (ver cutMapbiomas).
+
+Uso (a partir da pasta scripts, como os demais scripts):
+    python landUsePipeline.py --config landUsePipeline.json
+    python landUsePipeline.py --force stations
+"""
+
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import geopandas as gpd
+import geocache
+import instrument
+import landUseStore
+import prepareMapbiomas
+import stationsLandUse as slu
+
+
+DEFAULTS = {'file':'Monitoramento_QAr_BR_latlon_2024.csv',
+            'year':2022,
+            'bufferSize':1000,
+            'pixelSize':30*30,
+            'workers':None,
+            'csv':True,
+            'clips':'tif',
+            'delta':False}
+
+# Código de que as etapas dependem (este script e os módulos locais que ele e o
+# stationsLandUse importam): se mudar, todas as etapas são recalculadas
+_CODE = ['stationsLandUse.py','landUseStore.py','clipStore.py','geocache.py','geodesy.py',
+         'inventoryDelta.py','prepareMapbiomas.py','instrument.py','landUsePipeline.py']
+
+
+def _folders():
+    rootDir = os.path.dirname(os.getcwd())
+    return {'inputs':rootDir+'/inputs',
+            'mapbiomas':rootDir+'/outputs/mapbiomas',
+            'pipeline':rootDir+'/outputs/pipeline'}
+
+def _fileStamp(path):
+    """
+    Identificação barata de um arquivo grande (nome, tamanho e data de
+    modificação), usada para o mosaico original do Mapbiomas. A cópia em
+    blocos (prepareMapbiomas) só é lida quando corresponde ao original, então
+    basta marcar o original.
+    """
+    st = os.stat(path)
+    return [os.path.basename(path),st.st_size,st.st_mtime_ns]
+
+def _codeHash():
+    here = os.path.dirname(os.path.abspath(__file__))
+    return [geocache.file_hash(os.path.join(here,name)) for name in _CODE]
+
+
+###etapas###
+
+#cada etapa recebe a configuração e devolve a lista de arquivos que gravou.
+#as entradas vêm das saídas gravadas pelas etapas anteriores, então cada etapa
+#pode rodar em um processo separado. com delta=True os recortes usam o
+#cutMapbiomasDelta e só as estações (ou UFs) alteradas são recalculadas
+
+def _cut(cfg):
+    return slu.cutMapbiomasDelta if cfg['delta'] else slu.cutMapbiomas
+
+def _stageBuffers(cfg):
+    folders = _folders()
+    gdf = slu.stationBuffers(cfg['file'],cfg['bufferSize'])
+    os.makedirs(folders['pipeline'],exist_ok=True)
+    path = folders['pipeline']+'/stationBuffers.parquet'
+    gdf.to_parquet(path)
+    return [path]
+
+def _loadBuffers():
+    return gpd.read_parquet(_folders()['pipeline']+'/stationBuffers.parquet')
+
+def _stageStations(cfg):
+    gdf = _loadBuffers()
+    _cut(cfg)(gdf,cfg['year'],'',cfg['pixelSize'],cfg['workers'],
+              cfg['csv'],cfg['clips'])
+    return [landUseStore.tablePath(_folders()['mapbiomas'],'stationsLandUse')]
+
+def _stageUnionUF(cfg):
+    folders = _folders()
+    stationInUF = slu.stationUnionByUF(_loadBuffers())
+    path = folders['pipeline']+'/stationUnionByUF.parquet'
+    stationInUF.to_parquet(path)
+    return [path]
+
+def _stageUF(cfg):
+    folders = _folders()
+    stationInUF = gpd.read_parquet(folders['pipeline']+'/stationUnionByUF.parquet')
+    _cut(cfg)(stationInUF,cfg['year'],'UF',cfg['pixelSize'],cfg['workers'],
+              cfg['csv'],cfg['clips'])
+    return [landUseStore.tablePath(folders['mapbiomas'],'UFstationsLandUse')]
+
+def _stageStatsUF(cfg):
+    folders = _folders()
+    gdfUFstations = landUseStore.loadTable(folders['mapbiomas'],'UFstationsLandUse',
+                                           geometry=False)
+    slu.statsByUF(gdfUFstations,cfg['year'],cfg['pixelSize'],cfg['csv'])
+    return [landUseStore.tablePath(folders['mapbiomas'],'UFstationsLandUseStats')]
+
+
+def stages(cfg):
+    """
+    Etapas do pipeline: nome -> (função, etapas de que depende, entradas da
+    impressão digital).
+    """
+    folders = _folders()
+    inventory = geocache.file_hash(folders['inputs']+'/'+cfg['file'])
+    legend = geocache.file_hash(folders['inputs']+'/mapbiomasLegend.csv')
+    raster = _fileStamp(prepareMapbiomas.sourcePath(folders['inputs'],cfg['year']))
+    outputs = [cfg['csv'],cfg['clips']]
+    return {
+        'buffers':(_stageBuffers,[],[inventory,cfg['bufferSize']]),
+        'stations':(_stageStations,['buffers'],
+                    [legend,raster,cfg['year'],cfg['pixelSize']]+outputs),
+        'unionUF':(_stageUnionUF,['buffers'],[]),
+        'uf':(_stageUF,['unionUF'],
+              [legend,raster,cfg['year'],cfg['pixelSize']]+outputs),
+        'statsUF':(_stageStatsUF,['uf'],
+                   [geocache.file_hash(folders['inputs']+'/mapbiomasStatisticsByUF.csv'),
+                    legend,cfg['year'],cfg['pixelSize'],cfg['csv']]),
+    }
+
+
+def loadConfig(configPath=None):
+    """
+    Lê a configuração (JSON) e completa com os valores padrão.
+    """
+    cfg = dict(DEFAULTS)
+    if configPath is not None:
+        with open(configPath) as f:
+            cfg.update(json.load(f))
+    return cfg
+
+def _runStage(task):
+    name, func, cfg = task
+    start = time.perf_counter()
+    outputs = func(cfg)
+    return name, outputs, time.perf_counter()-start
+
+def run(configPath=None, force=(), parallel=True):
+    """
+    Roda o pipeline, recalculando só as etapas desatualizadas.
+
+    Parameters
+    ----------
+    configPath : path
+        Arquivo JSON com a configuração. Se None, usa os valores de DEFAULTS.
+    force : list
+        Etapas a recalcular mesmo que estejam atualizadas (e as que dependem
+        delas).
+    parallel : bool
+        Se True, etapas independentes rodam em processos separados.
+
+    Returns
+    -------
+    status : dict
+        Etapa -> 'reaproveitada' ou 'calculada'.
+
+    """
+    cfg = loadConfig(configPath)
+    folders = _folders()
+    statePath = folders['pipeline']+'/state.json'
+    state = {}
+    if os.path.exists(statePath):
+        with open(statePath) as f:
+            state = json.load(f)
+
+    plan = stages(cfg)
+    code = _codeHash()
+    fingerprints = {}
+    for name, (func, deps, inputs) in plan.items():
+        fingerprints[name] = geocache.cache_key(name,code,inputs,
+                                                [fingerprints[d] for d in deps])
+
+    def fresh(name):
+        prev = state.get(name)
+        return (name not in force and prev is not None
+                and prev['fingerprint']==fingerprints[name]
+                and all(os.path.exists(p) for p in prev['outputs']))
+
+    status = {}
+    running = {}
+    executor = ProcessPoolExecutor(max_workers=2) if parallel else None
+
+    def finish(name, outputs, elapsed):
+        state[name] = {'fingerprint':fingerprints[name],'outputs':outputs}
+        status[name] = 'calculada'
+        print('Etapa '+name+': calculada em '+'{:.1f}'.format(elapsed)+' s')
+        os.makedirs(folders['pipeline'],exist_ok=True)
+        with open(statePath,'w') as f:
+            json.dump(state,f,indent=1)
+
+    try:
+        while len(status)<len(plan):
+            for name, (func, deps, inputs) in plan.items():
+                if name in status or name in running.values():
+                    continue
+                if not all(d in status for d in deps):
+                    continue
+                # Uma etapa só é reaproveitada se as etapas de que depende
+                # também foram
+                if fresh(name) and all(status[d]=='reaproveitada' for d in deps):
+                    status[name] = 'reaproveitada'
+                    print('Etapa '+name+': reaproveitada')
+                elif executor is None:
+                    finish(*_runStage((name,func,cfg)))
+                else:
+                    running[executor.submit(instrument.run_task,_runStage,
+                                            (name,func,cfg),instrument.ENABLED)] = name
+            if running:
+                finished, _ = wait(list(running),return_when=FIRST_COMPLETED)
+                for future in finished:
+                    running.pop(future)
+                    # Medições da etapa no processo filho (instrument)
+                    result, data = future.result()
+                    instrument.merge(data)
+                    finish(*result)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return status
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Pipeline incremental do uso do solo ao redor das estações.')
+    parser.add_argument('--config',default='landUsePipeline.json',
+                        help='Arquivo JSON com a configuração')
+    parser.add_argument('--force',nargs='*',default=[],
+                        help='Etapas a recalcular (buffers, stations, unionUF, uf, statsUF)')
+    parser.add_argument('--serial',action='store_true',
+                        help='Roda as etapas no processo atual, uma por vez')
+    args = parser.parse_args()
+    run(args.config if os.path.exists(args.config) else None,
+        args.force,not args.serial)
+    if instrument.ENABLED:
+        instrument.report(os.path.dirname(os.getcwd())+'/outputs/instrument_landUsePipeline.json')
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:02:37 2026
+
+Armazenamento das tabelas de uso do solo do stationsLandUse em Parquet.
+
+Cada tabela é gravada uma única vez em outputs/mapbiomas/<nome>.parquet: com as
+geometrias (ex. 'buffer') em GeoParquet (WKB) ou, sem geometrias, em Parquet.
+Colunas de texto com valores repetidos (ex. 'majorLandUse', 'ESTADO') são
+gravadas como categorias (dictionary encoding). A versão sem geometria é obtida
+na leitura, selecionando as colunas (loadTable), e os CSVs antigos são
+exportados só quando pedidos (exportCSV).
+"""
+
+import os
+import json
+import pandas as pd
+import geopandas as gpd
+import pyarrow.parquet as pq
+
+
+def tablePath(outfolder,name):
+    """
+    Caminho do arquivo Parquet de uma tabela.
+    """
+    return outfolder+'/'+name+'.parquet'
+
+def _geometryColumns(df):
+    return [c for c in df.columns
+            if isinstance(df[c].dtype,gpd.array.GeometryDtype)]
+
+def _dictionaryColumns(df):
+    """
+    Converte em categoria as colunas de texto com valores repetidos.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype==object and len(df)>0:
+            values = df[col].dropna()
+            if values.map(type).eq(str).all() and values.nunique()<=len(df)//2:
+                df[col] = df[col].astype('category')
+    return df
+
+def saveTable(df,outfolder,name,geometry='buffer'):
+    """
+    Grava uma tabela de uso do solo em Parquet.
+
+    Parameters
+    ----------
+    df : dataframe or geodataframe
+        Tabela a ser gravada.
+    outfolder : path
+        Pasta de saída.
+    name : str
+        Nome da tabela (sem extensão).
+    geometry : str
+        Coluna de geometria principal do GeoParquet, se existir no df. Outras
+        colunas de geometria também são gravadas em WKB.
+
+    Returns
+    -------
+    path : path
+        Caminho do arquivo gravado.
+
+    """
+    os.makedirs(outfolder, exist_ok=True)
+    path = tablePath(outfolder,name)
+    df = _dictionaryColumns(df)
+    geoms = _geometryColumns(df)
+    if geoms:
+        active = geometry if geometry in geoms else geoms[0]
+        gpd.GeoDataFrame(df,geometry=active).to_parquet(path)
+    else:
+        pd.DataFrame(df).to_parquet(path)
+    return path
+
+def loadTable(outfolder,name,columns=None,geometry=True):
+    """
+    Lê uma tabela gravada pelo saveTable, apenas com as colunas pedidas.
+
+    Parameters
+    ----------
+    outfolder : path
+        Pasta de saída.
+    name : str
+        Nome da tabela (sem extensão).
+    columns : list
+        Colunas a serem lidas. Se None, lê todas.
+    geometry : bool
+        Se False, as colunas de geometria não são lidas.
+
+    Returns
+    -------
+    df : dataframe or geodataframe
+        GeoDataFrame se alguma coluna de geometria foi lida, DataFrame caso
+        contrário.
+
+    """
+    path = tablePath(outfolder,name)
+    schema = pq.read_schema(path)
+    meta = schema.metadata or {}
+    geoms = list(json.loads(meta[b'geo'])['columns']) if b'geo' in meta else []
+    pandasMeta = json.loads(meta[b'pandas']) if b'pandas' in meta else {}
+    indexCols = [c for c in pandasMeta.get('index_columns',[])
+                 if isinstance(c,str)]
+    if columns is None:
+        columns = [c for c in schema.names if c not in indexCols]
+    if not geometry:
+        columns = [c for c in columns if c not in geoms]
+    if any(c in geoms for c in columns):
+        return gpd.read_parquet(path,columns=columns)
+    return pd.read_parquet(path,columns=columns)
+
+def exportCSV(outfolder,name,csvName=None,geometry=True):
+    """
+    Exporta uma tabela gravada pelo saveTable para CSV (geometrias em WKT).
+
+    Parameters
+    ----------
+    outfolder : path
+        Pasta de saída.
+    name : str
+        Nome da tabela (sem extensão).
+    csvName : str
+        Nome do CSV (sem extensão). Se None, usa o nome da tabela.
+    geometry : bool
+        Se False, as colunas de geometria não são exportadas.
+
+    Returns
+    -------
+    path : path
+        Caminho do CSV.
+
+    """
+    path = outfolder+'/'+(csvName or name)+'.csv'
+    loadTable(outfolder,name,geometry=geometry).to_csv(path)
+    return path
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:05:12 2026
+
+Onde instalar as próximas N estações para cobrir a maior população possível.
+
+Os locais candidatos (células da grade de população, células de uma grade mais
+grossa ou centroides das áreas urbanas) são pré-calculados e, para um raio de
+cobertura, cada candidato recebe a lista de pontos de população a menos de
+buffer_dist dele (um único STRtree com dwithin, em blocos de candidatos). A
+escolha é o guloso preguiçoso (lazy greedy) do problema de máxima cobertura:
+uma fila de prioridade com o ganho de cada candidato, em que só o candidato do
+topo tem o ganho recalculado. Os pontos já cobertos pela rede atual (estações
+Referência/Indicativa) entram como cobertos antes da primeira escolha.
+"""
+
+import heapq
+import geopandas as gpd
+import pandas as pd
+import numpy as np
+import shapely
+import geodesy
+import instrument
+from cover_pop import _pop_points
+
+
+###dados de entrada###
+
+#gdf_pop = gpd com população geolocalizada (geodesy.WORK_CRS)
+#gdf_aqs = gdf com estações geolocalizadas (geodesy.WORK_CRS)
+#gdf_states = gdf com estados do Brasil (geodesy.WORK_CRS)
+#gdf_urban = gdf com áreas urbanas (geodesy.WORK_CRS), opcional
+#buffer defalt = 5000m (raio no terreno, contrato de CRS em geodesy.py)
+
+#%%
+
+###locais candidatos###
+
+#por padrão cada ponto de população com pop >= min_pop é um candidato. com
+#cell_size os pontos são agregados em uma grade mais grossa (centro de cada
+#célula ocupada), o que reduz o número de candidatos em grades nacionais finas.
+#com gdf_urban os candidatos são os pontos representativos das áreas urbanas.
+
+def candidate_sites(gdf_pop, cell_size=None, gdf_urban=None, min_pop=0, pop_col='PopResid'):
+
+    if gdf_urban is not None:
+        return gpd.GeoDataFrame({'cand_pop': np.nan},
+                                geometry=gdf_urban.geometry.representative_point().to_numpy(),
+                                crs=gdf_urban.crs, index=pd.RangeIndex(len(gdf_urban)))
+
+    pop_geom = _pop_points(gdf_pop)
+    pop = gdf_pop[pop_col].to_numpy(dtype=float)
+    if cell_size is None:
+        keep = pop >= min_pop
+        return gpd.GeoDataFrame({'cand_pop': pop[keep]},
+                                geometry=pop_geom.to_numpy()[keep], crs=gdf_pop.crs)
+
+    #agregação na grade grossa: população por célula e centro da célula
+    xy = shapely.get_coordinates(pop_geom.to_numpy())
+    cell = np.floor(xy / cell_size).astype(np.int64)
+    cells, inverse = np.unique(cell, axis=0, return_inverse=True)
+    cell_pop = np.bincount(inverse.ravel(), weights=pop, minlength=len(cells))
+    keep = cell_pop >= max(min_pop, np.finfo(float).tiny)
+    centers = (cells[keep] + 0.5) * cell_size
+    return gpd.GeoDataFrame({'cand_pop': cell_pop[keep]},
+                            geometry=shapely.points(centers), crs=gdf_pop.crs)
+
+
+###índice de cobertura (candidato -> pontos de população)###
+
+#pares (candidato, ponto) com distância geodésica <= buffer_dist, em formato
+#CSR: os pontos cobertos pelo candidato i são cells[ptr[i]:ptr[i+1]]. a consulta
+#é feita em blocos de candidatos para limitar a memória dos pares
+#intermediários. o círculo é exato, como no aqs_pop_dist. pop_lonlat são as
+#coordenadas geográficas dos pontos do índice (geodesy.lonlat), calculadas uma
+#vez por quem chama.
+
+def coverage_index(sites, pop_tree, buffer_dist, crs, pop_lonlat=None, chunk_size=100000):
+
+    sites = np.asarray(sites)
+    if pop_lonlat is None:
+        pop_lonlat = geodesy.lonlat(pop_tree.geometries, crs)
+    site_idx, cells = [], []
+    with instrument.stage('predicados_espaciais'):
+        for start in range(0, len(sites), chunk_size):
+            s_idx, p_idx, _ = geodesy.dwithin(pop_tree, sites[start:start + chunk_size],
+                                              buffer_dist, crs, pop_lonlat)
+            site_idx.append((s_idx + start).astype(np.int32))
+            cells.append(p_idx.astype(np.int32))
+    site_idx = np.concatenate(site_idx + [np.empty(0, np.int32)])
+    cells = np.concatenate(cells + [np.empty(0, np.int32)])
+    instrument.count('pares_candidato_populacao', len(cells))
+
+    order = np.argsort(site_idx, kind='stable')
+    ptr = np.zeros(len(sites) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(site_idx, minlength=len(sites)), out=ptr[1:])
+    return ptr, cells[order]
+
+
+###guloso preguiçoso (lazy greedy) para máxima cobertura###
+
+#como o ganho de um candidato só diminui à medida que pontos são cobertos
+#(submodularidade), o ganho guardado na fila é um limite superior: se o ganho
+#recalculado do topo ainda é o maior da fila, ele é a melhor escolha.
+#gains são os ganhos iniciais dos candidatos e covered é atualizado no lugar.
+
+def _lazy_greedy(candidates, gains, ptr, cells, weights, covered, n_sites):
+
+    heap = [(-g, int(i)) for g, i in zip(gains[candidates], candidates) if g > 0]
+    heapq.heapify(heap)
+
+    chosen, chosen_gain = [], []
+    evaluations = 0
+    while heap and len(chosen) < n_sites:
+        _, i = heapq.heappop(heap)
+        c = cells[ptr[i]:ptr[i + 1]]
+        new = c[~covered[c]]
+        gain = weights[new].sum()
+        evaluations += 1
+        if gain <= 0:
+            continue
+        if heap and gain < -heap[0][0]:
+            heapq.heappush(heap, (-gain, i))
+            continue
+        covered[new] = True
+        chosen.append(i)
+        chosen_gain.append(gain)
+    instrument.count('avaliacoes_guloso', evaluations)
+
+    return chosen, chosen_gain
+
+
+#estado de cada ponto (-1 fora dos estados). a consulta é feita com os estados
+#no índice dos pontos (contains), bem mais rápida que within contra os
+#polígonos grandes dos estados, como no aqs_pop_cover_stream
+
+def _zone_of(tree, gdf_states):
+
+    zone = np.full(len(tree.geometries), -1, dtype=np.int64)
+    state_idx, geom_idx = tree.query(gdf_states.geometry.to_numpy(), predicate='contains')
+    zone[geom_idx] = state_idx
+    return zone
+
+
+###próximas N estações###
+
+#escolhe n_sites candidatos (por estado, com per_state=True e gdf_states com o
+#nome do estado em column, ou no Brasil todo) que mais aumentam a população
+#coberta por buffer_dist, com a rede atual (gdf_aqs, filtrada por tipos se
+#informado) já contada como cobertura.
+#como no aqs_pop_cover_state, no modo por estado só as estações e os
+#candidatos dentro do estado cobrem a população do estado.
+#retorna um GeoDataFrame com uma linha por estação sugerida, na ordem de
+#escolha: ganho de população e cobertura acumulada (com a rede atual).
+
+@instrument.timed()
+def aqs_greedy_placement(gdf_aqs, gdf_pop, candidates, n_sites, buffer_dist=5000,
+                         gdf_states=None, per_state=False, column='HASC_1', tipos=None,
+                         pop_col='PopResid', chunk_size=100000):
+
+    if per_state and gdf_states is None:
+        raise ValueError('per_state=True exige gdf_states')
+
+    pop_geom = _pop_points(gdf_pop).to_numpy()
+    weights = gdf_pop[pop_col].to_numpy(dtype=float)
+    pop_tree = shapely.STRtree(pop_geom)
+    pop_lonlat = geodesy.lonlat(pop_geom, gdf_pop.crs)
+
+    aqs = gdf_aqs if tipos is None else gdf_aqs[gdf_aqs['Tipo'].isin(tipos)]
+    aqs_geom = aqs.geometry.to_numpy()
+    cand_geom = candidates.geometry.to_numpy()
+
+    #pares candidato -> pontos e estação atual -> pontos
+    ptr, cells = coverage_index(cand_geom, pop_tree, buffer_dist, gdf_pop.crs, pop_lonlat,
+                                chunk_size)
+    aqs_ptr, aqs_cells = coverage_index(aqs_geom, pop_tree, buffer_dist, gdf_pop.crs,
+                                        pop_lonlat, chunk_size)
+
+    if per_state:
+        with instrument.stage('predicados_espaciais'):
+            pop_zone = _zone_of(pop_tree, gdf_states)
+            cand_zone = _zone_of(shapely.STRtree(cand_geom), gdf_states)
+            aqs_zone = _zone_of(shapely.STRtree(aqs_geom), gdf_states)
+
+        #só os pares dentro do mesmo estado
+        def same_state(ptr, cells, zone):
+            owner = np.repeat(np.arange(len(ptr) - 1), np.diff(ptr))
+            keep = pop_zone[cells] == zone[owner]
+            new_ptr = np.zeros_like(ptr)
+            np.cumsum(np.bincount(owner[keep], minlength=len(ptr) - 1), out=new_ptr[1:])
+            return new_ptr, cells[keep]
+
+        ptr, cells = same_state(ptr, cells, cand_zone)
+        aqs_ptr, aqs_cells = same_state(aqs_ptr, aqs_cells, aqs_zone)
+
+    #rede atual: pontos já cobertos
+    covered = np.zeros(len(pop_geom), dtype=bool)
+    covered[aqs_cells] = True
+
+    #ganho inicial de todos os candidatos de uma vez (somas acumuladas no CSR).
+    #no modo por estado cada candidato só cobre pontos do seu estado, então os
+    #ganhos iniciais valem para todos os estados
+    uncovered = np.concatenate([[0.], np.cumsum(weights[cells] * ~covered[cells])])
+    gains = uncovered[ptr[1:]] - uncovered[ptr[:-1]]
+
+    if per_state:
+        names = gdf_states[column].to_numpy()
+        groups = [(names[i], np.flatnonzero(cand_zone == i), pop_zone == i)
+                  for i in range(len(gdf_states))]
+    else:
+        groups = [('BR', np.arange(len(cand_geom)), slice(None))]
+
+    results = []
+    for name, group_cand, members in groups:
+        pop_total = weights[members].sum()
+        pop_cover = weights[members][covered[members]].sum()
+        chosen, chosen_gain = _lazy_greedy(group_cand, gains, ptr, cells, weights,
+                                           covered, n_sites)
+        for rank, (i, gain) in enumerate(zip(chosen, chosen_gain)):
+            pop_cover += gain
+            results.append({
+                'state': name,
+                'ordem': rank + 1,
+                'cand_idx': candidates.index[i],
+                'cand_pop': candidates['cand_pop'].iloc[i],
+                'pop_gain': gain,
+                'pop_total': pop_total,
+                'pop_cover': pop_cover,
+                '%_pop_cover': (pop_cover / pop_total * 100) if pop_total > 0 else 0,
+                'geometry': cand_geom[i]
+            })
+
+    columns = ['state', 'ordem', 'cand_idx', 'cand_pop', 'pop_gain', 'pop_total',
+               'pop_cover', '%_pop_cover', 'geometry']
+    return gpd.GeoDataFrame(pd.DataFrame(results, columns=columns),
+                            geometry='geometry', crs=gdf_pop.crs)
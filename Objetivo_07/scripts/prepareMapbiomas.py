@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 14:20:11 2026
+
+Prepara o mosaico do Mapbiomas (inputs/brasil_coverage_<year>.tif) para leitura
+por janelas: grava uma cópia com blocos internos (tiles) de blockSize x
+blockSize pixels, compressão DEFLATE e overviews, além de um índice (JSON) com
+os limites dos blocos que têm dados e o tamanho e a data de modificação do
+arquivo original. O stationsLandUse usa a cópia automaticamente quando ela
+existe e foi gerada a partir do arquivo original atual (ver mapbiomasPath),
+então recortar um buffer de 1 km lê só alguns blocos de 256x256 em vez de
+faixas do país inteiro. Se o original for substituído, a cópia é ignorada até
+ser gerada de novo.
+
+Uso:
+    python prepareMapbiomas.py 2022 --block 256
+"""
+
+import os
+import json
+import argparse
+import numpy as np
+import rasterio as rs
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+
+def sourcePath(inputFolder,year):
+    """
+    Caminho do mosaico original brasil_coverage_<year>.tif.
+    """
+    return inputFolder+'/brasil_coverage_'+str(year)+'.tif'
+
+def sourceStamp(path):
+    """
+    Tamanho e data de modificação (ns) de um arquivo, usados para saber se a
+    cópia em blocos ainda corresponde ao original.
+    """
+    st = os.stat(path)
+    return [st.st_size,st.st_mtime_ns]
+
+def tiledPath(inputFolder,year):
+    """
+    Caminho da cópia em blocos do brasil_coverage_<year>.tif.
+    """
+    return inputFolder+'/brasil_coverage_'+str(year)+'_tiled.tif'
+
+def tileIndexPath(rasterPath):
+    """
+    Caminho do índice de blocos de um raster em blocos.
+    """
+    return os.path.splitext(rasterPath)[0]+'.tiles.json'
+
+def tiledMapbiomas(year,blockSize=256,overviews=(2,4,8,16,32)):
+    """
+    Grava a cópia em blocos, comprimida e com overviews do
+    brasil_coverage_<year>.tif e o índice dos blocos com dados.
+
+    Parameters
+    ----------
+    year : int
+        Ano do arquivo brasil_coverage_<year>.tif.
+    blockSize : int
+        Tamanho dos blocos internos em pixels (múltiplo de 16).
+    overviews : tuple
+        Fatores de redução das overviews (reamostragem pela moda, por ser um
+        raster de classes).
+
+    Returns
+    -------
+    outPath : path
+        Caminho da cópia em blocos.
+
+    """
+    rootDir = os.path.dirname(os.getcwd())
+    inputFolder = rootDir+'/inputs'
+    inPath = sourcePath(inputFolder,year)
+    stamp = sourceStamp(inPath)
+    outPath = tiledPath(inputFolder,year)
+
+    tiles = []
+    with rs.open(inPath) as src:
+        profile = src.profile.copy()
+        profile.update({'driver':'GTiff','tiled':True,
+                        'blockxsize':blockSize,'blockysize':blockSize,
+                        'compress':'deflate','zlevel':6,
+                        'BIGTIFF':'IF_SAFER'})
+        nodata = src.nodata if src.nodata is not None else 0
+        with rs.open(outPath,'w',**profile) as dst:
+            # Copia uma faixa de blocos por vez para limitar a memória
+            for row in range(0,src.height,blockSize):
+                height = min(blockSize,src.height-row)
+                strip = src.read(window=Window(0,row,src.width,height))
+                dst.write(strip,window=Window(0,row,src.width,height))
+                for col in range(0,src.width,blockSize):
+                    block = strip[:,:,col:col+blockSize]
+                    if np.any(block!=nodata):
+                        win = Window(col,row,block.shape[2],height)
+                        tiles.append([row//blockSize,col//blockSize]+
+                                     list(rs.windows.bounds(win,src.transform)))
+            dst.build_overviews(list(overviews),Resampling.mode)
+            dst.update_tags(ns='rio_overview',resampling='mode')
+
+        index = {'source':os.path.basename(inPath),
+                 'sourceStamp':stamp,
+                 'blockSize':blockSize,
+                 'width':src.width,'height':src.height,
+                 'transform':list(src.transform)[:6],
+                 'crs':str(src.crs),
+                 'columns':['row','col','minx','miny','maxx','maxy'],
+                 'tiles':tiles}
+    with open(tileIndexPath(outPath),'w') as f:
+        json.dump(index,f)
+    print('Mapbiomas '+str(year)+': '+str(len(tiles))+' blocos com dados de '+
+          str(-(-index['height']//blockSize)*-(-index['width']//blockSize)))
+    return outPath
+
+def loadTileIndex(rasterPath):
+    """
+    Lê o índice de blocos de um raster em blocos.
+
+    Returns
+    -------
+    blockSize : int
+        Tamanho dos blocos em pixels, ou None se não houver índice.
+    blocks : set
+        Conjunto de (linha, coluna) dos blocos com dados.
+
+    """
+    path = tileIndexPath(rasterPath)
+    if not os.path.exists(path):
+        return None, set()
+    with open(path) as f:
+        index = json.load(f)
+    return index['blockSize'], {(t[0],t[1]) for t in index['tiles']}
+
+def isCurrent(rasterPath,inPath):
+    """
+    Verifica se a cópia em blocos foi gerada a partir do arquivo original
+    atual (mesmo tamanho e data de modificação gravados no índice).
+
+    Returns
+    -------
+    current : bool
+        False se não houver índice, se o índice for de uma versão antiga (sem
+        sourceStamp) ou se o original mudou.
+
+    """
+    path = tileIndexPath(rasterPath)
+    if not (os.path.exists(path) and os.path.exists(inPath)):
+        return False
+    with open(path) as f:
+        index = json.load(f)
+    return index.get('sourceStamp')==sourceStamp(inPath)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Prepara o brasil_coverage_<ano>.tif para leitura por blocos.')
+    parser.add_argument('years',type=int,nargs='+',help='Anos do Mapbiomas')
+    parser.add_argument('--block',type=int,default=256,
+                        help='Tamanho dos blocos em pixels (padrão 256)')
+    args = parser.parse_args()
+    for year in args.years:
+        tiledMapbiomas(year,args.block)
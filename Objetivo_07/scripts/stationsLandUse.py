@@ -7,123 +7,956 @@ Created on Wed Sep 11 10:45:33 2024
 """
 
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
-from shapely.geometry import Point
 import geopandas as gpd
+import shapely
 #import matplotlib.pyplot as plt
 import rasterio as rs
 import rasterio.mask
+import rasterio.features
+import rasterio.windows
+from rasterio.errors import WindowError
 import numpy as np
 import ismember
+import geocache
+import geodesy
+import prepareMapbiomas
+import landUseStore
+import clipStore
+import inventoryDelta
+import instrument
 
 
-def stationBuffers(file,bufferSize): 
+def loadStations(file):
+    """
+    Lê o inventário de estações e agrupa as linhas (uma por estação x poluente)
+    em uma linha por estação, identificada por ESTAÇÃO + coordenadas.
+
+    Parameters
+    ----------
+    file : str
+        Nome do arquivo do inventário na pasta de inputs.
+
+    Returns
+    -------
+    gdf : geodataframe
+        Uma linha por estação (EPSG:4326), na ordem e com o índice da primeira
+        linha de cada estação no arquivo. A coluna 'POLUENTES MONITORADOS'
+        passa a ter todos os poluentes da estação separados por ';' e a coluna
+        'POLUENTES_MASK' tem os mesmos poluentes como máscara de bits, na ordem
+        de gdf.attrs['POLUENTES']. ESTADO, TIPO e STATUS são categóricas.
+        Quando as linhas de uma estação discordam, STATUS é 'Ativa' se algum
+        poluente estiver ativo (os ativos ficam em 'POLUENTES_ATIVOS_MASK') e
+        TIPO tem os tipos distintos separados por ';'. As estações nessas
+        condições são avisadas.
+
+    """
     rootDir = os.path.dirname(os.getcwd())
     inputFolder = rootDir+'/inputs'
-    df = pd.read_csv(inputFolder+'/'+file)
-    geometry = [Point(xy) for xy in zip(df.LONGITUDE, df.LATITUDE)]
-    gdf = gpd.GeoDataFrame(df, crs="EPSG:4326", geometry=geometry)
-    gdf = gdf.set_crs(4326, allow_override=True)
-    gdfMeter = gpd.GeoDataFrame(gdf, crs=4326).to_crs('EPSG:3857')
-    gdfBuffer = gdfMeter.buffer(bufferSize)
-    gdfBuffer = gdfBuffer.to_crs('EPSG:4326')
-    gdf['buffer'] = gdfBuffer
-    gdf = gdf.drop_duplicates(subset=['geometry'])
+    df = pd.read_csv(inputFolder+'/'+file,
+                     dtype={'ESTADO':'category','TIPO':'category',
+                            'STATUS':'category','POLUENTES MONITORADOS':'category'})
+    key = ['ESTAÇÃO','LATITUDE','LONGITUDE']
+
+    pollutants = df['POLUENTES MONITORADOS'].cat.categories
+    if len(pollutants)>63:
+        raise ValueError('Mais de 63 poluentes não cabem na POLUENTES_MASK')
+    station = df.groupby(key,sort=False).ngroup().to_numpy()
+    perStation = pd.DataFrame({'station':station,
+                               'pol':df['POLUENTES MONITORADOS'].astype(str),
+                               'bit':np.left_shift(1,df['POLUENTES MONITORADOS'].cat.codes.to_numpy(dtype=np.int64))})
+    active = (df['STATUS']=='Ativa').to_numpy()
+    nStations = station.max()+1 if len(station) else 0
+    activeBits = perStation[active].drop_duplicates(['station','pol'])
+    activeBits = activeBits.groupby('station')['bit'].sum().reindex(range(nStations),fill_value=0)
+    perStation = perStation.drop_duplicates(['station','pol'])
+    byStation = perStation.groupby('station',sort=True)
+
+    stations = df[~df.duplicated(key)].copy()
+    stations['POLUENTES MONITORADOS'] = byStation['pol'].agg(';'.join).to_numpy()
+    stations['POLUENTES_MASK'] = byStation['bit'].sum().to_numpy()
+    stations['POLUENTES_ATIVOS_MASK'] = activeBits.to_numpy()
+
+    # TIPO e STATUS podem mudar entre os poluentes de uma mesma estação: a
+    # estação é ativa se algum poluente é ativo e os tipos distintos são unidos
+    anyActive = stations['POLUENTES_ATIVOS_MASK'].to_numpy()>0
+    nStatus = pd.Series(df['STATUS'].to_numpy()).groupby(station).nunique().to_numpy()
+    status = stations['STATUS'].astype(object)
+    status[anyActive] = 'Ativa'
+    stations['STATUS'] = status.astype('category')
+    tipos = pd.DataFrame({'station':station,'tipo':df['TIPO'].astype(str)})
+    tipos = tipos[df['TIPO'].notna().to_numpy()].drop_duplicates()
+    tipos = tipos.groupby('station')['tipo'].agg(';'.join)
+    multi = tipos.str.contains(';').reindex(range(nStations),fill_value=False).to_numpy()
+    if multi.any():
+        tipo = stations['TIPO'].astype(object)
+        tipo[multi] = tipos.reindex(range(nStations)).to_numpy()[multi]
+        stations['TIPO'] = tipo.astype('category')
+    if multi.any() or (nStatus>1).any():
+        print('Aviso: '+str(int(multi.sum()))+' estações com TIPO e '+
+              str(int((nStatus>1).sum()))+' com STATUS diferentes entre poluentes '+
+              '(TIPO unido com ";" e STATUS ativo se algum poluente é ativo)')
+    gdf = gpd.GeoDataFrame(stations,crs="EPSG:4326",
+                           geometry=gpd.points_from_xy(stations.LONGITUDE,
+                                                       stations.LATITUDE))
+    gdf.attrs['POLUENTES'] = list(pollutants)
     return gdf
 
+@instrument.timed()
+def stationBuffers(file,bufferSize,crs='EPSG:4326'): 
+    """
+    Lê o inventário de estações e cria os buffers geodésicos de raio
+    bufferSize (m no terreno) ao redor de cada local de estação, com todos os
+    vértices calculados de uma vez (geodesy.circles). Diferente do buffer em
+    EPSG:3857, o raio é o mesmo em qualquer latitude.
+
+    Parameters
+    ----------
+    file : str
+        Nome do arquivo do inventário na pasta de inputs.
+    bufferSize : float
+        Raio do buffer em metros.
+    crs : str
+        CRS das geometrias retornadas. O padrão EPSG:4326 é o do Mapbiomas;
+        para o analisesObjetivo07 e o cover_pop use geodesy.WORK_CRS (ver o
+        contrato de CRS em geodesy.py). A transformação é feita uma única vez,
+        aqui.
+
+    Returns
+    -------
+    gdf : geodataframe
+        Estações com as colunas 'geometry' e 'buffer' no CRS pedido.
+
+    """
+    rootDir = os.path.dirname(os.getcwd())
+    inputFolder = rootDir+'/inputs'
+    gdf = loadStations(file)
+    # Uma linha por local, como no drop_duplicates(subset=['geometry']) anterior,
+    # mas antes de calcular os buffers
+    gdf = gdf.drop_duplicates(subset=['LATITUDE','LONGITUDE'])
+    if gdf.crs != crs:
+        gdf = gdf.to_crs(crs)
+
+    def build():
+        gdfBuffer = gpd.GeoSeries(geodesy.circles(gdf.LONGITUDE,gdf.LATITUDE,
+                                                  bufferSize),
+                                  index=gdf.index,crs='EPSG:4326')
+        if gdfBuffer.crs != crs:
+            gdfBuffer = gdfBuffer.to_crs(crs)
+        instrument.count('buffers_calculados',len(gdfBuffer))
+        return gpd.GeoDataFrame(geometry=gdfBuffer)
+
+    # Buffers reaproveitados do cache enquanto o inventário não mudar
+    gdf['buffer'] = geocache.cached(
+        'stationBuffers',[geocache.file_hash(inputFolder+'/'+file),'porLocal',
+                          'geodesico',str(crs),bufferSize],build).geometry
+    return gdf
+
+@instrument.timed()
 def stationUnionByUF(gdf):
-    stationInUF=[]
-    for index, uf in enumerate(gdf['ESTADO'].unique()):
-       stationInUF.append(gdf['buffer'][gdf['ESTADO']==uf].unary_union)
-       
-    stationInUF = pd.DataFrame(stationInUF,columns=["geometry"])   
-    stationInUF = gpd.GeoDataFrame(stationInUF, geometry=stationInUF['geometry'],
-                                   crs="EPSG:4326")
-    stationInUF['ESTAÇÃO'] = gdf['ESTADO'].unique()
+    def build():
+        stationInUF=[]
+        for index, uf in enumerate(gdf['ESTADO'].unique()):
+           stationInUF.append(gdf['buffer'][gdf['ESTADO']==uf].unary_union)
+        instrument.count('geometrias_unidas',len(gdf))
+           
+        stationInUF = pd.DataFrame(stationInUF,columns=["geometry"])   
+        stationInUF = gpd.GeoDataFrame(stationInUF, geometry=stationInUF['geometry'],
+                                       crs=gdf['buffer'].crs)
+        stationInUF['ESTAÇÃO'] = gdf['ESTADO'].unique()
+        return stationInUF
+
+    # União por UF reaproveitada do cache enquanto os buffers não mudarem
+    buffers = gpd.GeoDataFrame(gdf[['ESTADO']], geometry=gdf['buffer'])
+    stationInUF = geocache.cached('stationUnionByUF',
+                                  [geocache.gdf_hash(buffers),'ESTADO'],build)
     stationInUF['buffer'] = stationInUF['geometry'].copy() 
     
     return stationInUF
 
-def cutMapbiomas(gdf,year,prefix,pixelSize):
+def legendIndex(inputFolder):
     """
-    Esta função é utilizada para cortar o arquivo do Mapbiomas para o domínio 
-    de modelagem. Se o domínio for muito grande, ela simplesmente lê o arquivo
-    original sem cortar. 
-    
-    FUNÇÃO NÃO ESTÁ SENDO UTILIZADA NA VERSÃO ATUAL
+    Lê a legenda do Mapbiomas e monta o índice código -> coluna usado para
+    montar as tabelas de uso do solo.
 
     Parameters
     ----------
-    domainShp : geodataframe
-        Geodataframe com a geometria do domínio de modelagem.
     inputFolder : path
         Caminho para a pasta de inputs.
-    outfolder : path
-        Caminho para a pasta de outputs.
+
+    Returns
+    -------
+    codes : numpy array
+        Códigos das classes (coluna 'Code ID'), na ordem da legenda.
+    lookup : numpy array
+        Vetor em que lookup[código] é a coluna da classe em codes, ou -1 se o
+        código não está na legenda.
+
+    """
+    dfLegend = pd.read_csv(inputFolder+'/mapbiomasLegend.csv')
+    codes = dfLegend['Code ID'].to_numpy()
+    lookup = np.full(max(int(codes.max())+1,256),-1,dtype=np.intp)
+    lookup[codes] = np.arange(len(codes))
+    return codes, lookup
+
+def countsMatrix(results,lookup,ncodes):
+    """
+    Junta os resultados (valores, contagens) de cada recorte em uma matriz
+    (linhas x classes) de número de pixels. O valor 0 (fora do recorte) e
+    códigos fora da legenda são descartados.
+    """
+    rows = np.concatenate([np.full(len(vals),ii,dtype=np.intp)
+                           for ii,(vals,_) in enumerate(results)]+[np.empty(0,np.intp)])
+    vals = np.concatenate([np.asarray(vals,dtype=np.intp).ravel()
+                           for vals,_ in results]+[np.empty(0,np.intp)])
+    cnts = np.concatenate([np.asarray(cnt).ravel()
+                           for _,cnt in results]+[np.empty(0,np.int64)])
+    counts = np.zeros((len(results),ncodes),dtype=np.int64)
+    cols = np.full(len(vals),-1,dtype=np.intp)
+    known = (vals>0) & (vals<len(lookup))
+    cols[known] = lookup[vals[known]]
+    ok = cols>=0
+    counts[rows[ok],cols[ok]] = cnts[ok]
+    return counts
+
+def assignLandUse(gdf,counts,codes,pixelSize):
+    """
+    Escreve no gdf uma coluna por classe do Mapbiomas com a área (número de
+    pixels x pixelSize). Classes sem pixels ficam como nan.
+    """
+    gdf[[str(dl) for dl in codes]] = np.where(counts>0,counts*pixelSize,np.nan)
+    return gdf
+
+def saveLandUse(gdf,outfolder,prefix,csv=False):
+    """
+    Grava a tabela de uso do solo das estações uma única vez em GeoParquet
+    (<prefix>stationsLandUse.parquet, buffer em WKB) e, se csv=True, exporta
+    também os CSVs <prefix>stationsLandUse.csv e
+    <prefix>stationsLandUseNoGeometry.csv. Retorna a tabela sem o buffer.
+    """
+    name = prefix+'stationsLandUse'
+    landUseStore.saveTable(gdf,outfolder,name)
+    if csv:
+        landUseStore.exportCSV(outfolder,name)
+        landUseStore.exportCSV(outfolder,name,name+'NoGeometry',geometry=False)
+    return gdf.drop(columns=['buffer'])
+
+def mapbiomasPath(inputFolder,year):
+    """
+    Caminho do Mapbiomas de um ano. Usa a cópia em blocos gerada pelo
+    prepareMapbiomas (brasil_coverage_<year>_tiled.tif) quando ela existe e
+    foi gerada a partir do arquivo original atual, e o arquivo original caso
+    contrário.
+    """
+    source = prepareMapbiomas.sourcePath(inputFolder,year)
+    tiled = prepareMapbiomas.tiledPath(inputFolder,year)
+    if os.path.exists(tiled):
+        if prepareMapbiomas.isCurrent(tiled,source):
+            return tiled
+        print('Aviso: '+os.path.basename(tiled)+' não corresponde ao '+
+              os.path.basename(source)+' atual e será ignorado '+
+              '(rode o prepareMapbiomas de novo)')
+    return source
+
+def _blockGrid(src,tileSize):
+    """
+    Alinha o tamanho do bloco de agrupamento aos blocos internos do raster e
+    lê o índice de blocos com dados, se houver (ver prepareMapbiomas).
+    """
+    blocks = None
+    if src.profile.get('tiled'):
+        by,bx = src.block_shapes[0]
+        tileSize = -(-tileSize//max(by,bx))*max(by,bx)
+        blockSize, nonEmpty = prepareMapbiomas.loadTileIndex(src.name)
+        if blockSize is not None and blockSize==by==bx:
+            blocks = (blockSize,nonEmpty)
+    return tileSize, blocks
+
+def _hasData(win,blocks):
+    """
+    Verifica se a janela toca algum bloco com dados do índice de blocos.
+    """
+    if blocks is None:
+        return True
+    blockSize, nonEmpty = blocks
+    r0 = int(win.row_off)//blockSize
+    r1 = (int(win.row_off+win.height)-1)//blockSize
+    c0 = int(win.col_off)//blockSize
+    c1 = (int(win.col_off+win.width)-1)//blockSize
+    return any((rr,cc) in nonEmpty
+               for rr in range(r0,r1+1) for cc in range(c0,c1+1))
+
+def _windowGroups(src,geoms,tileSize=2048):
+    """
+    Calcula a janela de leitura de cada geometria no raster e agrupa as
+    janelas próximas em janelas compartilhadas.
+
+    Geometrias cuja janela começa no mesmo bloco de tileSize x tileSize pixels
+    são lidas juntas. Geometrias maiores que um bloco (ex. união por UF) ficam
+    em um grupo próprio.
+
+    Parameters
+    ----------
+    src : rasterio dataset
+        Raster aberto para leitura.
+    geoms : list
+        Lista de geometrias (shapely) no CRS do raster. Elementos None são
+        ignorados.
+    tileSize : int
+        Tamanho do bloco de agrupamento, em pixels.
+
+    Returns
+    -------
+    groups : list
+        Lista de tuplas (janela do grupo, [(índice, janela da geometria)]).
+
+    """
+    buckets = {}
+    for ii,geom in enumerate(geoms):
+        if geom is None:
+            continue
+        try:
+            win = rasterio.features.geometry_window(src,[geom])
+        except WindowError:
+            continue
+        win = win.round_offsets().round_lengths()
+        if win.height>tileSize or win.width>tileSize:
+            key = ('single',ii)
+        else:
+            key = (win.row_off//tileSize,win.col_off//tileSize)
+        buckets.setdefault(key,[]).append((ii,win))
+
+    groups = []
+    for members in buckets.values():
+        row0 = min(w.row_off for _,w in members)
+        col0 = min(w.col_off for _,w in members)
+        row1 = max(w.row_off+w.height for _,w in members)
+        col1 = max(w.col_off+w.width for _,w in members)
+        groups.append((rasterio.windows.Window(col0,row0,col1-col0,row1-row0),
+                       members))
+    return groups
+
+def missesRaster(src,geoms):
+    """
+    Indica as geometrias cuja janela não toca o raster, ou seja, as que fazem o
+    rasterio.mask.mask falhar e o cutMapbiomas recortar com a geometria da
+    estação. Buffers que tocam o raster mas só têm nodata não entram.
+
+    Returns
+    -------
+    miss : numpy array
+        True para as geometrias fora do raster.
+
+    """
+    miss = np.zeros(len(geoms),dtype=bool)
+    for ii,geom in enumerate(geoms):
+        try:
+            rasterio.features.geometry_window(src,[geom])
+        except WindowError:
+            miss[ii] = True
+    return miss
+
+def zonalHistogram(src,geoms,codes,tileSize=2048):
+    """
+    Conta os pixels de cada classe do Mapbiomas dentro de cada geometria,
+    abrindo o raster uma única vez e lendo apenas as janelas tocadas pelas
+    geometrias.
+
+    O critério de inclusão do pixel é o mesmo do rasterio.mask.mask (centro do
+    pixel dentro da geometria) e pixels com valor nodata não são contados.
+    Se o raster foi preparado com o prepareMapbiomas, os grupos de janelas são
+    alinhados aos blocos internos e janelas só com blocos vazios não são lidas.
+
+    Parameters
+    ----------
+    src : rasterio dataset
+        Raster do Mapbiomas aberto para leitura.
+    geoms : list
+        Lista de geometrias (shapely) no CRS do raster.
+    codes : array
+        Códigos das classes do Mapbiomas (coluna 'Code ID' da legenda).
+    tileSize : int
+        Tamanho do bloco de agrupamento das janelas, em pixels.
+
+    Returns
+    -------
+    counts : numpy array
+        Matriz (geometrias x classes) com o número de pixels de cada classe.
+        Geometrias fora do raster ficam com contagem zero.
+
+    """
+    plan = histogramPlan(src,geoms,tileSize)
+    return planHistogram(src,plan,codes)
+
+def histogramPlan(src,geoms,tileSize=2048):
+    """
+    Calcula uma vez as janelas de leitura e as máscaras (centro do pixel dentro
+    da geometria) de cada geometria no grid do raster. O plano pode ser usado
+    com o planHistogram em qualquer raster com o mesmo grid, como os
+    brasil_coverage_<year>.tif de anos diferentes.
+
+    Parameters
+    ----------
+    src : rasterio dataset
+        Raster do Mapbiomas aberto para leitura.
+    geoms : list
+        Lista de geometrias (shapely) no CRS do raster.
+    tileSize : int
+        Tamanho do bloco de agrupamento das janelas, em pixels.
+
+    Returns
+    -------
+    plan : dict
+        Grid do raster ('transform', 'shape'), número de geometrias ('n') e
+        grupos de janelas ('groups'), cada um como (janela do grupo,
+        [(índice, linha, coluna, forma, transform, máscara)]). Para
+        geometrias maiores que tileSize x tileSize a máscara é a própria
+        geometria.
+
+    """
+    tileSize, blocks = _blockGrid(src,tileSize)
+    groups = []
+    for groupWin, members in _windowGroups(src,geoms,tileSize):
+        planned = []
+        for ii,win in members:
+            shape = (int(win.height),int(win.width))
+            wtransform = src.window_transform(win)
+            # Geometrias maiores que um bloco (ex. união por UF) guardam só a
+            # geometria e a máscara é calculada na leitura
+            if shape[0]*shape[1]<=tileSize*tileSize:
+                inside = rasterio.features.geometry_mask(
+                    [geoms[ii]],out_shape=shape,transform=wtransform,
+                    invert=True)
+            else:
+                inside = geoms[ii]
+            planned.append((ii,int(win.row_off-groupWin.row_off),
+                            int(win.col_off-groupWin.col_off),shape,
+                            wtransform,inside))
+        groups.append((groupWin,planned))
+    return {'transform':src.transform,'shape':src.shape,
+            'n':len(geoms),'groups':groups}
+
+def planHistogram(src,plan,codes):
+    """
+    Conta os pixels de cada classe dentro das geometrias de um plano calculado
+    pelo histogramPlan. Pixels com valor nodata não são contados.
+
+    Parameters
+    ----------
+    src : rasterio dataset
+        Raster do Mapbiomas aberto para leitura, com o mesmo grid do plano.
+    plan : dict
+        Plano calculado pelo histogramPlan.
+    codes : array
+        Códigos das classes do Mapbiomas (coluna 'Code ID' da legenda).
+
+    Returns
+    -------
+    counts : numpy array
+        Matriz (geometrias x classes) com o número de pixels de cada classe.
+
+    """
+    if src.transform!=plan['transform'] or src.shape!=plan['shape']:
+        raise ValueError('O raster '+src.name+' não tem o mesmo grid do plano')
+    codes = np.asarray(codes)
+    nbins = int(codes.max())+1
+    counts = np.zeros((plan['n'],len(codes)),dtype=np.int64)
+    _, blocks = _blockGrid(src,1)
+    for groupWin, members in plan['groups']:
+        if not _hasData(groupWin,blocks):
+            continue
+        with instrument.stage('leitura_raster'):
+            arr = src.read(1,window=groupWin,masked=True)
+        instrument.count('pixels_lidos',arr.size)
+        for ii,r0,c0,shape,wtransform,inside in members:
+            if not isinstance(inside,np.ndarray):
+                inside = rasterio.features.geometry_mask(
+                    [inside],out_shape=shape,transform=wtransform,invert=True)
+            sub = arr[r0:r0+shape[0],c0:c0+shape[1]]
+            sel = inside & ~np.ma.getmaskarray(sub)
+            vals = sub.data[sel].astype(np.intp)
+            counts[ii,:] = np.bincount(vals,minlength=nbins)[codes]
+    return counts
+
+@instrument.timed()
+def landUseHistogram(gdf,year,prefix,pixelSize,tileSize=2048,csv=False):
+    """
+    Versão do cutMapbiomas que calcula a área de cada classe do Mapbiomas
+    dentro dos buffers com o zonalHistogram, sem recortar e salvar um GeoTIFF
+    por estação. Gera as mesmas tabelas de saída do cutMapbiomas.
+
+    Parameters
+    ----------
+    gdf : geodataframe
+        Geodataframe com as colunas 'geometry' e 'buffer' (EPSG:4326).
     year : int
-        Ano de referência para a modelagem.
-    GRDNAM : str
-        Nome da grade de modelagem de acordo com o MCIP.
+        Ano do arquivo brasil_coverage_<year>.tif.
+    prefix : str
+        Prefixo dos arquivos de saída.
+    pixelSize : float
+        Área de um pixel do Mapbiomas.
+    tileSize : int
+        Tamanho do bloco de agrupamento das janelas, em pixels.
+    csv : bool
+        Se True, exporta também as tabelas em CSV.
 
     Returns
     -------
-    out_meta : rasterio
-        Detalhes do raster.
-    arr : rasterio
-        Array do raster.
+    gdf : dataframe
+        Tabela com a área de cada classe por estação e a classe majoritária.
 
     """
     rootDir = os.path.dirname(os.getcwd())
     inputFolder = rootDir+'/inputs'
     outfolder = rootDir+'/outputs/mapbiomas'
     os.makedirs(outfolder, exist_ok=True)
-    
-    dfLegend = pd.read_csv(inputFolder+'/mapbiomasLegend.csv')
-    
-    for dl in dfLegend['Code ID']:
-        gdf[str(dl)] = np.nan  
 
+    codes, lookup = legendIndex(inputFolder)
 
-    for index, row in gdf.iterrows():
-        # Abrindo o arquivo do MAPBIOMAS
-        with rs.open(inputFolder+'/brasil_coverage_'+str(year)+'.tif') as src:
-    
-            # Tenta abrir e cortar o arquivo. Se for muito grande, não cortará e passará
-            # para o except
-            #  Abrindo raster e cortando
-            try:
-                out_image, out_transform = rasterio.mask.mask(src,[row.buffer],
-                                                              crop=True)
-            except:
-                out_image, out_transform = rasterio.mask.mask(src,[row.geometry],
-                                                              crop=True)
+    with rs.open(mapbiomasPath(inputFolder,year)) as src:
+        counts = zonalHistogram(src,list(gdf['buffer']),codes,tileSize)
+        # Assim como no cutMapbiomas, se o buffer não tocar o raster tenta
+        # com a geometria da estação
+        miss = np.where(missesRaster(src,list(gdf['buffer'])))[0]
+        if len(miss)>0:
+            counts[miss,:] = zonalHistogram(
+                src,list(gdf['geometry'].iloc[miss]),codes,tileSize)
+
+    gdf = assignLandUse(gdf,counts,codes,pixelSize)
+    gdf = majorLandUse(gdf,inputFolder)
+    gdf = gdf.drop(columns=['geometry'])
+    return saveLandUse(gdf,outfolder,prefix,csv)
+
+def _yearCounts(task):
+    """
+    Tarefa do pool do landUseTimeSeries: conta as classes de um ano com os
+    planos dos buffers e das estações.
+    """
+    year, rasterPath, plans, codes = task
+    with rs.open(rasterPath) as src:
+        return year, [planHistogram(src,plan,codes) for plan in plans]
+
+@instrument.timed()
+def landUseTimeSeries(gdf,years,prefix,pixelSize,workers=None,tileSize=2048,
+                      csv=False):
+    """
+    Área de cada classe do Mapbiomas nos buffers das estações para vários anos.
+    As janelas e máscaras das estações são calculadas uma vez (histogramPlan)
+    e os rasters de cada ano são lidos com o mesmo plano, em paralelo entre
+    anos. Como no landUseHistogram, se o buffer não tocar o raster é usada a
+    geometria da estação.
+
+    Parameters
+    ----------
+    gdf : geodataframe
+        Geodataframe com as colunas 'geometry' e 'buffer' (EPSG:4326).
+    years : list
+        Anos dos arquivos brasil_coverage_<year>.tif, todos com o mesmo grid.
+    prefix : str
+        Prefixo dos arquivos de saída.
+    pixelSize : float
+        Área de um pixel do Mapbiomas.
+    workers : int
+        Número de processos (um ano por tarefa). Se None ou 1, os anos são
+        lidos no processo atual.
+    tileSize : int
+        Tamanho do bloco de agrupamento das janelas, em pixels.
+    csv : bool
+        Se True, exporta também as tabelas em CSV.
+
+    Returns
+    -------
+    series : dataframe
+        Tabela longa estação x ano x classe com as colunas 'ESTAÇÃO' (se
+        existir no gdf), 'ANO', 'CLASSE' e 'AREA'. O índice é o do gdf.
+    change : dataframe
+        Uma linha por estação com a classe majoritária de cada ano
+        ('majorLandUse_<ano>'), a do primeiro e do último ano, o número de
+        transições da classe majoritária e o ano da primeira transição.
+
+    """
+    rootDir = os.path.dirname(os.getcwd())
+    inputFolder = rootDir+'/inputs'
+    outfolder = rootDir+'/outputs/mapbiomas'
+    os.makedirs(outfolder, exist_ok=True)
+
+    years = list(years)
+    codes, lookup = legendIndex(inputFolder)
+    with rs.open(mapbiomasPath(inputFolder,years[0])) as src:
+        plans = [histogramPlan(src,list(gdf['buffer']),tileSize),
+                 histogramPlan(src,list(gdf['geometry']),tileSize)]
+        miss = missesRaster(src,list(gdf['buffer']))
+
+    tasks = [(year,mapbiomasPath(inputFolder,year),plans,codes)
+             for year in years]
+    start = time.time()
+    if workers is None or workers<=1:
+        results = dict(map(_yearCounts,tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = dict(instrument.pool_map(executor,_yearCounts,tasks))
+    print('Mapbiomas: '+str(len(years))+' anos em '+
+          '{:.1f}'.format(time.time()-start)+' s')
+
+    frames = []
+    major = {}
+    for year in years:
+        counts, pointCounts = results[year]
+        counts[miss,:] = pointCounts[miss,:]
+        rows, cols = np.nonzero(counts)
+        frame = pd.DataFrame({'ANO':year,'CLASSE':codes[cols],
+                              'AREA':counts[rows,cols]*pixelSize},
+                             index=gdf.index[rows])
+        if 'ESTAÇÃO' in gdf.columns:
+            frame.insert(0,'ESTAÇÃO',gdf['ESTAÇÃO'].to_numpy()[rows])
+        frames.append(frame)
+        major[year] = np.where(counts.any(axis=1),
+                               codes[np.argmax(counts,axis=1)],-1)
+    series = pd.concat(frames).sort_index(kind='stable')
+
+    majorByYear = np.column_stack([major[year] for year in years])
+    change = pd.DataFrame(majorByYear,index=gdf.index,
+                          columns=['majorLandUse_'+str(year) for year in years])
+    change = change.replace(-1,np.nan)
+    if 'ESTAÇÃO' in gdf.columns:
+        change.insert(0,'ESTAÇÃO',gdf['ESTAÇÃO'].to_numpy())
+    steps = majorByYear[:,1:]!=majorByYear[:,:-1]
+    change['majorLandUse_inicial'] = change['majorLandUse_'+str(years[0])]
+    change['majorLandUse_final'] = change['majorLandUse_'+str(years[-1])]
+    change['TRANSICOES'] = steps.sum(axis=1)
+    change['ANO_PRIMEIRA_TRANSICAO'] = np.where(
+        steps.any(axis=1),np.array(years[1:])[np.argmax(steps,axis=1)],
+        np.nan) if len(years)>1 else np.nan
+
+    for table,name in [(series,prefix+'stationsLandUseTimeSeries'),
+                       (change,prefix+'stationsLandUseChange')]:
+        landUseStore.saveTable(table,outfolder,name)
+        if csv:
+            landUseStore.exportCSV(outfolder,name)
+    return series, change
+
+# Raster do Mapbiomas aberto em cada processo do pool (ver _openMapbiomas)
+_mapbiomasSrc = None
+
+def _openMapbiomas(rasterPath):
+    """
+    Inicializador dos processos do pool: cada processo mantém o seu próprio
+    dataset do rasterio aberto durante toda a execução.
+    """
+    global _mapbiomasSrc
+    _mapbiomasSrc = rs.open(rasterPath)
+
+def _clipStations(src,stations,outfolder,sink=None):
+    """
+    Recorta o Mapbiomas para cada estação e conta os pixels de cada classe.
+
+    Parameters
+    ----------
+    src : rasterio dataset
+        Raster do Mapbiomas aberto para leitura.
+    stations : list
+        Lista de tuplas (buffer, geometria, nome da estação).
+    outfolder : path
+        Pasta onde são salvos os recortes em GeoTIFF. Se None, os recortes
+        não são salvos em GeoTIFF.
+    sink : function
+        Função sink(nome, recorte, transform) chamada com cada recorte (ex.
+        ClipStore.put). Se None, não é chamada.
+
+    Returns
+    -------
+    results : list
+        Lista de tuplas (valores, contagens) do np.unique de cada recorte.
+
+    """
+    results = []
+    for buffer, geometry, name in stations:
+        # Tenta abrir e cortar o arquivo. Se for muito grande, não cortará e passará
+        # para o except
+        try:
+            out_image, out_transform = rasterio.mask.mask(src,[buffer],
+                                                          crop=True)
+        except:
+            out_image, out_transform = rasterio.mask.mask(src,[geometry],
+                                                          crop=True)
+        if outfolder is not None:
             # Extraindo propriedades do raster
             out_meta = src.meta
             out_meta.update({"driver": "GTiff",
                          "height": out_image.shape[1],
                          "width": out_image.shape[2],
                          "transform": out_transform})
-            # Se conseguir recortar...
-            if out_meta:   
-                # Abre um novo arquvio e salva na pasta de outputs recortado
-                with rs.open(outfolder+'/mapbiomas_'+row['ESTAÇÃO'].replace('/','')+'.tif', "w", **out_meta) as dest:
-                    dest.write(out_image)
-
-     
-            values, counts = np.unique(out_image.flatten(), return_counts=True)
-            counts = counts*pixelSize
-            for ii,val in enumerate(values):
-                if val!=0:
-                    gdf.loc[index,gdf.columns[gdf.columns==str(val)]] = counts[ii]
-    gdf = majorLandUse(gdf,inputFolder)
+            # Abre um novo arquvio e salva na pasta de outputs recortado
+            with rs.open(outfolder+'/mapbiomas_'+name.replace('/','')+'.tif', "w", **out_meta) as dest:
+                dest.write(out_image)
+        if sink is not None:
+            sink(name,out_image,out_transform)
+
+        results.append(np.unique(out_image.flatten(), return_counts=True))
+    return results
+
+def _clipTask(task):
+    """
+    Tarefa executada nos processos do pool. Retorna o pid do processo, os
+    resultados do _clipStations, o tempo gasto e, se keep=True, os recortes
+    (nome, recorte, transform) para serem gravados no processo principal.
+    """
+    stations, outfolder, keep = task
+    start = time.perf_counter()
+    clips = []
+    sink = (lambda *clip: clips.append(clip)) if keep else None
+    with instrument.stage('leitura_raster'):
+        results = _clipStations(_mapbiomasSrc,stations,outfolder,sink)
+    return os.getpid(), results, time.perf_counter()-start, clips
+
+def _runClips(gdf,rasterPath,outfolder,workers=None,store=None):
+    """
+    Recorta o Mapbiomas para todas as linhas do gdf, em série ou dividindo as
+    estações entre um pool de processos. Os resultados são devolvidos na ordem
+    das linhas do gdf, então as saídas são idênticas nos dois modos.
+
+    Parameters
+    ----------
+    gdf : geodataframe
+        Geodataframe com as colunas 'buffer', 'geometry' e 'ESTAÇÃO'.
+    rasterPath : path
+        Caminho do raster do Mapbiomas.
+    outfolder : path
+        Pasta onde são salvos os recortes em GeoTIFF. Se None, não salva.
+    workers : int
+        Número de processos. Se None ou 1, executa no processo atual.
+    store : ClipStore
+        Contêiner onde os recortes são gravados em segundo plano. Se None,
+        não grava.
+
+    Returns
+    -------
+    results : list
+        Lista de tuplas (valores, contagens), uma por linha do gdf.
+
+    """
+    stations = list(zip(gdf['buffer'],gdf['geometry'],gdf['ESTAÇÃO']))
+    instrument.count('estacoes_processadas',len(stations))
+    if not workers or workers<=1:
+        start = time.perf_counter()
+        with rs.open(rasterPath) as src, instrument.stage('leitura_raster'):
+            results = _clipStations(src,stations,outfolder,
+                                    None if store is None else store.put)
+        instrument.count('pixels_lidos',sum(int(np.sum(cnt)) for _,cnt in results))
+        print('Recorte do Mapbiomas: '+str(len(stations))+' geometrias em '+
+              '{:.1f}'.format(time.perf_counter()-start)+' s')
+        return results
+
+    # Divide as estações em pedaços menores que o número de processos para
+    # equilibrar a carga entre eles
+    nshards = min(len(stations),workers*4)
+    shards = [list(sh) for sh in np.array_split(np.arange(len(stations)),nshards)]
+    tasks = [([stations[ii] for ii in sh],outfolder,store is not None)
+             for sh in shards]
+    results = []
+    summary = {}
+    with ProcessPoolExecutor(max_workers=workers,initializer=_openMapbiomas,
+                             initargs=(rasterPath,)) as executor:
+        for pid, shardResults, elapsed, clips in instrument.pool_map(executor,_clipTask,tasks):
+            results.extend(shardResults)
+            for clip in clips:
+                store.put(*clip)
+            nst, tt = summary.get(pid,(0,0.0))
+            summary[pid] = (nst+len(shardResults),tt+elapsed)
+            print('Recorte do Mapbiomas: '+str(len(results))+'/'+
+                  str(len(stations))+' geometrias')
+    for pid,(nst,tt) in summary.items():
+        print('  processo '+str(pid)+': '+str(nst)+' geometrias em '+
+              '{:.1f}'.format(tt)+' s')
+    instrument.count('pixels_lidos',sum(int(np.sum(cnt)) for _,cnt in results))
+    return results
+
+@instrument.timed()
+def cutMapbiomas(gdf,year,prefix,pixelSize,workers=None,csv=False,
+                 clips='tif'):
+    """
+    Esta função é utilizada para cortar o arquivo do Mapbiomas no buffer de
+    cada estação (ou na união por UF) e calcular a área de cada classe de uso
+    do solo. Se o buffer não intersecta o raster, o recorte é feito no ponto
+    da estação. A tabela é gravada em <prefix>stationsLandUse (ver
+    saveLandUse).
+
+    Parameters
+    ----------
+    gdf : geodataframe
+        Estações com as colunas 'buffer', 'geometry' e 'ESTAÇÃO'
+        (stationBuffers ou stationUnionByUF), em EPSG:4326.
+    year : int
+        Ano do Mapbiomas (brasil_coverage_<year>.tif).
+    prefix : str
+        Prefixo da tabela de saída e do contêiner de recortes.
+    pixelSize : float
+        Área de cada pixel (m²).
+    workers : int
+        Número de processos para recortar as estações em paralelo. Se None
+        ou 1, as estações são recortadas no processo atual.
+    csv : bool
+        Se True, exporta também as tabelas em CSV.
+    clips : str
+        Como salvar os recortes de cada estação: 'tif' (um GeoTIFF por
+        estação, mapbiomas_<ESTAÇÃO>.tif), 'store' (um único contêiner
+        <prefix>mapbiomasClips.bin/.json, ver clipStore) ou None (não salva).
+
+    Returns
+    -------
+    gdf : geodataframe
+        Estações com a área de cada classe (uma coluna por código da
+        legenda) e a majorLandUse, sem o buffer.
+
+    """
+    rootDir = os.path.dirname(os.getcwd())
+    outfolder = rootDir+'/outputs/mapbiomas'
+    gdf = _landUse(gdf,year,prefix,pixelSize,workers,clips)
     #gdf.to_csv(outfolder+'/stationsLandUse.csv') 
     gdf = gdf.drop(columns=['geometry'])         
-    gdf.to_csv(outfolder+'/'+prefix+'stationsLandUse.csv',)
-    gdf = gdf.drop(columns=['buffer']) 
-    gdf.to_csv(outfolder+'/'+prefix+'stationsLandUseNoGeometry.csv') 
-    return gdf
+    return saveLandUse(gdf,outfolder,prefix,csv)
+
+def _landUse(gdf,year,prefix,pixelSize,workers=None,clips='tif'):
+    """
+    Recorta o Mapbiomas nos buffers do gdf e acrescenta as colunas de área por
+    classe e a majorLandUse (corpo do cutMapbiomas, sem gravar a tabela).
+    """
+    rootDir = os.path.dirname(os.getcwd())
+    inputFolder = rootDir+'/inputs'
+    outfolder = rootDir+'/outputs/mapbiomas'
+    os.makedirs(outfolder, exist_ok=True)
+    
+    codes, lookup = legendIndex(inputFolder)
+
+    rasterPath = mapbiomasPath(inputFolder,year)
+    if clips not in ('tif','store',None):
+        raise ValueError("clips deve ser 'tif', 'store' ou None")
+    store = None
+    if clips=='store':
+        with rs.open(rasterPath) as src:
+            store = clipStore.ClipStore(outfolder+'/'+prefix+'mapbiomasClips',
+                                        src.crs,src.nodata)
+    try:
+        results = _runClips(gdf,rasterPath,
+                            outfolder if clips=='tif' else None,workers,store)
+    finally:
+        if store is not None:
+            store.close()
+    counts = countsMatrix(results,lookup,len(codes))
+    gdf = assignLandUse(gdf,counts,codes,pixelSize)
+    return majorLandUse(gdf,inputFolder)
+
+@instrument.timed()
+def cutMapbiomasDelta(gdf,year,prefix,pixelSize,workers=None,csv=False,
+                      clips='tif'):
+    """
+    Versão incremental do cutMapbiomas para quando o inventário muda pouco
+    entre execuções. O inventário é comparado com o da execução anterior
+    (inventoryDelta) pela chave ESTAÇÃO + buffer (coordenadas e raio); só as
+    estações novas ou realocadas são recortadas e as demais reaproveitam as
+    áreas por classe da tabela <prefix>stationsLandUse anterior. Estações
+    desativadas saem da tabela e os seus recortes (GeoTIFFs e entradas do
+    contêiner) são apagados. O resultado é igual ao do cutMapbiomas com o
+    inventário completo.
+
+    Se o ano, o pixelSize, a legenda ou o raster mudaram, ou se não há
+    execução anterior, recalcula todas as estações.
+
+    Parameters
+    ----------
+    gdf : geodataframe
+        Estações com a coluna 'buffer' (stationBuffers ou stationUnionByUF).
+    year : int
+        Ano do Mapbiomas.
+    prefix : str
+        Prefixo da tabela de saída.
+    pixelSize : float
+        Área de cada pixel.
+    workers : int
+        Número de processos para recortar as estações em paralelo.
+    csv : bool
+        Se True, exporta também as tabelas em CSV.
+    clips : str
+        'tif' ou None (ver cutMapbiomas). O contêiner 'store' é regravado a
+        cada execução e não pode ser atualizado só com as estações alteradas.
+
+    Returns
+    -------
+    gdf : geodataframe
+        Tabela de uso do solo, sem o buffer, como no cutMapbiomas.
+
+    """
+    if clips=='store':
+        raise ValueError("clips='store' não é suportado no modo incremental")
+    rootDir = os.path.dirname(os.getcwd())
+    inputFolder = rootDir+'/inputs'
+    outfolder = rootDir+'/outputs/mapbiomas'
+    name = prefix+'stationsLandUse'
+
+    # O estado é marcado pelo mosaico original (a cópia em blocos só é usada
+    # quando corresponde a ele)
+    sourcePath = prepareMapbiomas.sourcePath(inputFolder,year)
+    params = [name,year,pixelSize,
+              geocache.file_hash(inputFolder+'/mapbiomasLegend.csv'),
+              os.path.basename(sourcePath)]+prepareMapbiomas.sourceStamp(sourcePath)
+    inventory = gpd.GeoDataFrame({inventoryDelta.KEY:gdf[inventoryDelta.KEY].to_numpy()},
+                                 geometry=gdf['buffer'].to_numpy(),crs=gdf['buffer'].crs)
+    previous, _ = inventoryDelta.load_state(name,params)
+    if previous is None or not os.path.exists(landUseStore.tablePath(outfolder,name)):
+        out = cutMapbiomas(gdf,year,prefix,pixelSize,workers,csv,clips)
+        inventoryDelta.save_state(name,params,inventory)
+        return out
+
+    codes, _ = legendIndex(inputFolder)
+    cols = [str(dl) for dl in codes]+['majorLandUse']
+    changed, removed = inventoryDelta.diff_inventory(inventory,previous)
+    print('Mapbiomas incremental: '+str(int(changed.sum()))+'/'+str(len(gdf))+
+          ' estações recalculadas')
+
+    # Recortes das estações que saíram da tabela (desativadas e posições
+    # antigas das realocadas, que são recortadas de novo abaixo)
+    kept = set(inventory.loc[~changed,inventoryDelta.KEY].astype(str))
+    _removeClips(outfolder,prefix,
+                 set(previous.loc[removed,inventoryDelta.KEY].astype(str))-kept)
+
+    # Linhas da tabela anterior na ordem do inventário atual (a tabela e o
+    # inventário guardados têm a mesma ordem)
+    oldKeys = inventoryDelta.station_keys(previous)
+    pos = pd.Index(oldKeys).get_indexer(inventoryDelta.station_keys(inventory[~changed]))
+    old = landUseStore.loadTable(outfolder,name,columns=cols)
+    gdf = gdf.copy()
+    for col in cols[:-1]:
+        gdf[col] = np.nan
+    gdf['majorLandUse'] = None
+    gdf.loc[~changed,cols[:-1]] = old[cols[:-1]].to_numpy(dtype=float)[pos]
+    gdf.loc[~changed,'majorLandUse'] = old['majorLandUse'].astype(object).to_numpy()[pos]
+    if changed.any():
+        part = _landUse(gdf[changed].drop(columns=cols),year,prefix,pixelSize,
+                        workers,clips)
+        gdf.loc[changed,cols[:-1]] = part[cols[:-1]].to_numpy(dtype=float)
+        gdf.loc[changed,'majorLandUse'] = part['majorLandUse'].to_numpy(dtype=object)
+    gdf = gdf.drop(columns=['geometry'])
+    out = saveLandUse(gdf,outfolder,prefix,csv)
+    inventoryDelta.save_state(name,params,inventory)
+    return out
 
-def cutMapbiomasSimple(gdf,year,pixelSize):
+def _removeClips(outfolder,prefix,names):
+    """
+    Apaga os recortes das estações em names: os GeoTIFFs mapbiomas_<ESTAÇÃO>.tif
+    e, se existir, as entradas do contêiner <prefix>mapbiomasClips.
+    """
+    for name in names:
+        path = outfolder+'/mapbiomas_'+name.replace('/','')+'.tif'
+        if os.path.exists(path):
+            os.remove(path)
+    storePath = outfolder+'/'+prefix+'mapbiomasClips'
+    if names and os.path.exists(storePath+'.json'):
+        clipStore.removeClips(storePath,names)
+
+@instrument.timed()
+def cutMapbiomasSimple(gdf,year,pixelSize,workers=None,csv=False):
     """
     Esta função é utilizada para cortar o arquivo do Mapbiomas para o domínio 
     de modelagem. Se o domínio for muito grande, ela simplesmente lê o arquivo
@@ -133,23 +966,24 @@ def cutMapbiomasSimple(gdf,year,pixelSize):
 
     Parameters
     ----------
-    domainShp : geodataframe
-        Geodataframe com a geometria do domínio de modelagem.
-    inputFolder : path
-        Caminho para a pasta de inputs.
-    outfolder : path
-        Caminho para a pasta de outputs.
+    gdf : geodataframe
+        Estações com as colunas 'buffer', 'geometry' e 'ESTAÇÃO'
+        (stationBuffers ou stationUnionByUF), em EPSG:4326.
     year : int
-        Ano de referência para a modelagem.
-    GRDNAM : str
-        Nome da grade de modelagem de acordo com o MCIP.
+        Ano do Mapbiomas (brasil_coverage_<year>.tif).
+    pixelSize : float
+        Área de cada pixel (m²).
+    workers : int
+        Número de processos para recortar as estações em paralelo. Se None
+        ou 1, as estações são recortadas no processo atual.
+    csv : bool
+        Se True, exporta também as tabelas em CSV.
 
     Returns
     -------
-    out_meta : rasterio
-        Detalhes do raster.
-    arr : rasterio
-        Array do raster.
+    gdf : geodataframe
+        Estações com a área de cada classe (uma coluna por código da
+        legenda), gravadas também em UFLandUse.
 
     """
     rootDir = os.path.dirname(os.getcwd())
@@ -157,61 +991,41 @@ def cutMapbiomasSimple(gdf,year,pixelSize):
     outfolder = rootDir+'/outputs/mapbiomas'
     os.makedirs(outfolder, exist_ok=True)
     
-    dfLegend = pd.read_csv(inputFolder+'/mapbiomasLegend.csv')
-    
-    for dl in dfLegend['Code ID']:
-        gdf[str(dl)] = np.nan  
-
+    codes, lookup = legendIndex(inputFolder)
 
-    for index, row in gdf.iterrows():
-        # Abrindo o arquivo do MAPBIOMAS
-        with rs.open(inputFolder+'/brasil_coverage_'+str(year)+'.tif') as src:
-    
-            # Tenta abrir e cortar o arquivo. Se for muito grande, não cortará e passará
-            # para o except
-            #  Abrindo raster e cortando
-            try:
-                out_image, out_transform = rasterio.mask.mask(src,[row.buffer],
-                                                              crop=True)
-            except:
-                out_image, out_transform = rasterio.mask.mask(src,[row.geometry],
-                                                              crop=True)
-            # Extraindo propriedades do raster
-            out_meta = src.meta
-            out_meta.update({"driver": "GTiff",
-                         "height": out_image.shape[1],
-                         "width": out_image.shape[2],
-                         "transform": out_transform})
-
-            values, counts = np.unique(out_image.flatten(), return_counts=True)
-            counts = counts*pixelSize
-            for ii,val in enumerate(values):
-                if val!=0:
-                    gdf.loc[index,gdf.columns[gdf.columns==str(val)]] = counts[ii]      
-    gdf.to_csv(outfolder+'/UFLandUse.csv') 
+    results = _runClips(gdf,mapbiomasPath(inputFolder,year),
+                        None,workers)
+    counts = countsMatrix(results,lookup,len(codes))
+    gdf = assignLandUse(gdf,counts,codes,pixelSize)
+    landUseStore.saveTable(gdf,outfolder,'UFLandUse')
+    if csv:
+        landUseStore.exportCSV(outfolder,'UFLandUse')
     return gdf
 
-def statsByUF(gdfUFstations,year):
+@instrument.timed()
+def statsByUF(gdfUFstations,year,pixelSize=30*30,csv=False):
     rootDir = os.path.dirname(os.getcwd())
     inputFolder = rootDir+'/inputs'
     outfolder = rootDir+'/outputs/mapbiomas'
     
     mapbioStats = pd.read_csv(inputFolder+'/mapbiomasStatisticsByUF.csv')
-    dfLegend = pd.read_csv(inputFolder+'/mapbiomasLegend.csv')
-    for dl in dfLegend['Code ID']:
-        gdfUFstations['AREAUF_'+str(dl)] = np.nan  
-    
-    gdfUFstations['AREA_TOTAL']=np.nan
-    
-    for index, row in gdfUFstations.iterrows():
-        gdfUFstations['AREA_TOTAL'][index] = np.sum(mapbioStats[str(year)][mapbioStats.UF==row['ESTAÇÃO']])*pixelSize
-        for dl in dfLegend['Code ID']:
-            gdfUFstations['AREAUF_'+str(dl)][index]= np.sum(
-                mapbioStats[str(year)][(mapbioStats.UF==row['ESTAÇÃO']) & 
-                                       (mapbioStats['class']==dl)])*10000
+    codes, lookup = legendIndex(inputFolder)
+    ufs = gdfUFstations['ESTAÇÃO']
+
+    # Área de cada classe por UF em uma única tabela (UF x classe)
+    classByUF = mapbioStats.pivot_table(index='UF',columns='class',
+                                        values=str(year),aggfunc='sum')
+    classByUF = classByUF.reindex(index=ufs,columns=codes).fillna(0)
+    totalByUF = mapbioStats.groupby('UF')[str(year)].sum().reindex(ufs).fillna(0)
+
+    gdfUFstations[['AREAUF_'+str(dl) for dl in codes]] = \
+        classByUF.to_numpy(dtype=float)*10000
+    gdfUFstations['AREA_TOTAL'] = totalByUF.to_numpy(dtype=float)*pixelSize
     #gdfUFstations = gdf.drop(columns=['geometry']) 
     #gdfUFstations = gdf.drop(columns=['buffer']) 
-    gdfUFstations.to_csv(outfolder+'/UFstationsLandUseStats.csv')        
+    landUseStore.saveTable(gdfUFstations,outfolder,'UFstationsLandUseStats')
+    if csv:
+        landUseStore.exportCSV(outfolder,'UFstationsLandUseStats')
     return gdfUFstations
     
 def majorLandUse(gdf,inputFolder):
@@ -226,21 +1040,13 @@ def majorLandUse(gdf,inputFolder):
     gdf['majorLandUse'] = majorLU
     return gdf
 
-file = 'Monitoramento_QAr_BR_latlon_2024.csv'
-bufferSize = 1000
-year = 2022
-pixelSize = 30*30
-rootDir = os.path.dirname(os.getcwd())
-inputFolder = rootDir+'/inputs'
-
-gdf = stationBuffers(file,bufferSize)
-
-gdf = cutMapbiomas(gdf,year,'',pixelSize)
-
-stationInUF = stationUnionByUF(gdf)
-
-gdfUFstations = cutMapbiomas(stationInUF,year,'UF',pixelSize)
-
-statsByUF(gdfUFstations,year)
-
+if __name__ == '__main__':
+    # A cadeia buffers -> estações -> união por UF -> UF -> estatísticas roda
+    # pelo landUsePipeline, que só recalcula as etapas desatualizadas
+    import landUsePipeline
+    rootDir = os.path.dirname(os.getcwd())
+    landUsePipeline.run('landUsePipeline.json' if os.path.exists('landUsePipeline.json') else None)
 
+    geocache.report()
+    if instrument.ENABLED:
+        instrument.report(rootDir+'/outputs/instrument_stationsLandUse.json')